@@ -8,37 +8,1004 @@ Este script analisa endereços IP e gera um relatório HTML interativo
 com mapa de geolocalização, pop-ups informativos e geração de ofícios
 """
 
-import requests
 import time
+import math
 import re
 import socket
+import ipaddress
 import os
 import sys
 import json
-from datetime import datetime
+import html
+import random
+import argparse
+import threading
+import sqlite3
+import zlib
+import bisect
+import heapq
+import struct
+import contextlib
+import importlib.util
+import statistics
+import subprocess
+import hashlib
+import base64
+import io
+import unicodedata
+import itertools
+from array import array
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
 from urllib.parse import urlparse
 
-def check_ipapi(ip_address):
+# requests, concurrent.futures e http.server são importados só quando usados,
+# para que consultas rápidas (subcomandos lookup e query) iniciem depressa
+requests = None
+REQUIRED_MODULES = ['requests']
+
+def _load_requests():
+    """
+    Importa o requests na primeira consulta de rede
+    """
+    global requests
+    if requests is None:
+        import requests
+    return requests
+
+# Timeouts adaptativos e requisições duplicadas (hedge)
+REQUEST_TIMEOUT = 10
+MIN_REQUEST_TIMEOUT = 2
+TIMEOUT_P99_FACTOR = 3
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+# Fração máxima das requisições que pode ganhar uma cópia (hedge)
+HEDGE_RATIO = 0.05
+
+class LatencyTracker:
+    """
+    Estimativa de latência de um provedor a partir das últimas respostas
+    - timeout(): p99 observado x TIMEOUT_P99_FACTOR, entre MIN_REQUEST_TIMEOUT
+      e REQUEST_TIMEOUT (REQUEST_TIMEOUT enquanto houver poucas amostras)
+    - hedge_delay(): p95 observado; uma requisição mais lenta que isso
+      ganha uma cópia, se o orçamento de hedge permitir
+    Requisições que estouram o timeout entram como amostras no valor do
+    timeout (a latência real é pelo menos essa), de forma que um provedor
+    que ficou mais lento faz o timeout subir em vez de falhar sempre
+    """
+
+    def __init__(self, window=LATENCY_WINDOW, min_samples=LATENCY_MIN_SAMPLES):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def timeout(self):
+        p99 = self.percentile(0.99)
+        if p99 is None:
+            return REQUEST_TIMEOUT
+        return min(REQUEST_TIMEOUT, max(MIN_REQUEST_TIMEOUT, p99 * TIMEOUT_P99_FACTOR))
+
+    def hedge_delay(self):
+        return self.percentile(0.95)
+
+    def allow_hedge(self):
+        with self.lock:
+            if self.hedges + 1 > HEDGE_RATIO * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+latency_trackers = {'ip-api': LatencyTracker(), 'vpnapi': LatencyTracker()}
+
+_request_pool = None
+_request_pool_pid = None
+
+def _get_request_pool():
+    # Criado sob demanda (e recriado em processos filhos)
+    global _request_pool, _request_pool_pid
+    if _request_pool is None or _request_pool_pid != os.getpid():
+        from concurrent.futures import ThreadPoolExecutor
+        _request_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='consulta')
+        _request_pool_pid = os.getpid()
+    return _request_pool
+
+# Requisições HTTP em andamento neste processo (linha de progresso)
+_requests_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+@contextlib.contextmanager
+def in_flight_request():
+    global _requests_in_flight
+    with _in_flight_lock:
+        _requests_in_flight += 1
     try:
-        response = requests.get(f'http://ip-api.com/json/{ip_address}?fields=status,message,country,countryCode,regionName,city,isp,org,as,mobile,proxy,hosting,lat,lon', timeout=10)
+        yield
+    finally:
+        with _in_flight_lock:
+            _requests_in_flight -= 1
+
+def _timed_get_json(url, timeout):
+    started = time.perf_counter()
+    with in_flight_request():
+        response = _load_requests().get(url, timeout=timeout)
         data = response.json()
+    return data, time.perf_counter() - started
+
+# Gravação e reprodução das respostas das APIs (cassete)
+CASSETTE_SECRET_PARAMS = re.compile(r'([?&]key=)[^&]*')
+
+class CassetteMiss(Exception):
+    pass
+
+class Cassette:
+    """
+    Arquivo SQLite com os pares requisição/resposta das APIs
+    - gravação: cada resposta (ou erro) é guardada com a latência observada,
+      o JSON comprimido com zlib e a URL sem a chave da API
+    - reprodução: as respostas voltam na ordem em que foram gravadas para
+      cada URL, sem acessar a rede; com real_time, cada resposta espera a
+      latência original
+    """
+
+    def __init__(self, path, mode, real_time=False):
+        self.path = path
+        self.mode = mode
+        self.real_time = real_time
+        self.positions = Counter()
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        if mode == 'reproduzir' and not os.path.exists(path):
+            raise FileNotFoundError(f"Cassete '{path}' não encontrado")
+
+    def __getstate__(self):
+        return {'path': self.path, 'mode': self.mode, 'real_time': self.real_time}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['mode'], state['real_time'])
+
+    @property
+    def replaying(self):
+        return self.mode == 'reproduzir'
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS interacoes (
+                    id INTEGER PRIMARY KEY,
+                    provedor TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    latencia REAL NOT NULL,
+                    resposta BLOB,
+                    erro TEXT,
+                    gravado_em REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_interacoes_url ON interacoes (provedor, url, id);
+            """)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def request_key(url):
+        return CASSETTE_SECRET_PARAMS.sub(r'\1-', url)
+
+    def record(self, provider, url, elapsed, data=None, error=None):
+        payload = None if error else zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        with self._connection() as conn:
+            conn.execute("INSERT INTO interacoes (provedor, url, latencia, resposta, erro, gravado_em) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (provider, self.request_key(url), elapsed, payload, error, time.time()))
+        lookup_counters['cassete_gravadas'] += 1
+
+    def replay(self, provider, url):
+        """
+        Próxima resposta gravada para a URL (a última se repete quando acabam)
+        Erros gravados são levantados de novo; URLs ausentes levantam CassetteMiss
+        """
+        key = self.request_key(url)
+        with self.lock:
+            position = self.positions[(provider, key)]
+            self.positions[(provider, key)] += 1
+        rows = self._connection().execute(
+            "SELECT latencia, resposta, erro FROM interacoes WHERE provedor = ? AND url = ? ORDER BY id",
+            (provider, key)).fetchall()
+        if not rows:
+            lookup_counters['cassete_ausentes'] += 1
+            raise CassetteMiss(f"requisição não gravada no cassete: {key}")
+        elapsed, payload, error = rows[min(position, len(rows) - 1)]
+        if self.real_time:
+            time.sleep(elapsed)
+        lookup_counters['cassete_reproduzidas'] += 1
+        if error:
+            raise RuntimeError(error)
+        return json.loads(zlib.decompress(payload))
+
+# Cassete ativo (None = requisições normais)
+_cassette = None
+
+def configure_cassette(path=None, mode=None, real_time=False):
+    global _cassette
+    _cassette = Cassette(path, mode, real_time) if path else None
+    return _cassette
+
+def _replaying():
+    return _cassette is not None and _cassette.replaying
+
+def http_get_json(provider, url):
+    """
+    GET com timeout adaptativo e hedge, passando pelo cassete quando ativo
+    """
+    if _replaying():
+        return _cassette.replay(provider, url)
+    if _cassette is None:
+        return _live_get_json(provider, url)
+    started = time.perf_counter()
+    try:
+        data = _live_get_json(provider, url)
+    except Exception as e:
+        _cassette.record(provider, url, time.perf_counter() - started, error=str(e))
+        raise
+    _cassette.record(provider, url, time.perf_counter() - started, data)
+    return data
+
+def _live_get_json(provider, url):
+    """
+    GET com timeout adaptativo e hedge
+    O timeout vem do p99 observado para o provedor. Se a resposta demorar
+    mais que o p95, uma cópia da requisição é enviada (limitada a
+    HEDGE_RATIO das requisições) e vale a primeira resposta que chegar.
+    Retorna o JSON da resposta; erros de rede são propagados.
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+    tracker = latency_trackers[provider]
+    with tracker.lock:
+        tracker.requests += 1
+    pool = _get_request_pool()
+    timeout = tracker.timeout()
+    primary = pool.submit(_timed_get_json, url, timeout)
+    timeouts = {primary: timeout}
+
+    delay = tracker.hedge_delay()
+    if delay is not None:
+        done, _ = wait(timeouts, timeout=delay)
+        if not done and tracker.allow_hedge():
+            lookup_counters[f'hedge:{provider}'] += 1
+            timeout = tracker.timeout()
+            timeouts[pool.submit(_hedged_get_json, provider, url, timeout)] = timeout
+
+    # Vale a primeira resposta bem-sucedida; se todas falharem, propaga o erro da primeira
+    pending = set(timeouts)
+    first_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                data, elapsed = future.result()
+            except Exception as e:
+                if isinstance(e, _load_requests().exceptions.Timeout):
+                    # Amostra censurada no valor do timeout usado
+                    tracker.record(timeouts[future])
+                first_error = first_error or e
+                continue
+            tracker.record(elapsed)
+            if future is not primary:
+                lookup_counters[f'hedge_venceu:{provider}'] += 1
+            return data
+    raise first_error
+
+def _hedged_get_json(provider, url, timeout):
+    """
+    Cópia (hedge) de uma requisição, com o mesmo orçamento de uma consulta
+    normal: o horário no orçamento compartilhado e, na vpnapi.io, uma
+    consulta da cota de uma das chaves
+    """
+    if provider == 'vpnapi':
+        key = vpnapi_key_pool().acquire()
+        if key is None:
+            raise RuntimeError("Cota diária das chaves da vpnapi.io esgotada (hedge não enviado)")
+        url = CASSETTE_SECRET_PARAMS.sub(lambda match: match.group(1) + key, url)
+    if _shared_store is not None:
+        _shared_store.acquire(provider)
+    return _timed_get_json(url, timeout)
+
+def check_ipapi(ip_address):
+    try:
+        data = http_get_json('ip-api', f'http://ip-api.com/json/{ip_address}?fields=status,message,country,countryCode,regionName,city,isp,org,as,mobile,proxy,hosting,lat,lon')
         if data['status'] == 'success':
             return data
         else:
+            # Erros específicos do IP (ex: 'private range', 'invalid query')
             return {"error": data.get('message', 'Erro desconhecido na consulta à ip-api.com')}
     except Exception as e:
-        return {"error": f"Falha na consulta à ip-api.com: {str(e)}"}
+        return {"error": f"Falha na consulta à ip-api.com: {str(e)}", "falha_provedor": True}
+
+# Chaves da vpnapi.io: VPNAPI_KEYS="chave1,chave2:5000" (cota diária opcional após ':')
+# ou um arquivo com uma chave[:cota] por linha (--vpnapi-keys)
+VPNAPI_KEYS_ENV = 'VPNAPI_KEYS'
+VPNAPI_DEFAULT_KEY = '787022fae0c04f6dbb8945bbf824ad96'
+VPNAPI_DAILY_QUOTA = 1000
+KEY_USAGE_FILE = "uso_chaves_vpnapi.sqlite"
+# Avisa quando restar menos que esta fração da cota total do dia
+KEY_QUOTA_WARNING = 0.1
+# Mensagens com que a vpnapi.io recusa a chave (inválida ou sem cota)
+VPNAPI_KEY_REFUSED = re.compile(r'invalid (api )?key|api key (is )?(invalid|missing|required)'
+                                r'|limit (reached|exceeded)|exceeded (your|the) .*limit|quota', re.IGNORECASE)
+
+def parse_api_keys(lines, default_quota=VPNAPI_DAILY_QUOTA):
+    """
+    Lê chaves no formato chave[:cota], separadas por vírgula ou linha
+    Linhas vazias e comentários (#) são ignorados
+    Levanta ValueError para chave vazia ou cota que não seja um inteiro positivo
+    """
+    keys = []
+    for number, line in enumerate(lines, 1):
+        for item in line.split(','):
+            item = item.split('#', 1)[0].strip()
+            if not item:
+                continue
+            key, _, quota = item.partition(':')
+            key, quota = key.strip(), quota.strip()
+            if not key:
+                raise ValueError(f"linha {number}: chave vazia em '{item}'")
+            if not quota:
+                keys.append((key, default_quota))
+                continue
+            if not quota.isdigit() or int(quota) == 0:
+                raise ValueError(f"linha {number}: cota inválida '{quota}' (esperado um número inteiro de consultas por dia)")
+            keys.append((key, int(quota)))
+    return keys
+
+class ApiKeyPool:
+    """
+    Conjunto de chaves de uma API com cota diária por chave
+    O uso de cada chave no dia (UTC) fica em um arquivo SQLite, de forma que
+    os contadores valem entre execuções e entre processos. Cada consulta usa
+    a chave com mais cota restante. As chaves são gravadas apenas como hash.
+    """
+
+    def __init__(self, keys, usage_path=KEY_USAGE_FILE):
+        self.keys = [(key, quota) for key, quota in keys if key]
+        self.ids = {key: hashlib.sha256(key.encode('utf-8')).hexdigest()[:12] for key, _ in self.keys}
+        self.usage_path = usage_path
+        self.warned = False
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {'keys': self.keys, 'ids': self.ids, 'usage_path': self.usage_path, 'warned': self.warned}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.usage_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""CREATE TABLE IF NOT EXISTS uso (
+                chave TEXT NOT NULL, dia TEXT NOT NULL, consultas INTEGER NOT NULL,
+                PRIMARY KEY (chave, dia))""")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+    def _used(self, conn):
+        rows = conn.execute("SELECT chave, consultas FROM uso WHERE dia = ?", (self._today(),)).fetchall()
+        return dict(rows)
+
+    def usage(self):
+        """
+        Lista de (id da chave, usadas hoje, cota) de cada chave
+        """
+        used = self._used(self._connection())
+        return [(self.ids[key], used.get(self.ids[key], 0), quota) for key, quota in self.keys]
+
+    def remaining(self):
+        return sum(max(0, quota - used) for _, used, quota in self.usage())
+
+    def acquire(self):
+        """
+        Reserva uma consulta na chave com mais cota restante hoje
+        Retorna a chave, ou None se todas estiverem esgotadas
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            used = self._used(conn)
+            key, quota = max(self.keys, key=lambda item: item[1] - used.get(self.ids[item[0]], 0))
+            count = used.get(self.ids[key], 0)
+            if count >= quota:
+                conn.execute('ROLLBACK')
+                return None
+            conn.execute("INSERT OR REPLACE INTO uso VALUES (?, ?, ?)", (self.ids[key], self._today(), count + 1))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._warn_if_low()
+        return key
+
+    def exhaust(self, key):
+        """
+        Marca a chave como esgotada hoje (a API recusou a chave)
+        """
+        quota = dict(self.keys)[key]
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO uso VALUES (?, ?, ?)", (self.ids[key], self._today(), quota))
+
+    def _warn_if_low(self):
+        if self.warned:
+            return
+        total = sum(quota for _, quota in self.keys)
+        remaining = self.remaining()
+        if remaining < KEY_QUOTA_WARNING * total:
+            self.warned = True
+            print(f"\n⚠️  Cota da vpnapi.io quase esgotada: restam {remaining} de {total} consultas hoje")
+
+def load_api_keys(path=None):
+    """
+    Chaves da vpnapi.io: arquivo path, variável VPNAPI_KEYS ou a chave padrão
+    """
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            keys = parse_api_keys(f)
+    else:
+        keys = parse_api_keys([os.environ.get(VPNAPI_KEYS_ENV, '')])
+    return keys or [(VPNAPI_DEFAULT_KEY, VPNAPI_DAILY_QUOTA)]
+
+# Conjunto de chaves ativo (criado na primeira consulta, se não configurado)
+_vpnapi_keys = None
+
+def configure_vpnapi_keys(path=None, usage_path=KEY_USAGE_FILE):
+    global _vpnapi_keys
+    _vpnapi_keys = ApiKeyPool(load_api_keys(path), usage_path)
+    return _vpnapi_keys
+
+def vpnapi_key_pool():
+    return _vpnapi_keys or configure_vpnapi_keys()
+
+def _key_refused(message):
+    return VPNAPI_KEY_REFUSED.search(message) is not None
 
 def check_vpnapi(ip_address):
+    pool = vpnapi_key_pool()
+    if not pool.keys:
+        return {"error": "Nenhuma chave da vpnapi.io configurada (sem chaves)", "falha_provedor": True}
     try:
-        response = requests.get(f'https://vpnapi.io/api/{ip_address}?key=787022fae0c04f6dbb8945bbf824ad96', timeout=10)
-        data = response.json()
-        if 'security' in data:
-            return data['security']
-        else:
-            return {"error": data.get('message', 'Erro desconhecido na consulta à vpnapi.io')}
+        for _ in pool.keys:
+            # Na reprodução a chave não importa (não é gravada) e a cota não é gasta
+            key = pool.keys[0][0] if _replaying() else pool.acquire()
+            if key is None:
+                lookup_counters['cota_esgotada:vpnapi'] += 1
+                return {"error": "Cota diária de todas as chaves da vpnapi.io esgotada", "falha_provedor": True}
+            data = http_get_json('vpnapi', f'https://vpnapi.io/api/{ip_address}?key={key}')
+            if 'security' in data:
+                return data['security']
+            # Sem 'security' a vpnapi.io está recusando a chave (cota, limite ou chave inválida)
+            message = data.get('message', 'Erro desconhecido na consulta à vpnapi.io')
+            if not _key_refused(message):
+                break
+            print(f"\n⚠️  vpnapi.io recusou a chave {pool.ids[key]} ({message}) - usando a próxima")
+            # Na reprodução a recusa é da gravação: o uso real das chaves não muda
+            if not _replaying():
+                pool.exhaust(key)
+        return {"error": message, "falha_provedor": True}
     except Exception as e:
-        return {"error": f"Falha na consulta à vpnapi.io: {str(e)}"}
+        return {"error": f"Falha na consulta à vpnapi.io: {str(e)}", "falha_provedor": True}
+
+def estimate_vpnapi_lookups(entries, aggregate_prefixes=None, sample_size=0, reuse=None):
+    """
+    Estimativa de consultas à vpnapi.io de um lote: IPs IPv4 distintos
+    (a vpnapi.io só é consultada para IPv4) fora do cache compartilhado e
+    fora de reuse (entradas reaproveitadas da análise anterior); com
+    agregação, representante e amostra por bloco
+    """
+    reuse = reuse or {}
+
+    def needs_lookup(ip):
+        return _shared_store is None or _shared_store.get('vpnapi', ip) is None
+
+    indices = [index for index, ip_data in enumerate(entries)
+               if ip_data.get('ip_version') == 'IPv4' and index not in reuse]
+    if aggregate_prefixes:
+        blocks = group_entries_by_prefix([entries[index] for index in indices], *aggregate_prefixes)
+        needed = 0
+        for block in blocks.values():
+            ips = {entries[indices[position]]['ip_canonical'] for position in block}
+            needed += min(sum(1 for ip in ips if needs_lookup(ip)), 1 + sample_size)
+        return needed
+    ips = {entries[index]['ip_canonical'] for index in indices}
+    return sum(1 for ip in ips if needs_lookup(ip))
+
+def warn_vpnapi_budget(entries, aggregate_prefixes=None, sample_size=0, reuse=None):
+    """
+    Avisa se o lote deve passar da cota restante das chaves da vpnapi.io
+    Retorna True se couber na cota
+    """
+    needed = estimate_vpnapi_lookups(entries, aggregate_prefixes, sample_size, reuse)
+    pool = vpnapi_key_pool()
+    remaining = pool.remaining()
+    print(f"Cota da vpnapi.io: {remaining} consultas restantes hoje em {len(pool.keys)} chave(s); "
+          f"o lote deve usar até {needed}.")
+    if needed > remaining:
+        print(f"⚠️  O lote passa da cota em {needed - remaining} consultas: depois disso a detecção de "
+              f"VPN fica 'Indeterminado'. Acrescente chaves em {VPNAPI_KEYS_ENV} ou --vpnapi-keys.")
+        return False
+    return True
+
+LOOKUP_INTERVAL = 1.5
+
+SHARED_STORE_FILE = "cache_consultas.sqlite"
+SHARED_CACHE_TTL = 7 * 24 * 3600
+
+class SharedLookupStore:
+    """
+    Cache de consultas e orçamento de requisições compartilhados entre
+    processos por meio de um arquivo SQLite local
+    - Respostas bem-sucedidas das APIs ficam em cache por ttl segundos
+    - Cada provedor tem um horário da próxima consulta permitida; cada
+      processo reserva o seu horário antes de consultar, de forma que
+      vários processos juntos respeitam o mesmo intervalo entre consultas
+    """
+
+    def __init__(self, path=SHARED_STORE_FILE, ttl=SHARED_CACHE_TTL, interval=LOOKUP_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.interval = interval
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS consultas (
+                provedor TEXT NOT NULL, ip TEXT NOT NULL, resposta TEXT NOT NULL,
+                consultado_em REAL NOT NULL, PRIMARY KEY (provedor, ip))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS orcamento (
+                provedor TEXT PRIMARY KEY, proxima_consulta REAL NOT NULL)""")
+
+    def __getstate__(self):
+        return {'path': self.path, 'ttl': self.ttl, 'interval': self.interval}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _connection(self):
+        # Uma conexão por thread e por processo
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, provider, ip_address):
+        row = self._connection().execute(
+            "SELECT resposta FROM consultas WHERE provedor = ? AND ip = ? AND consultado_em >= ?",
+            (provider, ip_address, time.time() - self.ttl)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, provider, ip_address, data):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO consultas VALUES (?, ?, ?, ?)",
+                         (provider, ip_address, json.dumps(data, ensure_ascii=False), time.time()))
+
+    def acquire(self, provider):
+        """
+        Reserva o próximo horário livre do provedor e espera até ele chegar
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT proxima_consulta FROM orcamento WHERE provedor = ?", (provider,)).fetchone()
+            now = time.time()
+            slot = max(now, row[0]) if row else now
+            conn.execute("INSERT OR REPLACE INTO orcamento VALUES (?, ?)", (provider, slot + self.interval))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if slot > now:
+            time.sleep(slot - now)
+
+# Armazenamento compartilhado ativo (None = consultas diretas, sem cache)
+_shared_store = None
+
+def configure_shared_store(path):
+    global _shared_store
+    _shared_store = SharedLookupStore(path) if path else None
+    return _shared_store
+
+# Contadores das consultas deste processo (rede, cache, erros por provedor...)
+lookup_counters = Counter()
+
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 60
+CIRCUIT_PROBE_IP = '8.8.8.8'
+
+class CircuitBreaker:
+    """
+    Disjuntor de um provedor
+    - fechado: consultas normais; após failure_threshold falhas seguidas, abre
+    - aberto: consultas falham na hora, sem esperar o timeout da API
+    - meio-aberto: passados reset_timeout segundos, uma sonda em segundo
+      plano testa o provedor; se responder, o disjuntor fecha, senão
+      continua aberto por mais reset_timeout segundos
+    """
+
+    def __init__(self, name, probe, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'fechado'
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'fechado':
+                return True
+            if self.state == 'aberto' and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = 'meio-aberto'
+                threading.Thread(target=self._run_probe, daemon=True).start()
+            return False
+
+    def _run_probe(self):
+        data = self.probe()
+        if "error" in data and data.get('falha_provedor'):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_success(self):
+        with self.lock:
+            if self.state != 'fechado':
+                print(f"\n✅ {self.name} voltou a responder - consultas retomadas")
+            self.state = 'fechado'
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'meio-aberto' or (self.state == 'fechado' and self.failures >= self.failure_threshold):
+                if self.state == 'fechado':
+                    print(f"\n⚠️  {self.name} falhou {self.failures} vezes seguidas - consultas suspensas por {self.reset_timeout}s")
+                self.state = 'aberto'
+                self.opened_at = time.time()
+
+circuit_breakers = {
+    'ip-api': CircuitBreaker('ip-api.com', lambda: check_ipapi(CIRCUIT_PROBE_IP)),
+    'vpnapi': CircuitBreaker('vpnapi.io', lambda: check_vpnapi(CIRCUIT_PROBE_IP)),
+}
+
+# Cache negativo: erros específicos de um IP não são consultados de novo por algum tempo
+NEGATIVE_CACHE_TTL = 600
+_negative_cache = {}
+
+def cached_check(provider, check, ip_address):
+    """
+    Executa a consulta check(ip) passando pelo cache negativo, pelo
+    disjuntor do provedor e pelo cache e orçamento compartilhados, quando
+    configurados
+    """
+    negative = _negative_cache.get((provider, ip_address))
+    if negative and negative[0] > time.time():
+        lookup_counters['cache_negativo'] += 1
+        return negative[1]
+
+    if _shared_store is not None:
+        cached = _shared_store.get(provider, ip_address)
+        if cached is not None:
+            lookup_counters['cache'] += 1
+            return cached
+
+    breaker = circuit_breakers.get(provider)
+    if breaker and not breaker.allow():
+        lookup_counters[f'circuito_aberto:{provider}'] += 1
+        return {"error": f"Consulta suspensa: {breaker.name} com falhas repetidas (circuito aberto)"}
+
+    if _shared_store is not None and not _replaying():
+        _shared_store.acquire(provider)
+    lookup_counters['rede'] += 1
+    data = check(ip_address)
+
+    if "error" not in data:
+        if breaker:
+            breaker.record_success()
+        if _shared_store is not None:
+            _shared_store.put(provider, ip_address, data)
+    elif data.get('falha_provedor'):
+        lookup_counters[f'erro:{provider}'] += 1
+        if breaker:
+            breaker.record_failure()
+    else:
+        # O provedor respondeu, mas recusou este IP
+        lookup_counters[f'erro:{provider}'] += 1
+        if breaker:
+            breaker.record_success()
+        _negative_cache[(provider, ip_address)] = (time.time() + NEGATIVE_CACHE_TTL, data)
+    return data
+
+def _pause_after_network(calls_before):
+    """
+    Espera o intervalo entre consultas, mas só se houve acesso à rede
+    Respostas do cache, do cache negativo ou do disjuntor aberto não esperam
+    Com armazenamento compartilhado, o orçamento por provedor controla o ritmo
+    """
+    if _shared_store is None and lookup_counters['rede'] > calls_before and not _replaying():
+        time.sleep(LOOKUP_INTERVAL)
+
+# Enriquecimento: PTR (DNS reverso) e titular/abuse do bloco via RDAP
+RDAP_BASE_URL = "https://rdap.org"
+RDAP_INTERVAL = 1.0
+ENRICH_WORKERS = 4
+PTR_TIMEOUT = 5
+
+def _read_dns_name(message, offset):
+    """
+    Lê um nome DNS (com ponteiros de compressão) a partir de offset
+    Retorna (nome, offset logo após o nome no ponto de partida)
+    """
+    labels = []
+    end = None
+    for _ in range(128):
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+        elif length == 0:
+            return '.'.join(labels), end if end is not None else offset + 1
+        else:
+            labels.append(message[offset + 1:offset + 1 + length].decode('ascii', 'replace'))
+            offset += 1 + length
+    raise ValueError("Nome DNS malformado")
+
+def query_ptr(ip_address, dns_server=None, timeout=PTR_TIMEOUT):
+    """
+    Resolve o registro PTR de um IP
+    Sem dns_server usa o resolvedor do sistema; com dns_server (host, porta)
+    envia a consulta diretamente a esse servidor por UDP.
+    Retorna o nome ou None se não houver registro.
+    """
+    if not dns_server:
+        try:
+            return socket.gethostbyaddr(ip_address)[0]
+        except (socket.herror, socket.gaierror, OSError):
+            return None
+
+    query_id = random.randint(0, 0xFFFF)
+    name = ipaddress.ip_address(ip_address).reverse_pointer
+    question = b''.join(bytes([len(label)]) + label.encode('ascii') for label in name.split('.'))
+    packet = struct.pack('>HHHHHH', query_id, 0x0100, 1, 0, 0, 0) + question + b'\0' + struct.pack('>HH', 12, 1)
+
+    family, _, _, _, address = socket.getaddrinfo(dns_server[0], dns_server[1], type=socket.SOCK_DGRAM)[0]
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(packet, address)
+        response, _ = sock.recvfrom(4096)
+
+    response_id, flags, questions, answers = struct.unpack('>HHHH', response[:8])
+    if response_id != query_id or flags & 0x000F:
+        return None
+    offset = 12
+    for _ in range(questions):
+        offset = _read_dns_name(response, offset)[1] + 4
+    for _ in range(answers):
+        offset = _read_dns_name(response, offset)[1]
+        record_type, _, _, length = struct.unpack('>HHIH', response[offset:offset + 10])
+        offset += 10
+        if record_type == 12:
+            return _read_dns_name(response, offset)[0]
+        offset += length
+    return None
+
+def _rdap_entities(entities):
+    for entity in entities or []:
+        yield entity
+        yield from _rdap_entities(entity.get('entities'))
+
+def _vcard_value(entity, field):
+    vcard = entity.get('vcardArray') or [None, []]
+    for item in vcard[1] if len(vcard) > 1 else []:
+        if len(item) > 3 and item[0] == field and isinstance(item[3], str):
+            return item[3]
+    return None
+
+def parse_rdap_network(data):
+    """
+    Extrai de uma resposta RDAP de rede (/ip) o bloco, o nome da rede,
+    o titular (registrant) e o contato de abuse
+    Retorna (início, fim, campos) com início e fim como inteiros, ou
+    (None, None, campos) se a resposta não informar o bloco
+    """
+    fields = {}
+    cidrs = []
+    for cidr in data.get('cidr0_cidrs') or []:
+        prefix = cidr.get('v4prefix') or cidr.get('v6prefix')
+        if prefix and cidr.get('length') is not None:
+            cidrs.append(f"{prefix}/{cidr['length']}")
+    start = end = None
+    try:
+        if data.get('startAddress') and data.get('endAddress'):
+            start = int(ipaddress.ip_address(data['startAddress']))
+            end = int(ipaddress.ip_address(data['endAddress']))
+            fields['rdap_bloco'] = ', '.join(cidrs) or f"{data['startAddress']} - {data['endAddress']}"
+        elif cidrs:
+            network = ipaddress.ip_network(cidrs[0], strict=False)
+            start, end = int(network.network_address), int(network.broadcast_address)
+            fields['rdap_bloco'] = ', '.join(cidrs)
+    except ValueError:
+        start = end = None
+    if data.get('name'):
+        fields['rdap_rede'] = data['name']
+
+    for entity in _rdap_entities(data.get('entities')):
+        roles = entity.get('roles') or []
+        if 'registrant' in roles and 'rdap_entidade' not in fields:
+            name = _vcard_value(entity, 'fn')
+            if name:
+                fields['rdap_entidade'] = name
+        if 'abuse' in roles and 'rdap_abuse' not in fields:
+            email = _vcard_value(entity, 'email')
+            if email:
+                fields['rdap_abuse'] = email
+    return start, end, fields
+
+class NetblockCache:
+    """
+    Respostas RDAP em cache por bloco de rede
+    Os blocos ficam ordenados pelo endereço inicial; a busca de um IP é uma
+    busca binária, então uma consulta RDAP serve todos os IPs do bloco
+    """
+
+    def __init__(self):
+        self.starts = {'IPv4': [], 'IPv6': []}
+        self.blocks = {'IPv4': [], 'IPv6': []}
+        self.lock = threading.Lock()
+
+    def find(self, version, ip_int):
+        with self.lock:
+            position = bisect.bisect_right(self.starts[version], ip_int) - 1
+            if position >= 0:
+                end, fields = self.blocks[version][position]
+                if ip_int <= end:
+                    return fields
+        return None
+
+    def add(self, version, start, end, fields):
+        with self.lock:
+            position = bisect.bisect_left(self.starts[version], start)
+            if position < len(self.starts[version]) and self.starts[version][position] == start:
+                self.blocks[version][position] = (end, fields)
+            else:
+                self.starts[version].insert(position, start)
+                self.blocks[version].insert(position, (end, fields))
+
+class Enricher:
+    """
+    Etapa opcional de enriquecimento com pool de threads próprio
+    Para cada IP resolve o PTR e consulta o RDAP do bloco (titular e
+    contato de abuse). O RDAP fica em cache por bloco de rede; as consultas
+    RDAP são feitas uma de cada vez (respeitando rdap_interval) e o cache é
+    conferido de novo antes de cada uma, então cada bloco é consultado uma
+    única vez. Os PTR são resolvidos em paralelo.
+    As consultas rodam em segundo plano enquanto as APIs são consultadas;
+    prefetch() adianta o lote inteiro.
+    """
+
+    def __init__(self, rdap_url=RDAP_BASE_URL, dns_server=None, workers=ENRICH_WORKERS, rdap_interval=RDAP_INTERVAL,
+                 ptr_timeout=PTR_TIMEOUT, rdap_timeout=REQUEST_TIMEOUT):
+        self.config = (rdap_url, dns_server, workers, rdap_interval, ptr_timeout, rdap_timeout)
+        self.rdap_url = rdap_url.rstrip('/')
+        self.dns_server = dns_server
+        self.workers = workers
+        self.rdap_interval = rdap_interval
+        self.ptr_timeout = ptr_timeout
+        self.rdap_timeout = rdap_timeout
+        self.netblocks = NetblockCache()
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.rdap_lock = threading.Lock()
+        self.last_rdap = 0.0
+        self.pool = None
+
+    def submit(self, ip_address, ip_version, ip_int=None):
+        """
+        Agenda (uma única vez por IP) o enriquecimento e retorna o Future
+        com os campos a acrescentar ao resultado
+        """
+        with self.lock:
+            future = self.futures.get(ip_address)
+            if future is None:
+                if self.pool is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='enriquecimento')
+                if ip_int is None:
+                    ip_int = int(ipaddress.ip_address(ip_address))
+                future = self.pool.submit(self._enrich, ip_address, ip_version, ip_int)
+                self.futures[ip_address] = future
+        return future
+
+    def prefetch(self, entries):
+        for ip_data in entries:
+            if ip_data.get('ip_version'):
+                self.submit(ip_data['ip_canonical'], ip_data['ip_version'], ip_data['ip_int'])
+
+    def _enrich(self, ip_address, ip_version, ip_int):
+        fields = {}
+        try:
+            ptr = query_ptr(ip_address, self.dns_server, self.ptr_timeout)
+            lookup_counters['ptr'] += 1
+            if ptr:
+                fields['ptr'] = ptr
+        except (OSError, ValueError, struct.error) as e:
+            lookup_counters['erro:ptr'] += 1
+            fields['erro_ptr'] = f"Falha na resolução reversa: {e}"
+        try:
+            fields.update(self.rdap(ip_address, ip_version, ip_int))
+        except Exception as e:
+            lookup_counters['erro:rdap'] += 1
+            fields['erro_rdap'] = f"Falha na consulta RDAP: {e}"
+        return fields
+
+    def rdap(self, ip_address, ip_version, ip_int):
+        cached = self.netblocks.find(ip_version, ip_int)
+        if cached is not None:
+            lookup_counters['rdap_cache'] += 1
+            return cached
+
+        with self.rdap_lock:
+            cached = self.netblocks.find(ip_version, ip_int)
+            if cached is not None:
+                lookup_counters['rdap_cache'] += 1
+                return cached
+
+            time.sleep(max(0.0, self.last_rdap + self.rdap_interval - time.time()))
+            self.last_rdap = time.time()
+            with in_flight_request():
+                response = _load_requests().get(f"{self.rdap_url}/ip/{ip_address}", timeout=self.rdap_timeout,
+                                                headers={'Accept': 'application/rdap+json'})
+            lookup_counters['rdap'] += 1
+            if response.status_code == 404:
+                return {}
+            response.raise_for_status()
+            start, end, fields = parse_rdap_network(response.json())
+            if start is not None and start <= ip_int <= end:
+                self.netblocks.add(ip_version, start, end, fields)
+            return fields
+
+_enricher = None
+
+def configure_enrichment(rdap_url=RDAP_BASE_URL, dns_server=None, workers=ENRICH_WORKERS, rdap_interval=RDAP_INTERVAL,
+                         ptr_timeout=PTR_TIMEOUT, rdap_timeout=REQUEST_TIMEOUT):
+    """
+    Ativa o enriquecimento (PTR e RDAP) neste processo
+    """
+    global _enricher
+    _enricher = Enricher(rdap_url, dns_server, workers, rdap_interval, ptr_timeout, rdap_timeout)
+    return _enricher
 
 def is_valid_ipv4(ip):
     if not ip or not isinstance(ip, str):
@@ -77,6 +1044,284 @@ def get_ip_version(ip):
     else:
         return None
 
+def _normalize_ip_text(ip):
+    """
+    Converte um IP textual em (inteiro, versão, forma canônica)
+    Retorna None se o IP for inválido
+    """
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        # ipaddress rejeita octetos com zeros à esquerda (ex: 189.040.012.001),
+        # comuns em logs de provedores e aceitos por is_valid_ipv4
+        if not is_valid_ipv4(ip):
+            return None
+        addr = ipaddress.IPv4Address('.'.join(str(int(octet)) for octet in ip.split('.')))
+    return int(addr), f'IPv{addr.version}', str(addr)
+
+def validate_ips_bulk(candidates):
+    """
+    Valida uma coluna inteira de IPs candidatos em uma única passada
+    Retorna colunas paralelas à entrada:
+    - packed: endereço como inteiro (None se inválido)
+    - version: 'IPv4', 'IPv6' ou None
+    - canonical: forma textual canônica (None se inválido)
+    Valores repetidos, comuns em logs, são validados apenas uma vez
+    """
+    packed = []
+    versions = []
+    canonical = []
+    seen = {}
+
+    for candidate in candidates:
+        key = candidate.strip() if isinstance(candidate, str) else ''
+        if key not in seen:
+            seen[key] = _normalize_ip_text(key) if key else None
+        normalized = seen[key]
+        if normalized:
+            packed.append(normalized[0])
+            versions.append(normalized[1])
+            canonical.append(normalized[2])
+        else:
+            packed.append(None)
+            versions.append(None)
+            canonical.append(None)
+
+    return {'packed': packed, 'version': versions, 'canonical': canonical}
+
+# Datas e horários das entradas
+DATE_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})')
+TIME_PATTERN = re.compile(r'(\d{1,2}):(\d{2})(?::(\d{2}))?')
+UTC_PATTERN = re.compile(r'\(?UTC\s*([+-]?)(\d{1,2})(?::?(\d{2}))?\)?', re.IGNORECASE)
+# Deslocamento assumido (em horas) quando a entrada não informa o UTC; as
+# entradas nessa situação recebem utc_presumido com o fuso usado
+DEFAULT_UTC_OFFSET = 0
+DEFAULT_UTC_LABEL = f"UTC{DEFAULT_UTC_OFFSET:+d}"
+
+def detect_date_order(dates, default='DMY'):
+    """
+    Descobre, uma única vez para um conjunto de datas, se elas estão em
+    DD/MM/AAAA ('DMY') ou MM/DD/AAAA ('MDY')
+    A primeira data com um campo maior que 12 decide; se todas forem
+    ambíguas, vale o padrão
+    """
+    for date in dates:
+        match = DATE_PATTERN.fullmatch((date or '').strip())
+        if not match:
+            continue
+        first, second = int(match.group(1)), int(match.group(2))
+        if first > 12 >= second:
+            return 'DMY'
+        if second > 12 >= first:
+            return 'MDY'
+    return default
+
+def _utc_offset_minutes(utc):
+    match = UTC_PATTERN.fullmatch((utc or '').strip())
+    if not match:
+        return None
+    minutes = int(match.group(2)) * 60 + int(match.group(3) or 0)
+    return -minutes if match.group(1) == '-' else minutes
+
+def normalize_entry_time(ip_data, date_order='DMY'):
+    """
+    Normaliza data, hora e UTC de uma entrada
+    - data: reescrita como DD/MM/AAAA; a original fica em data_original
+      quando dia e mês são invertidos
+    - timestamp: instante em segundos desde a época, em UTC (None sem data e hora)
+    - data_hora_utc: o mesmo instante em ISO 8601
+    - utc_presumido: o fuso assumido (DEFAULT_UTC_LABEL) quando a entrada
+      não informa um UTC reconhecível
+    A ordem dia/mês vem dos próprios valores quando não é ambígua; caso
+    contrário vale date_order, detectada uma vez para toda a entrada
+    (detect_date_order)
+    """
+    ip_data['timestamp'] = None
+    ip_data['data_hora_utc'] = None
+    raw_date = ip_data.get('data')
+    date_match = DATE_PATTERN.fullmatch((raw_date or '').strip())
+    if not date_match:
+        return ip_data
+
+    first, second, year = (int(value) for value in date_match.groups())
+    if first > 12:
+        order = 'DMY'
+    elif second > 12:
+        order = 'MDY'
+    else:
+        order = date_order
+    day, month = (first, second) if order == 'DMY' else (second, first)
+    canonical = f"{day:02d}/{month:02d}/{year}"
+    if canonical != raw_date:
+        if (day, month) != (first, second):
+            ip_data['data_original'] = raw_date
+        ip_data['data'] = canonical
+
+    time_match = TIME_PATTERN.fullmatch((ip_data.get('hora') or '').strip())
+    if not time_match:
+        return ip_data
+    hour, minute, second_value = int(time_match.group(1)), int(time_match.group(2)), int(time_match.group(3) or 0)
+    offset = _utc_offset_minutes(ip_data.get('utc'))
+    try:
+        local = datetime(year, month, day, hour, minute, second_value,
+                         tzinfo=timezone(timedelta(minutes=DEFAULT_UTC_OFFSET * 60 if offset is None else offset)))
+    except ValueError:
+        return ip_data
+    if offset is None:
+        ip_data['utc_presumido'] = DEFAULT_UTC_LABEL
+    ip_data['timestamp'] = int(local.timestamp())
+    ip_data['data_hora_utc'] = local.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return ip_data
+
+class TimeIndex:
+    """
+    Índice temporal ordenado de uma lista de entradas ou resultados
+    Guarda os pares (timestamp, posição na lista) em ordem; consultas por
+    janela de tempo são buscas binárias. Exemplos:
+    - IPs do provedor X entre T1 e T2:
+      [results[i] for i in index.window(t1, t2) if results[i]['provedor'] == 'X']
+    - Sessões por hora: index.histogram(3600)
+    """
+
+    def __init__(self, records):
+        pairs = sorted((record['timestamp'], position) for position, record in enumerate(records)
+                       if record.get('timestamp') is not None)
+        self.timestamps = [timestamp for timestamp, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _bounds(self, start=None, end=None):
+        low = bisect.bisect_left(self.timestamps, start) if start is not None else 0
+        high = bisect.bisect_right(self.timestamps, end) if end is not None else len(self.timestamps)
+        return low, high
+
+    def window(self, start=None, end=None):
+        """
+        Posições das entradas com start <= timestamp <= end, em ordem cronológica
+        """
+        low, high = self._bounds(start, end)
+        return self.positions[low:high]
+
+    def histogram(self, bucket=3600, start=None, end=None):
+        """
+        Contagem de entradas por intervalo de bucket segundos (ex: por hora)
+        Retorna {início do intervalo: contagem} em ordem cronológica
+        """
+        low, high = self._bounds(start, end)
+        counts = {}
+        for timestamp in self.timestamps[low:high]:
+            slot = timestamp - timestamp % bucket
+            counts[slot] = counts.get(slot, 0) + 1
+        return counts
+
+    def to_dict(self):
+        return {'ts': self.timestamps, 'pos': self.positions}
+
+# Intervalo máximo (segundos) entre registros consecutivos de uma mesma sessão
+SESSION_GAP = 300
+
+def _session_runs(results, gap_seconds):
+    """
+    Ordena as chaves (IP, porta, horário) em uma passada pelos resultados e
+    gera (posição, ip, porta, timestamp, nova sessão?) na ordem das sessões
+    Só as chaves de ordenação ficam em memória, não os resultados.
+    """
+    keyed = []
+    for position, result in enumerate(results):
+        if result.get('ip_version'):
+            timestamp = result.get('timestamp')
+            keyed.append((result.get('ip') or '', result.get('porta') or '', timestamp is None, timestamp or 0, position))
+    keyed.sort()
+
+    previous = None
+    for ip, port, untimed, timestamp, position in keyed:
+        timestamp = None if untimed else timestamp
+        new_session = not (
+            previous is not None
+            and previous[0] == ip
+            and previous[1] == port
+            and (timestamp is None) == (previous[2] is None)
+            and (timestamp is None or timestamp - previous[2] <= gap_seconds)
+        )
+        previous = (ip, port, timestamp)
+        yield position, ip, port, timestamp, new_session
+
+def number_sessions(results, gap_seconds=SESSION_GAP):
+    """
+    Grava o número da sessão de cada resultado em 'sessao', sem montar a
+    lista de sessões (usado nos lotes grandes)
+    Retorna (quantidade de sessões, resultados agrupados)
+    """
+    session_of = array('l', [-1]) * len(results)
+    sessions = -1
+    grouped = 0
+    for position, _, _, _, new_session in _session_runs(results, gap_seconds):
+        sessions += new_session
+        grouped += 1
+        session_of[position] = sessions
+    set_result_field(results, 'sessao', session_of)
+    return sessions + 1, grouped
+
+def correlate_sessions(results, gap_seconds=SESSION_GAP):
+    """
+    Agrupa os resultados em sessões: mesmo IP e porta, com no máximo
+    gap_seconds entre registros consecutivos
+    Os resultados são ordenados uma única vez e percorridos em uma só
+    passada. Cada resultado recebe o número da sua sessão em 'sessao'.
+    Retorna a lista de sessões, com primeiro/último registro e contagem
+    """
+    sessions = []
+    session_of = array('l', [-1]) * len(results)
+    ends = {}
+    current = None
+    first = last = None
+    for position, ip, port, timestamp, new_session in _session_runs(results, gap_seconds):
+        if new_session:
+            if current is not None:
+                ends.setdefault(first, []).append((current, 'inicio'))
+                ends.setdefault(last, []).append((current, 'fim'))
+            current = {
+                'sessao': len(sessions),
+                'ip': ip,
+                'porta': port,
+                'provedor': None,
+                'primeiro': timestamp,
+                'ultimo': timestamp,
+                'contagem': 1
+            }
+            sessions.append(current)
+            first = last = position
+        else:
+            current['ultimo'] = timestamp
+            current['contagem'] += 1
+            last = position
+        session_of[position] = current['sessao']
+    if current is not None:
+        ends.setdefault(first, []).append((current, 'inicio'))
+        ends.setdefault(last, []).append((current, 'fim'))
+
+    # Provedor, início e fim de cada sessão em uma passada só
+    for position, result in enumerate(results):
+        for session, end in ends.get(position, ()):
+            if end == 'inicio':
+                session['provedor'] = result.get('provedor')
+            session[end] = {field: result.get(field) for field in ('data', 'hora', 'utc', 'data_hora_utc')}
+    set_result_field(results, 'sessao', session_of)
+    return sessions
+
+def set_result_field(results, field, values, missing=-1):
+    """
+    Grava values[posição] no campo de cada resultado (exceto os valores missing)
+    """
+    if isinstance(results, ResultSpill):
+        results.set_field(field, values, missing)
+        return
+    for result, value in zip(results, values):
+        if value != missing:
+            result[field] = value
+
 def parse_ip_entry(entry):
     """
     Analisa entrada que pode conter IP, porta, data e hora
@@ -101,17 +1346,15 @@ def parse_ip_entry(entry):
     match1 = re.match(pattern1, entry)
     if match1:
         ip, porta, data, hora, utc = match1.groups()
-        return {'ip': ip, 'porta': porta, 'data': data, 'hora': hora, 'utc': utc}
+        return normalize_entry_time({'ip': ip, 'porta': porta, 'data': data, 'hora': hora, 'utc': utc})
     
     # Padrão 2: IP:porta MM/DD/AAAA HH:MM (UTC-X)
     pattern2 = r'(\d+\.\d+\.\d+\.\d+):(\d+)\s+(\d{2}/\d{2}/\d{4})\s+(\d{2}:\d{2})\s+\((UTC[+-]?\d+)\)'
     match2 = re.match(pattern2, entry)
     if match2:
         ip, porta, data_us, hora, utc = match2.groups()
-        # Converter data americana (MM/DD/AAAA) para brasileira (DD/MM/AAAA)
-        month, day, year = data_us.split('/')
-        data = f"{day}/{month}/{year}"
-        return {'ip': ip, 'porta': porta, 'data': data, 'hora': hora, 'utc': utc}
+        # Data americana (MM/DD/AAAA): só é invertida se não for inequivocamente DD/MM
+        return normalize_entry_time({'ip': ip, 'porta': porta, 'data': data_us, 'hora': hora, 'utc': utc}, 'MDY')
     
     # Padrão 3: IP:porta (formato básico)
     pattern3 = r'(\d+\.\d+\.\d+\.\d+):(\d+)'
@@ -163,21 +1406,27 @@ def parse_ip_entry(entry):
             utc = part
             continue
     
-    return {
+    return normalize_entry_time({
         'ip': ip or '',
         'porta': porta,
         'data': data,
         'hora': hora,
         'utc': utc
-    }
+    })
 
 def analyze_ip(ip_data):
     ip_address = ip_data['ip']
-    ip_version = get_ip_version(ip_address)
+    # Entradas preparadas em lote já trazem a validação pronta
+    if 'ip_version' in ip_data:
+        ip_version = ip_data['ip_version']
+    else:
+        ip_version = get_ip_version(ip_address)
     
     if not ip_version:
         return {"error": "IP inválido. Forneça um endereço IP válido (IPv4 ou IPv6)."}
 
+    lookup_ip = ip_data.get('ip_canonical') or ip_address
+
     results = {
         "ip_version": ip_version,
         "ip": ip_address,
@@ -185,17 +1434,27 @@ def analyze_ip(ip_data):
         "data": ip_data.get('data', ''),
         "hora": ip_data.get('hora', ''),
         "utc": ip_data.get('utc', ''),
+        "timestamp": ip_data.get('timestamp'),
+        "data_hora_utc": ip_data.get('data_hora_utc'),
         "latitude": None,
-        "longitude": None
+        "longitude": None,
+        "analisado_em": datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
     }
+    if ip_data.get('data_original'):
+        results["data_original"] = ip_data['data_original']
+    if ip_data.get('utc_presumido'):
+        results["utc_presumido"] = ip_data['utc_presumido']
+    if ip_data.get('tag'):
+        results["tag"] = ip_data['tag']
     
     if ip_version == 'IPv6':
         results["aviso"] = "Análise de IPv6 pode ter funcionalidade limitada em algumas APIs."
 
-    print(f"Consultando APIs para {ip_address}...")
+    # Enriquecimento (PTR/RDAP) em paralelo com as consultas às APIs
+    enrichment = _enricher.submit(lookup_ip, ip_version, ip_data.get('ip_int')) if _enricher else None
 
     # Consulta ip-api.com
-    ipapi_data = check_ipapi(ip_address)
+    ipapi_data = cached_check('ip-api', check_ipapi, lookup_ip)
     if "error" not in ipapi_data:
         results["país"] = ipapi_data.get('country', 'Desconhecido')
         results["código_país"] = ipapi_data.get('countryCode', 'XX')
@@ -224,7 +1483,7 @@ def analyze_ip(ip_data):
 
     # Consulta vpnapi.io
     if ip_version == 'IPv4':
-        vpnapi_data = check_vpnapi(ip_address)
+        vpnapi_data = cached_check('vpnapi', check_vpnapi, lookup_ip)
         if "error" not in vpnapi_data:
             results["vpn"] = "Sim" if vpnapi_data.get('vpn', False) else "Não"
             results["proxy"] = "Sim" if vpnapi_data.get('proxy', False) else "Não"
@@ -271,896 +1530,2787 @@ def analyze_ip(ip_data):
         results["uso_vpn_proxy"] = "Não detectado"
         results["status_vpn"] = "Não detectado"
 
-    return results
-
-def check_batch_ips(ip_entries):
-    results = []
-    total = len(ip_entries)
-
-    for i, entry in enumerate(ip_entries):
-        print(f"\nAnalisando entrada {i+1} de {total}: {entry}")
-        
-        # PARSER DIRETO AQUI - sem chamar função externa
-        entry = entry.strip()
-        ip_data = {
-            'ip': '',
-            'porta': None,
-            'data': None,
-            'hora': None,
-            'utc': None
-        }
-        
-        # IP
-        import re
-        ip_match = re.search(r'(\d+\.\d+\.\d+\.\d+)', entry)
-        if ip_match:
-            ip_data['ip'] = ip_match.group(1)
-        
-        # Porta (apenas se houver : imediatamente após o IP)
-        if ':' in entry:
-            porta_match = re.search(r'(\d+\.\d+\.\d+\.\d+):(\d+)', entry)
-            if porta_match:
-                ip_data['porta'] = porta_match.group(2)
-        
-        # Data
-        date_match = re.search(r'(\d{2}/\d{2}/\d{4})', entry)
-        if date_match:
-            ip_data['data'] = date_match.group(1)
-        
-        # Hora (HH:MM ou HH:MM:SS) - só após espaço ou vírgula
-        time_match = re.search(r'[\s,](\d{1,2}:\d{2}(?::\d{2})?)', entry)
-        if time_match:
-            ip_data['hora'] = time_match.group(1)
-        
-        # UTC
-        utc_match = re.search(r'UTC[+-]?\d+', entry)
-        if utc_match:
-            ip_data['utc'] = utc_match.group(0)
-        
-        print(f"DADOS EXTRAÍDOS: {ip_data}")
-        
-        result = analyze_ip(ip_data)
-        results.append(result)
-        
-        if i < total - 1:
-            time.sleep(1.5)
+    if enrichment:
+        results.update(enrichment.result())
 
     return results
 
-def generate_html_dashboard(results, output_file="dashboard_ips.html"):
-    total_ips = len(results)
-    vpn_detected = sum(1 for r in results if r.get('status_vpn') == 'Detectado')
-    mobile_connections = sum(1 for r in results if r.get('conexão_móvel') == 'Sim')
-    fixed_connections = sum(1 for r in results if r.get('conexão_móvel') == 'Não')
+ENTRY_FIELDS = ('ip', 'porta', 'data', 'hora', 'utc')
+# Marcador de prioridade na linha de entrada (ex: "8.8.8.8 443 ... #urgente")
+TAG_PATTERN = re.compile(r'(?:^|\s)#([\w-]+)')
+
+def extract_ip_fields(entry):
+    """
+    Extrai IP, porta, data, hora e UTC de uma linha de log
+    Procura cada campo em qualquer posição da linha
+    """
+    entry = entry.strip()
+    ip_data = {
+        'ip': '',
+        'porta': None,
+        'data': None,
+        'hora': None,
+        'utc': None
+    }
     
-    countries = [r.get('país', 'Desconhecido') for r in results if r.get('país', 'Desconhecido') != 'Erro na consulta']
-    unique_countries = len(set(countries))
+    # IP
+    ip_match = re.search(r'(\d+\.\d+\.\d+\.\d+)', entry)
+    if ip_match:
+        ip_data['ip'] = ip_match.group(1)
+    else:
+        # Sem IPv4 na linha: aproveitar o parser geral (IPv6)
+        ip_data['ip'] = parse_ip_entry(entry)['ip']
     
-    providers = [r.get('provedor', 'Desconhecido') for r in results if r.get('provedor', 'Desconhecido') != 'Erro na consulta']
-    unique_providers = len(set(providers))
-
-    results_json = json.dumps(results, ensure_ascii=False, indent=2)
-
-    html_content = f'''<!DOCTYPE html>
-<html lang="pt-BR">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Dashboard - Análise de IPs com Mapa</title>
+    # Porta (apenas se houver : imediatamente após o IP)
+    if ':' in entry:
+        porta_match = re.search(r'(\d+\.\d+\.\d+\.\d+):(\d+)', entry)
+        if porta_match:
+            ip_data['porta'] = porta_match.group(2)
     
-    <!-- Leaflet CSS -->
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.9.4/leaflet.min.css" />
+    # Data
+    date_match = re.search(r'(\d{2}/\d{2}/\d{4})', entry)
+    if date_match:
+        ip_data['data'] = date_match.group(1)
     
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; color: #333; }}
-        .container {{ max-width: 1800px; margin: 0 auto; padding: 20px; }}
-        .header {{ background: white; border-radius: 15px; box-shadow: 0 10px 30px rgba(0,0,0,0.2); padding: 30px; margin-bottom: 30px; text-align: center; }}
-        .header h1 {{ color: #667eea; font-size: 2.5rem; margin-bottom: 10px; font-weight: 700; }}
-        .header p {{ color: #666; font-size: 1.1rem; margin-bottom: 5px; }}
-        
-        /* Estatísticas básicas */
-        .stats-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px; margin-bottom: 30px; }}
-        .stat-card {{ background: linear-gradient(135deg, #667eea, #764ba2); color: white; border-radius: 12px; padding: 20px; text-align: center; transition: transform 0.3s ease; }}
-        .stat-card:hover {{ transform: translateY(-5px); }}
-        .stat-number {{ font-size: 2rem; font-weight: bold; margin-bottom: 8px; }}
-        .stat-label {{ font-size: 0.9rem; font-weight: 500; opacity: 0.9; }}
-        
-        /* Mapa - MAIOR E MAIS VISÍVEL */
-        .map-section {{ background: white; border-radius: 15px; box-shadow: 0 10px 30px rgba(0,0,0,0.2); padding: 25px; margin-bottom: 30px; }}
-        .section-title {{ color: #667eea; font-size: 1.8rem; margin-bottom: 20px; font-weight: 600; border-bottom: 3px solid #667eea; padding-bottom: 10px; }}
-        #map {{ height: 600px; width: 100%; border-radius: 12px; box-shadow: 0 6px 20px rgba(0,0,0,0.15); }}
-        .map-legend {{ margin-top: 15px; padding: 15px; background: #f8f9fa; border-radius: 8px; font-size: 0.95rem; color: #666; text-align: center; }}
-        .legend-item {{ display: inline-block; margin: 0 15px; }}
-        .legend-dot {{ display: inline-block; width: 12px; height: 12px; border-radius: 50%; margin-right: 5px; }}
-        
-        /* Tabela e controles */
-        .main-content {{ background: white; border-radius: 15px; box-shadow: 0 10px 30px rgba(0,0,0,0.2); padding: 30px; }}
-        .form-section {{ background: #f8f9fa; padding: 20px; border-radius: 10px; margin-bottom: 25px; }}
-        .form-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 15px; }}
-        .form-group {{ display: flex; flex-direction: column; }}
-        .form-group label {{ font-weight: 600; color: #667eea; margin-bottom: 5px; }}
-        .form-group input {{ padding: 8px 12px; border: 2px solid #e9ecef; border-radius: 6px; font-size: 0.9rem; }}
-        .controls {{ margin-bottom: 25px; display: flex; flex-wrap: wrap; gap: 15px; align-items: center; }}
-        .filter-group {{ display: flex; align-items: center; gap: 10px; }}
-        .filter-group label {{ font-weight: 600; color: #667eea; }}
-        select, input {{ padding: 8px 12px; border: 2px solid #e9ecef; border-radius: 6px; font-size: 0.9rem; }}
-        select:focus, input:focus {{ outline: none; border-color: #667eea; }}
-        .btn {{ background: #667eea; color: white; border: none; padding: 10px 20px; border-radius: 6px; cursor: pointer; font-size: 0.9rem; font-weight: 600; transition: background 0.3s ease; margin: 5px; }}
-        .btn:hover {{ background: #5a6fd8; }}
-        .btn-export {{ background: #27ae60; }}
-        .btn-export:hover {{ background: #219a52; }}
-        .btn-copy {{ background: #17a2b8; }}
-        .btn-copy:hover {{ background: #138496; }}
-        .btn-oficio {{ background: #ffc107; color: #212529; }}
-        .btn-oficio:hover {{ background: #e0a800; }}
-        .table-container {{ overflow-x: auto; border-radius: 10px; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }}
-        table {{ width: 100%; border-collapse: collapse; background: white; }}
-        th {{ background: #667eea; color: white; padding: 12px 8px; text-align: left; font-weight: 600; position: sticky; top: 0; z-index: 10; font-size: 0.85rem; }}
-        td {{ padding: 8px; border-bottom: 1px solid #e9ecef; vertical-align: middle; font-size: 0.85rem; }}
-        tr:hover {{ background: #f8f9fa; }}
-        .status-badge {{ display: inline-block; padding: 3px 6px; border-radius: 8px; font-size: 0.75rem; font-weight: 600; text-align: center; min-width: 60px; }}
-        .status-safe {{ background: #d4edda; color: #155724; }}
-        .status-warning {{ background: #fff3cd; color: #856404; }}
-        .status-danger {{ background: #f8d7da; color: #721c24; }}
-        .status-info {{ background: #d1ecf1; color: #0c5460; }}
-        .ip-version {{ font-family: monospace; font-weight: bold; color: #667eea; }}
-        .no-results {{ text-align: center; padding: 40px; color: #666; font-size: 1.1rem; }}
-        .export-section {{ margin-top: 20px; padding: 20px; background: #f8f9fa; border-radius: 10px; text-align: center; }}
-        .oficios-section {{ margin-top: 20px; padding: 20px; background: #fff3cd; border-radius: 10px; }}
-        .oficios-buttons {{ margin-bottom: 15px; }}
-        .copy-success {{ background: #d4edda; color: #155724; padding: 10px; border-radius: 6px; margin: 10px 0; display: none; }}
-        .oficio-generated {{ background: white; border: 2px solid #667eea; border-radius: 10px; padding: 20px; margin-top: 15px; max-height: 400px; overflow-y: auto; }}
-        .oficio-text {{ white-space: pre-line; font-family: 'Times New Roman', serif; line-height: 1.6; }}
-        
-        /* Pop-up customizado */
-        .leaflet-popup-content-wrapper {{ border-radius: 8px; }}
-        .leaflet-popup-content {{ margin: 15px; min-width: 300px; }}
-        .popup-header {{ background: #667eea; color: white; padding: 10px; margin: -15px -15px 15px -15px; border-radius: 8px 8px 0 0; font-weight: bold; text-align: center; font-size: 1.1rem; }}
-        .popup-section {{ margin-bottom: 12px; padding: 8px 0; border-bottom: 1px solid #eee; }}
-        .popup-section:last-child {{ border-bottom: none; }}
-        .popup-label {{ font-weight: bold; color: #333; margin-bottom: 4px; font-size: 0.9rem; }}
-        .popup-value {{ color: #666; font-size: 0.85rem; line-height: 1.4; }}
-        .popup-ip {{ font-family: monospace; font-weight: bold; color: #667eea; font-size: 1.1rem; }}
-        .popup-country {{ font-size: 1rem; font-weight: 600; }}
-        .popup-alert {{ color: #dc3545; font-weight: bold; }}
-        .popup-safe {{ color: #28a745; font-weight: bold; }}
-        
-        @media (max-width: 768px) {{ 
-            .container {{ padding: 10px; }} 
-            .stats-grid {{ grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); }} 
-            .controls {{ flex-direction: column; align-items: stretch; }} 
-            .filter-group {{ justify-content: space-between; }}
-            #map {{ height: 400px; }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🔍 Dashboard - Análise de IPs com Mapa Interativo</h1>
-            <p><strong>Relatório gerado em:</strong> {datetime.now().strftime("%d/%m/%Y às %H:%M:%S")}</p>
-            <p>Análise completa com mapa de geolocalização e detecção de VPN/Proxy</p>
-        </div>
-
-        <!-- Estatísticas Resumidas -->
-        <div class="stats-grid">
-            <div class="stat-card">
-                <div class="stat-number">{total_ips}</div>
-                <div class="stat-label">Total de IPs Analisados</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-number">{vpn_detected}</div>
-                <div class="stat-label">VPN/Proxy Detectados</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-number">{mobile_connections}</div>
-                <div class="stat-label">Conexões Móveis</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-number">{fixed_connections}</div>
-                <div class="stat-label">Conexões Fixas</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-number">{unique_countries}</div>
-                <div class="stat-label">Países Únicos</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-number">{unique_providers}</div>
-                <div class="stat-label">Provedores Únicos</div>
-            </div>
-        </div>
-
-        <!-- Mapa Interativo - MAIOR E MAIS VISÍVEL -->
-        <div class="map-section">
-            <h3 class="section-title">🗺️ Mapa de Geolocalização dos IPs</h3>
-            <div id="map"></div>
-            <div class="map-legend">
-                <strong>Legenda:</strong>
-                <span class="legend-item">
-                    <span class="legend-dot" style="background: #28a745;"></span>
-                    Conexão Segura
-                </span>
-                <span class="legend-item">
-                    <span class="legend-dot" style="background: #dc3545;"></span>
-                    VPN/Proxy Detectado
-                </span>
-                <span class="legend-item">
-                    <span class="legend-dot" style="background: #ffc107;"></span>
-                    Conexão Móvel
-                </span>
-                <span class="legend-item">
-                    <span class="legend-dot" style="background: #17a2b8;"></span>
-                    Indeterminado
-                </span>
-            </div>
-        </div>
-
-        <!-- Controles e Tabela -->
-        <div class="main-content">
-            <div class="form-section">
-                <h3>📋 Dados do Procedimento</h3>
-                <div class="form-grid">
-                    <div class="form-group">
-                        <label for="tipo-procedimento">Tipo de Procedimento:</label>
-                        <input type="text" id="tipo-procedimento" placeholder="Ex: Inquérito Policial">
-                    </div>
-                    <div class="form-group">
-                        <label for="numero-procedimento">Número do Procedimento:</label>
-                        <input type="text" id="numero-procedimento" placeholder="Ex: 001/2025">
-                    </div>
-                    <div class="form-group">
-                        <label for="prazo-resposta">Prazo (dias):</label>
-                        <input type="text" id="prazo-resposta" placeholder="Ex: 30 (trinta) dias">
-                    </div>
-                    <div class="form-group">
-                        <label for="email-resposta">E-mail de Resposta:</label>
-                        <input type="email" id="email-resposta" placeholder="Ex: delegado@pc.go.gov.br">
-                    </div>
-                </div>
-            </div>
-
-            <div class="controls">
-                <div class="filter-group"><label for="vpn-filter">Filtrar VPN:</label><select id="vpn-filter"><option value="">Todos</option><option value="Detectado">Detectado</option><option value="Não detectado">Não detectado</option></select></div>
-                <div class="filter-group"><label for="connection-filter">Tipo Conexão:</label><select id="connection-filter"><option value="">Todos</option><option value="Móvel">Móvel</option><option value="Fixa">Fixa</option><option value="Indeterminado">Indeterminado</option></select></div>
-                <div class="filter-group"><label for="country-filter">País:</label><select id="country-filter"><option value="">Todos</option></select></div>
-                <div class="filter-group"><label for="provider-filter">Provedor:</label><select id="provider-filter"><option value="">Todos</option></select></div>
-                <div class="filter-group"><label for="search-ip">Buscar IP:</label><input type="text" id="search-ip" placeholder="Digite um IP..."></div>
-                <button class="btn" onclick="applyFilters()">Aplicar Filtros</button>
-                <button class="btn" onclick="clearFilters()">Limpar</button>
-            </div>
-
-            <div id="copy-success" class="copy-success">✅ Dados copiados com sucesso!</div>
-
-            <div class="table-container">
-                <table id="results-table">
-                    <thead><tr><th>IP</th><th>Porta</th><th>Data</th><th>Hora</th><th>UTC</th><th>Versão</th><th>VPN/Proxy</th><th>Tipo Conexão</th><th>País</th><th>Cidade</th><th>Provedor</th><th>Organização</th><th>AS</th></tr></thead>
-                    <tbody id="results-tbody"></tbody>
-                </table>
-            </div>
-
-            <div id="no-results" class="no-results" style="display: none;">Nenhum resultado encontrado com os filtros aplicados.</div>
-
-            <div class="export-section">
-                <h3>📤 Exportar/Copiar Resultados</h3>
-                <button class="btn btn-copy" onclick="copiarApenas6Colunas()">📋 Copiar TABELA para Word</button>
-                <button class="btn btn-export" onclick="exportToCSV()">📊 Exportar CSV</button>
-                <button class="btn btn-export" onclick="exportToJSON()">📄 Exportar JSON</button>
-            </div>
-
-            <div class="oficios-section">
-                <h3>📄 Geração de Ofícios por Provedor</h3>
-                <div id="oficios-buttons" class="oficios-buttons"></div>
-                <div id="oficio-generated" class="oficio-generated" style="display: none;">
-                    <h4>📋 Ofício Gerado:</h4>
-                    <div id="oficio-text" class="oficio-text"></div>
-                    <button class="btn btn-copy" onclick="copyOficioToClipboard()">📋 Copiar Ofício</button>
-                    <button class="btn btn-export" onclick="downloadOficio()">💾 Download Ofício</button>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <!-- Scripts -->
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.9.4/leaflet.min.js"></script>
+    # Hora (HH:MM ou HH:MM:SS) - só após espaço ou vírgula
+    time_match = re.search(r'[\s,](\d{1,2}:\d{2}(?::\d{2})?)', entry)
+    if time_match:
+        ip_data['hora'] = time_match.group(1)
     
-    <script>
-        const allResults = {results_json};
-        let filteredResults = allResults;
-        let currentOficio = '';
-        let map, markers = [];
-
-        document.addEventListener('DOMContentLoaded', function() {{
-            initializeMap();
-            populateFilters();
-            displayResults(allResults);
-            generateOficioButtons();
-        }});
-
-        // FUNÇÃO NOVA E ISOLADA - APENAS 6 COLUNAS
-        function copiarApenas6Colunas() {{
-            console.log('Iniciando cópia das 6 colunas específicas...');
-            
-            // String que será copiada - começar do zero
-            let textoFinal = 'IP\\tPorta\\tData\\tHora\\tUTC\\tAS\\n';
-            
-            // Debug: verificar quantos resultados temos
-            console.log('Número de resultados filtrados:', filteredResults.length);
-            
-            // Processar cada resultado individualmente
-            for (let i = 0; i < filteredResults.length; i++) {{
-                const item = filteredResults[i];
-                
-                // Extrair EXATAMENTE os 6 campos
-                const coluna1 = item.ip || '';
-                const coluna2 = item.porta || '-';
-                const coluna3 = item.data || '-';
-                const coluna4 = item.hora || '-';
-                const coluna5 = item.utc || '-';
-                const coluna6 = item.AS || 'N/A';
-                
-                // Montar linha com TAB entre cada coluna
-                const linha = coluna1 + '\\t' + coluna2 + '\\t' + coluna3 + '\\t' + coluna4 + '\\t' + coluna5 + '\\t' + coluna6 + '\\n';
-                
-                textoFinal += linha;
-                
-                // Debug: mostrar primeira linha
-                if (i === 0) {{
-                    console.log('Primeira linha:', linha);
-                }}
-            }}
-            
-            console.log('Texto final a ser copiado:', textoFinal.substring(0, 100) + '...');
-            
-            // Copiar para clipboard de forma mais robusta
-            if (navigator.clipboard) {{
-                navigator.clipboard.writeText(textoFinal).then(() => {{
-                    console.log('Copiado com sucesso via navigator.clipboard');
-                    mostrarMensagemSucesso('✅ APENAS 6 colunas copiadas! Cole no Word agora');
-                }}).catch((erro) => {{
-                    console.log('Erro navigator.clipboard:', erro);
-                    usarMetodoAlternativo(textoFinal);
-                }});
-            }} else {{
-                usarMetodoAlternativo(textoFinal);
-            }}
-        }}
-        
-        function usarMetodoAlternativo(texto) {{
-            console.log('Usando método alternativo de cópia...');
-            
-            // Criar elemento textarea temporário
-            const elementoTemp = document.createElement('textarea');
-            elementoTemp.value = texto;
-            elementoTemp.style.position = 'fixed';
-            elementoTemp.style.left = '-9999px';
-            elementoTemp.style.top = '-9999px';
-            
-            document.body.appendChild(elementoTemp);
-            elementoTemp.focus();
-            elementoTemp.select();
-            
-            try {{
-                const sucesso = document.execCommand('copy');
-                if (sucesso) {{
-                    console.log('Copiado com sucesso via execCommand');
-                    mostrarMensagemSucesso('✅ APENAS 6 colunas copiadas! Cole no Word agora');
-                }} else {{
-                    console.log('Falha no execCommand');
-                    mostrarMensagemSucesso('❌ Erro ao copiar. Tente novamente.');
-                }}
-            }} catch (erro) {{
-                console.log('Erro no execCommand:', erro);
-                mostrarMensagemSucesso('❌ Erro ao copiar. Tente novamente.');
-            }}
-            
-            document.body.removeChild(elementoTemp);
-        }}
+    # UTC
+    utc_match = re.search(r'UTC[+-]?\d+', entry)
+    if utc_match:
+        ip_data['utc'] = utc_match.group(0)
+
+    tag_match = TAG_PATTERN.search(entry)
+    if tag_match:
+        ip_data['tag'] = tag_match.group(1).lower()
+    
+    return ip_data
+
+def prepare_entries(ip_entries):
+    """
+    Converte linhas de log em entradas prontas para análise
+    A validação dos IPs é feita em lote e o resultado (versão, inteiro e
+    forma canônica) fica anotado na entrada, para não ser refeita adiante.
+    Data e hora são normalizadas para timestamp UTC, com a ordem dia/mês
+    detectada uma vez para o lote todo.
+    Entradas já preparadas são mantidas como estão.
+    """
+    entries = []
+    pending = []
+    untimed = []
+    for entry in ip_entries:
+        if isinstance(entry, dict):
+            ip_data = dict(entry)
+            ip_data.setdefault('entrada', ip_data.get('ip', ''))
+        else:
+            ip_data = extract_ip_fields(entry)
+            ip_data['entrada'] = entry.strip()
+        if 'ip_version' not in ip_data or 'ip_int' not in ip_data:
+            pending.append(ip_data)
+        if 'timestamp' not in ip_data:
+            untimed.append(ip_data)
+        entries.append(ip_data)
+
+    date_order = detect_date_order(ip_data.get('data') for ip_data in untimed)
+    for ip_data in untimed:
+        normalize_entry_time(ip_data, date_order)
+
+    validated = validate_ips_bulk([ip_data['ip'] for ip_data in pending])
+    for ip_data, packed, version, canonical in zip(pending, validated['packed'], validated['version'], validated['canonical']):
+        ip_data['ip_int'] = packed
+        ip_data['ip_version'] = version
+        ip_data['ip_canonical'] = canonical
+
+    return entries
+
+# Entrada tabular (CSV/XLSX): as colunas viram os campos da entrada, sem
+# procurar IP, porta e data na linha com expressões regulares
+TABLE_EXTENSIONS = ('.csv', '.tsv', '.xlsx', '.xlsm')
+TABLE_CHUNK_ROWS = 10000
+# Linhas usadas para detectar o formato das datas e bytes para o delimitador
+TABLE_SAMPLE_ROWS = 1000
+TABLE_SNIFF_BYTES = 64 * 1024
+# Nomes usuais das colunas (sem acentos, minúsculas, '_' e '-' como espaço)
+TABLE_COLUMN_ALIASES = {
+    'ip': ('ip', 'endereco ip', 'ip origem', 'ip de origem', 'ip address', 'ipaddress', 'source ip', 'src ip',
+           'client ip', 'remote ip', 'ipv4', 'ipv6'),
+    'porta': ('porta', 'porta origem', 'porta de origem', 'port', 'source port', 'src port', 'client port',
+              'remote port'),
+    'data_hora': ('data/hora', 'data hora', 'data e hora', 'datetime', 'date time', 'timestamp', 'horario utc',
+                  'created at', 'event time', 'login time'),
+    'data': ('data', 'date', 'dia'),
+    'hora': ('hora', 'time', 'horario'),
+    'utc': ('utc', 'fuso', 'fuso horario', 'timezone', 'time zone', 'tz', 'offset', 'gmt'),
+    'tag': ('tag',),
+}
+_TABLE_TIME_PART = r'(?:[ T]+(?P<H>\d{1,2}):(?P<M>\d{2})(?::(?P<S>\d{2}))?(?:[.,]\d+)?)?'
+_TABLE_OFFSET_PART = r'\s*(?P<tz>Z|(?:UTC|GMT)?\s*[+-]\d{1,2}(?::?\d{2})?|UTC|GMT)?'
+# Formatos aceitos na coluna de data (ou de data e hora), tentados nesta ordem
+TABLE_DATE_FORMATS = {
+    'DD/MM/AAAA': r'(?P<d>\d{1,2})/(?P<m>\d{1,2})/(?P<y>\d{4})',
+    'MM/DD/AAAA': r'(?P<m>\d{1,2})/(?P<d>\d{1,2})/(?P<y>\d{4})',
+    'AAAA-MM-DD': r'(?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})',
+    'AAAA/MM/DD': r'(?P<y>\d{4})/(?P<m>\d{1,2})/(?P<d>\d{1,2})',
+    'DD-MM-AAAA': r'(?P<d>\d{1,2})-(?P<m>\d{1,2})-(?P<y>\d{4})',
+    'DD.MM.AAAA': r'(?P<d>\d{1,2})\.(?P<m>\d{1,2})\.(?P<y>\d{4})',
+}
+TABLE_EPOCH_PATTERN = re.compile(r'\d{10}(?:\.\d+)?|\d{13}')
+TABLE_OFFSET_PATTERN = re.compile(r'(?:UTC|GMT)?\s*([+-])(\d{1,2})(?::?(\d{2}))?', re.IGNORECASE)
+
+def is_table_file(path):
+    return os.path.splitext(path)[1].lower() in TABLE_EXTENSIONS
+
+def _header_key(name):
+    text = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[_-]+', ' ', text).lower().split())
+
+def _cell_text(value):
+    if value.__class__ is str:
+        return value.strip()
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def map_table_columns(header, columns=None):
+    """
+    Posição de cada campo (ip, porta, data_hora, data, hora, utc, tag) na tabela
+    columns, se informado, é {campo: nome ou número (1, 2...) da coluna};
+    os demais campos são reconhecidos pelos nomes usuais
+    (TABLE_COLUMN_ALIASES). Sem coluna de IP, retorna None.
+    """
+    keys = [_header_key(name) for name in header]
+    mapping = {}
+    for field, column in (columns or {}).items():
+        if column.isdigit():
+            mapping[field] = int(column) - 1
+        elif _header_key(column) in keys:
+            mapping[field] = keys.index(_header_key(column))
+        else:
+            raise ValueError(f"Coluna '{column}' não encontrada no cabeçalho")
+    for field, aliases in TABLE_COLUMN_ALIASES.items():
+        if field in mapping:
+            continue
+        for alias in aliases:
+            if alias in keys and keys.index(alias) not in mapping.values():
+                mapping[field] = keys.index(alias)
+                break
+    return mapping if 'ip' in mapping else None
+
+def detect_table_date_format(samples):
+    """
+    Escolhe, uma única vez para a tabela, o formato da coluna de data
+    Vale o primeiro de TABLE_DATE_FORMATS em que todas as amostras se
+    encaixam; entre DD/MM e MM/DD decide detect_date_order. Retorna
+    (nome, padrão compilado), ('epoch', None) para segundos ou
+    milissegundos desde a época, ou (None, None) se nenhum servir.
+    """
+    texts = [_cell_text(value) for value in samples if not isinstance(value, datetime)]
+    if not texts:
+        return None, None
+    if all(TABLE_EPOCH_PATTERN.fullmatch(text) for text in texts):
+        return 'epoch', None
+    for name, date_part in TABLE_DATE_FORMATS.items():
+        if name == 'MM/DD/AAAA':
+            continue
+        pattern = re.compile(date_part + _TABLE_TIME_PART + _TABLE_OFFSET_PART, re.IGNORECASE)
+        if not all(pattern.fullmatch(text) for text in texts):
+            continue
+        if name == 'DD/MM/AAAA' and detect_date_order(text.split()[0] for text in texts) == 'MDY':
+            name = 'MM/DD/AAAA'
+            pattern = re.compile(TABLE_DATE_FORMATS[name] + _TABLE_TIME_PART + _TABLE_OFFSET_PART, re.IGNORECASE)
+        return name, pattern
+    return None, None
+
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+def _format_utc(offset):
+    minutes = int(offset.total_seconds() // 60)
+    sign = '-' if minutes < 0 else '+'
+    hours, rest = divmod(abs(minutes), 60)
+    return f"UTC{sign}{hours}" + (f":{rest:02d}" if rest else '')
+
+def _column_getter(index):
+    """
+    Leitor da coluna index de uma linha; sem coluna, devolve sempre None
+    """
+    if index is None:
+        return lambda row: None
+    return lambda row: row[index]
+
+class TableTimeReader:
+    """
+    Converte as colunas de data, hora e fuso de uma tabela nos campos de
+    tempo da entrada (data, hora, utc, timestamp e data_hora_utc)
+    O formato da data vem de detect_table_date_format, sobre uma amostra
+    das primeiras linhas; cada linha só aplica o padrão escolhido. Células
+    de data/hora do Excel (datetime) são usadas diretamente. Fusos
+    repetidos (UTC-3, -03:00, America/Sao_Paulo...) são interpretados uma
+    única vez.
+    """
+
+    def __init__(self, samples):
+        self.format, self.pattern = detect_table_date_format(samples)
+        if self.format is None and samples:
+            self.format = 'data do Excel'
+        self.zones = {}
+        self.offsets = {}
+        self.days = {}
+        self.utc_days = {}
+        self.mismatches = 0
+
+    def zone(self, value):
+        text = _cell_text(value)
+        if text not in self.zones:
+            self.zones[text] = self._parse_zone(text)
+        return self.zones[text]
+
+    @staticmethod
+    def _parse_zone(text):
+        # None: fuso ausente ou não reconhecido (a linha usa o padrão, marcado como presumido)
+        if not text:
+            return None
+        if text.upper() in ('Z', 'UTC', 'GMT'):
+            return timezone.utc
+        match = TABLE_OFFSET_PATTERN.fullmatch(text)
+        if match:
+            minutes = int(match.group(2)) * 60 + int(match.group(3) or 0)
+            return timezone(timedelta(minutes=-minutes if match.group(1) == '-' else minutes))
+        try:
+            from zoneinfo import ZoneInfo
+            return ZoneInfo(text)
+        except (ImportError, ValueError, KeyError, OSError):
+            return None
+
+    def read(self, ip_data, date_value, time_value=None, utc_value=None):
+        ip_data['timestamp'] = None
+        ip_data['data_hora_utc'] = None
+        zone = None
+        hour = minute = second = None
+        if isinstance(date_value, datetime):
+            year, month, day = date_value.year, date_value.month, date_value.day
+            if date_value.hour or date_value.minute or date_value.second or time_value is None:
+                hour, minute, second = date_value.hour, date_value.minute, date_value.second
+            zone = date_value.tzinfo
+        else:
+            text = _cell_text(date_value)
+            if not text:
+                return ip_data
+            if self.format == 'epoch':
+                # Milissegundos pelos 13 dígitos da parte inteira (1700000000.5 continua em segundos)
+                try:
+                    instant = datetime.fromtimestamp(
+                        float(text) / (1000 if len(text.partition('.')[0]) == 13 else 1), timezone.utc)
+                except (ValueError, OverflowError, OSError):
+                    self.mismatches += 1
+                    ip_data['data'] = text
+                    return ip_data
+                year, month, day = instant.year, instant.month, instant.day
+                hour, minute, second = instant.hour, instant.minute, instant.second
+                zone = timezone.utc
+            else:
+                match = self.pattern.fullmatch(text) if self.pattern else None
+                if not match:
+                    self.mismatches += 1
+                    ip_data['data'] = text
+                    return ip_data
+                year, month, day = match.group('y', 'm', 'd')
+                if match.group('H') is not None:
+                    hour, minute, second = int(match.group('H')), int(match.group('M')), int(match.group('S') or 0)
+                if match.group('tz'):
+                    zone = self.zone(match.group('tz'))
+        day_number, ip_data['data'] = self._day(year, month, day)
+
+        if hour is None and time_value not in (None, ''):
+            if hasattr(time_value, 'hour'):
+                hour, minute, second = time_value.hour, time_value.minute, time_value.second
+            else:
+                time_match = TIME_PATTERN.fullmatch(_cell_text(time_value))
+                if time_match:
+                    hour, minute, second = (int(time_match.group(1)), int(time_match.group(2)),
+                                            int(time_match.group(3) or 0))
+        if hour is None or day_number is None or not (hour < 24 and minute < 60 and second < 60):
+            return ip_data
+        ip_data['hora'] = f"{hour:02d}:{minute:02d}:{second:02d}"
+        zone = zone or self.zone(utc_value)
+        if zone is None:
+            zone = timezone(timedelta(hours=DEFAULT_UTC_OFFSET))
+            ip_data['utc_presumido'] = DEFAULT_UTC_LABEL
+        if isinstance(zone, timezone):
+            # Deslocamento fixo: o instante sai de contas com o dia, sem montar um datetime por linha
+            if zone not in self.offsets:
+                offset = zone.utcoffset(None)
+                self.offsets[zone] = int(offset.total_seconds()), _format_utc(offset)
+            offset, ip_data['utc'] = self.offsets[zone]
+            timestamp = day_number * 86400 + hour * 3600 + minute * 60 + second - offset
+        else:
+            local = datetime.fromordinal(day_number + EPOCH_ORDINAL).replace(hour=hour, minute=minute, second=second,
+                                                                             tzinfo=zone)
+            ip_data['utc'] = _format_utc(local.utcoffset())
+            timestamp = int(local.timestamp())
+        utc_day, rest = divmod(timestamp, 86400)
+        if utc_day not in self.utc_days:
+            self.utc_days[utc_day] = datetime.fromordinal(utc_day + EPOCH_ORDINAL).strftime('%Y-%m-%d')
+        if 'utc_presumido' in ip_data:
+            # Como na entrada em texto, utc fica vazio e o fuso usado vai em utc_presumido
+            ip_data['utc'] = None
+        ip_data['timestamp'] = timestamp
+        ip_data['data_hora_utc'] = f"{self.utc_days[utc_day]}T{rest // 3600:02d}:{rest // 60 % 60:02d}:{rest % 60:02d}Z"
+        return ip_data
+
+    def _day(self, year, month, day):
+        """
+        (dias desde a época, data DD/MM/AAAA) de uma data, calculados uma vez por data
+        """
+        key = (year, month, day)
+        if key not in self.days:
+            year, month, day = int(year), int(month), int(day)
+            try:
+                day_number = datetime(year, month, day).toordinal() - EPOCH_ORDINAL
+            except ValueError:
+                day_number = None
+            self.days[key] = day_number, f"{day:02d}/{month:02d}/{year}"
+        return self.days[key]
+
+def _csv_rows(path):
+    import codecs
+    import csv
+    with open(path, 'rb') as f:
+        raw = f.read(TABLE_SNIFF_BYTES)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(raw)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        # Exportações do Excel em português costumam vir em Windows-1252
+        encoding = 'cp1252'
+    sample = raw.decode(encoding, 'ignore')
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel_tab if path.lower().endswith('.tsv') else csv.excel
+    with open(path, newline='', encoding=encoding) as f:
+        yield from csv.reader(f, dialect)
+
+def _xlsx_rows(path, sheet=None):
+    if importlib.util.find_spec('openpyxl') is None:
+        raise ValueError("A leitura de planilhas XLSX requer o openpyxl: pip install openpyxl")
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        if sheet and sheet not in workbook.sheetnames:
+            raise ValueError(f"Aba '{sheet}' não encontrada (abas: {', '.join(workbook.sheetnames)})")
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        yield from worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+class TableInput:
+    """
+    Arquivo CSV ou XLSX de registros de acesso, lido em blocos
+    As colunas são mapeadas pelo cabeçalho (map_table_columns) e cada linha
+    vira uma entrada com ip, porta, data, hora e utc já separados. O
+    delimitador do CSV e o formato das datas são detectados uma vez para o
+    arquivo. Sem coluna de IP reconhecida, cada linha vira texto e segue
+    pela extração usual (extract_ip_fields).
+    """
+
+    def __init__(self, path, columns=None, sheet=None):
+        self.path = path
+        ext = os.path.splitext(path)[1].lower()
+        self.rows = enumerate(_xlsx_rows(path, sheet) if ext in ('.xlsx', '.xlsm') else _csv_rows(path), 1)
+        self.header = next(self.rows, (1, ()))
+        header = [_cell_text(value) for value in self.header[1]]
+        self.mapping = map_table_columns(header, columns)
+        self.has_header = bool(self.mapping)
+        # Colunas só por número: a primeira linha é dado, a menos que não tenha IP
+        if self.mapping and columns and all(column.isdigit() for column in columns.values()):
+            position = self.mapping['ip']
+            self.has_header = not (position < len(header) and _normalize_ip_text(header[position].partition(':')[0]))
+        if not self.has_header:
+            self.rows = itertools.chain([self.header], self.rows)
+        self.time_reader = None
+
+    def describe(self):
+        if not self.mapping:
+            return "sem coluna de IP reconhecida - linhas lidas como texto"
+        names = [(_cell_text(value) if self.has_header else '') or str(position + 1)
+                 for position, value in enumerate(self.header[1])]
+        columns = ', '.join(f"{field}={names[position] if position < len(names) else position + 1}"
+                            for field, position in self.mapping.items())
+        return columns + (f"; datas em {self.time_reader.format}" if self.time_reader and self.time_reader.format else '')
+
+    def chunks(self, size=TABLE_CHUNK_ROWS):
+        """
+        Gera listas de até size pares (número da linha, entrada)
+        """
+        if not self.mapping:
+            yield from self._text_chunks(size)
+            return
+        mapping = self.mapping
+        sample = list(itertools.islice(self.rows, TABLE_SAMPLE_ROWS))
+        date_column = mapping.get('data_hora', mapping.get('data'))
+        self.time_reader = TableTimeReader(
+            [row[date_column] for _, row in sample
+             if date_column is not None and date_column < len(row) and row[date_column] not in (None, '')])
+
+        # Linhas curtas são completadas até a última coluna mapeada; campos sem
+        # coluna são sempre None, mesmo em linhas com colunas extras
+        width = max(mapping.values()) + 1
+        date_field = 'data_hora' if 'data_hora' in mapping else 'data'
+        ip_of, port_of, date_of, time_of, utc_of, tag_of = (
+            _column_getter(mapping.get(field)) for field in ('ip', 'porta', date_field, 'hora', 'utc', 'tag'))
+        padding = [None] * width
+        read_time = self.time_reader.read
+
+        chunk = []
+        for line_number, row in itertools.chain(sample, self.rows):
+            row = [*row, *padding[len(row):]] if len(row) < width else row
+            if not any(row):
+                continue
+            ip = _cell_text(ip_of(row))
+            port = _cell_text(port_of(row)) or None
+            if ip.startswith('['):
+                ip, _, rest = ip[1:].partition(']')
+                port = port or rest.lstrip(':') or None
+            elif ip.count(':') == 1:
+                ip, _, port_text = ip.partition(':')
+                port = port or port_text or None
+            ip_data = {'ip': ip, 'porta': port, 'data': None, 'hora': None, 'utc': None}
+            read_time(ip_data, date_of(row), time_of(row), utc_of(row))
+            tag = tag_of(row)
+            if tag:
+                ip_data['tag'] = _cell_text(tag).lstrip('#').lower()
+            ip_data['entrada'] = ' '.join(_cell_text(value) for value in row if value)
+            chunk.append((line_number, ip_data))
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _text_chunks(self, size):
+        chunk = []
+        for line_number, row in self.rows:
+            line = ' '.join(_cell_text(value) for value in row if value not in (None, ''))
+            if line:
+                chunk.append((line_number, line))
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+# Agregação por prefixo: um IP representativo por bloco de rede
+AGGREGATION_PREFIXES = (24, 48)
+AGGREGATION_SAMPLE_SIZE = 2
+AGGREGATION_CONSISTENCY_FIELDS = ('provedor', 'AS', 'cidade', 'status_vpn')
+
+def group_entries_by_prefix(entries, prefix_v4=24, prefix_v6=48):
+    """
+    Agrupa entradas preparadas por bloco de rede (ex: /24 IPv4, /48 IPv6)
+    Retorna {bloco: [índices]} na ordem de aparição
+    Entradas sem IP válido ficam de fora
+    """
+    keys = {}
+    for index, ip_data in enumerate(entries):
+        version = ip_data.get('ip_version')
+        if not version:
+            continue
+        if version == 'IPv4':
+            key = (version, ip_data['ip_int'] >> (32 - prefix_v4))
+        else:
+            key = (version, ip_data['ip_int'] >> (128 - prefix_v6))
+        keys.setdefault(key, []).append(index)
+
+    blocks = {}
+    for (version, network_bits), indices in keys.items():
+        if version == 'IPv4':
+            network = ipaddress.IPv4Network((network_bits << (32 - prefix_v4), prefix_v4))
+        else:
+            network = ipaddress.IPv6Network((network_bits << (128 - prefix_v6), prefix_v6))
+        blocks[str(network)] = indices
+    return blocks
+
+def _results_agree(result, other):
+    return all(result.get(field) == other.get(field) for field in AGGREGATION_CONSISTENCY_FIELDS)
+
+def _copy_result(source, ip_data, inferred_from=None, block=None):
+    """
+    Copia um resultado para outra entrada, mantendo IP, porta, data e hora da entrada
+    """
+    result = dict(source)
+    result["ip"] = ip_data['ip']
+    result["porta"] = ip_data.get('porta', '')
+    result["data"] = ip_data.get('data', '')
+    result["hora"] = ip_data.get('hora', '')
+    result["utc"] = ip_data.get('utc', '')
+    result["timestamp"] = ip_data.get('timestamp')
+    result["data_hora_utc"] = ip_data.get('data_hora_utc')
+    result.pop("data_original", None)
+    if ip_data.get('data_original'):
+        result["data_original"] = ip_data['data_original']
+    result.pop("tag", None)
+    if ip_data.get('tag'):
+        result["tag"] = ip_data['tag']
+    result.pop("utc_presumido", None)
+    if ip_data.get('utc_presumido'):
+        result["utc_presumido"] = ip_data['utc_presumido']
+    if inferred_from:
+        # O PTR é do IP consultado, não do bloco
+        result.pop("ptr", None)
+        result["inferido"] = "Sim"
+        result["inferido_de"] = inferred_from
+        result["bloco"] = block
+    return result
+
+# Prioridade das consultas: as entradas mais urgentes são consultadas primeiro
+PRIORITY_MODES = ('recencia', 'tag', 'classificacao')
+PRIORITY_HISTORY_BATCH = 500
+
+class LookupQueue:
+    """
+    Fila de prioridade das consultas (heap de (chave, índice original))
+    Chaves menores saem primeiro; entradas com a mesma chave saem na ordem
+    do arquivo. Novas entradas podem ser incluídas durante a análise.
+    """
+
+    def __init__(self, keys=()):
+        self.heap = [(key, index) for index, key in enumerate(keys)]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, index, key):
+        heapq.heappush(self.heap, (key, index))
+
+    def __iter__(self):
+        while self.heap:
+            yield heapq.heappop(self.heap)[1]
+
+def _flagged_in_history(entries, store_path):
+    """
+    Conjunto de IPs (forma canônica) do lote já marcados como VPN/Proxy no histórico
+    """
+    if not store_path or not os.path.exists(store_path):
+        return set()
+    keys = {}
+    for ip_data in entries:
+        key = ip_sort_key(ip_data.get('ip_canonical'))
+        if key:
+            keys[key] = ip_data['ip_canonical']
+    store = ResultStore(store_path)
+    try:
+        return {keys[key] for key in store.flagged_keys(list(keys))}
+    finally:
+        store.close()
+
+def entry_priorities(entries, modes, tags=(), store_path=None):
+    """
+    Chave de prioridade de cada entrada preparada (menor = consultada antes)
+    Os critérios são aplicados na ordem de modes:
+    - recencia: registros mais recentes primeiro, sem horário por último
+    - tag: entradas com #tag, na ordem de tags; outras tags em seguida e
+      entradas sem tag por último
+    - classificacao: pré-classificação local, sem consultar as APIs: IPs já
+      marcados como VPN/Proxy no histórico primeiro, depois os que mais se
+      repetem no lote
+    """
+    tag_rank = {tag.lower(): rank for rank, tag in enumerate(tags or ())}
+    flagged = _flagged_in_history(entries, store_path) if 'classificacao' in modes else set()
+    repeats = Counter(ip_data.get('ip_canonical') for ip_data in entries) if 'classificacao' in modes else None
+
+    keys = []
+    for ip_data in entries:
+        key = []
+        for mode in modes:
+            if mode == 'recencia':
+                timestamp = ip_data.get('timestamp')
+                key += [0, -timestamp] if timestamp is not None else [1, 0]
+            elif mode == 'tag':
+                tag = ip_data.get('tag')
+                key.append(tag_rank.get(tag, len(tag_rank)) if tag else len(tag_rank) + 1)
+            else:
+                canonical = ip_data.get('ip_canonical')
+                key += [0 if canonical in flagged else 1, -repeats[canonical]]
+        keys.append(tuple(key))
+    return keys
+
+def _lookup_order(entries, priority):
+    """
+    Ordem de consulta das entradas: a do arquivo ou, com priority
+    (modos, tags, histórico), a da fila de prioridade
+    """
+    if not priority:
+        return list(range(len(entries))), None
+    modes, tags, store_path = priority
+    keys = entry_priorities(entries, modes, tags, store_path)
+    return list(LookupQueue(keys)), keys
+
+# Progresso dos lotes: uma linha de status reescrita no lugar
+PROGRESS_INTERVAL = 0.5
+# Com a saída redirecionada (sem terminal), uma linha a cada N segundos
+PROGRESS_PLAIN_INTERVAL = 15
+# Janela (segundos) usada na taxa de IPs/s e no ETA
+PROGRESS_RATE_WINDOW = 30
+
+def progress_snapshot(done):
+    """
+    Contadores deste processo mostrados na linha de progresso
+    """
+    errors = Counter()
+    for key, count in lookup_counters.items():
+        kind, _, provider = key.partition(':')
+        if kind in ('erro', 'circuito_aberto') and count:
+            errors[provider] += count
+    return {'concluidas': done, 'cache': lookup_counters['cache'] + lookup_counters['cache_negativo'],
+            'erros': dict(errors), 'em_andamento': _requests_in_flight}
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+class ProgressReporter:
+    """
+    Linha de status de um lote: entradas concluídas, IPs/s, ETA, acertos de
+    cache, erros por provedor e requisições em andamento
+    No terminal a linha é reescrita no máximo a cada PROGRESS_INTERVAL
+    segundos; com a saída redirecionada, uma linha é impressa a cada
+    PROGRESS_PLAIN_INTERVAL segundos. Com log_path, cada entrada consultada
+    vira uma linha JSON no log detalhado.
+    Nos processos de --workers, os contadores vão para queue e o processo
+    principal desenha a linha (follow).
+    """
+
+    def __init__(self, total, log_path=None, queue=None, stream=None):
+        self.total = total
+        self.log_path = log_path
+        self.queue = queue
+        self.stream = stream or sys.stdout
+        self.tty = queue is None and self.stream.isatty()
+        self.interval = PROGRESS_INTERVAL if self.tty or queue is not None else PROGRESS_PLAIN_INTERVAL
+        self.started = time.monotonic()
+        self.last_update = self.started
+        self.done = 0
+        self.workers = {}
+        self.samples = deque([(self.started, 0)])
+        self.width = 0
+        self.follower = None
+        self.followed = None
+        self.lock = threading.Lock()
+
+    def advance(self):
+        with self.lock:
+            self.done += 1
+            now = time.monotonic()
+            if now - self.last_update >= self.interval:
+                self._update(now)
+
+    def log_entry(self, ip_data, result, elapsed):
+        if not self.log_path:
+            return
+        append_json_line(self.log_path, {
+            'instante': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'processo': os.getpid(),
+            'entrada': ip_data.get('entrada'),
+            'dados': {field: ip_data.get(field) for field in ENTRY_FIELDS},
+            'provedor': result.get('provedor'),
+            'AS': result.get('AS'),
+            'vpn': result.get('vpn'),
+            'erros': {key: value for key, value in result.items() if key.startswith('erro')},
+            'duracao_ms': round(elapsed * 1000, 1),
+        })
+
+    def follow(self, queue):
+        """
+        Recebe os contadores dos processos (--workers) até receber None
+        """
+        def run():
+            for pid, snapshot in iter(queue.get, None):
+                with self.lock:
+                    self.workers[pid] = snapshot
+                    now = time.monotonic()
+                    if now - self.last_update >= self.interval:
+                        self._update(now)
+
+        self.followed = queue
+        self.follower = threading.Thread(target=run, daemon=True)
+        self.follower.start()
+
+    def flush(self):
+        with self.lock:
+            self._update(time.monotonic())
+
+    def finish(self):
+        if self.follower:
+            self.followed.put(None)
+            self.follower.join()
+        with self.lock:
+            self._update(time.monotonic())
+            if self.tty and self.width:
+                self.stream.write('\n')
+                self.stream.flush()
+
+    def _update(self, now):
+        self.last_update = now
+        if self.queue is not None:
+            self.queue.put((os.getpid(), progress_snapshot(self.done)))
+            return
+        snapshots = [progress_snapshot(self.done), *self.workers.values()]
+        done = sum(snapshot['concluidas'] for snapshot in snapshots)
+        errors = Counter()
+        for snapshot in snapshots:
+            errors.update(snapshot['erros'])
+
+        self.samples.append((now, done))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= PROGRESS_RATE_WINDOW:
+            self.samples.popleft()
+        since, done_before = self.samples[0]
+        rate = (done - done_before) / (now - since) if now > since else 0.0
+        eta = _format_eta((self.total - done) / rate) if rate > 0 else '--:--:--'
+
+        parts = [f"⏳ {done}/{self.total} ({done / self.total:.1%})" if self.total else f"⏳ {done}",
+                 f"{rate:.1f} IPs/s", f"ETA {eta}",
+                 f"cache {sum(snapshot['cache'] for snapshot in snapshots)}"]
+        if errors:
+            parts.append("erros " + ", ".join(f"{provider} {count}" for provider, count in sorted(errors.items())))
+        parts.append(f"em andamento {sum(snapshot['em_andamento'] for snapshot in snapshots)}")
+        line = " | ".join(parts)
+        if self.tty:
+            self.stream.write('\r' + line.ljust(self.width))
+            self.width = len(line)
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
+
+# Progresso do lote em andamento neste processo (None = sem linha de status)
+_progress = None
+
+def configure_progress(total, log_path=None, queue=None):
+    global _progress
+    _progress = ProgressReporter(total, log_path, queue) if total is not None else None
+    return _progress
+
+def _analyze_entry(ip_data):
+    started = time.perf_counter()
+    result = analyze_ip(ip_data)
+    if _progress:
+        _progress.log_entry(ip_data, result, time.perf_counter() - started)
+    return result
+
+def _publish_reused(results, reuse, on_result):
+    for index, result in (reuse or {}).items():
+        results[index] = result
+        if on_result:
+            on_result(index, result)
+
+def check_batch_ips(ip_entries, aggregate_prefixes=None, sample_size=AGGREGATION_SAMPLE_SIZE, on_result=None,
+                    priority=None, reuse=None):
+    """
+    Analisa um lote de entradas
+    on_result, se informado, é chamado com (índice, resultado) assim que
+    cada resultado fica pronto
+    priority, se informado, é (modos, tags, histórico) e define a ordem das
+    consultas (ver entry_priorities); os resultados voltam sempre na ordem
+    original
+    reuse, se informado, é {índice: resultado} de entradas que não precisam
+    ser consultadas de novo (análise incremental)
+    """
+    entries = prepare_entries(ip_entries)
+
+    if aggregate_prefixes:
+        return _check_batch_aggregated(entries, aggregate_prefixes, sample_size, on_result, priority, reuse)
+
+    results = new_result_list(len(entries))
+    _publish_reused(results, reuse, on_result)
+    order, _ = _lookup_order(entries, priority)
+    if reuse:
+        order = [i for i in order if i not in reuse]
+    total = len(order)
+    if _enricher:
+        _enricher.prefetch([entries[i] for i in order])
+
+    for position, i in enumerate(order):
+        calls_before = lookup_counters['rede']
+        result = _analyze_entry(entries[i])
+        results[i] = result
+        if on_result:
+            on_result(i, result)
+        if _progress:
+            _progress.advance()
         
-        function mostrarMensagemSucesso(mensagem) {{
-            const elementoMensagem = document.getElementById('copy-success');
-            elementoMensagem.innerHTML = mensagem;
-            elementoMensagem.style.display = 'block';
-            
-            setTimeout(() => {{
-                elementoMensagem.style.display = 'none';
-            }}, 5000);
-        }}
-
-        function initializeMap() {{
-            map = L.map('map').setView([-15.7801, -47.9292], 2);
-            
-            L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
-                attribution: '© OpenStreetMap contributors',
-                maxZoom: 18
-            }}).addTo(map);
-            
-            updateMapMarkers(allResults);
-        }}
-
-        function updateMapMarkers(results) {{
-            markers.forEach(marker => map.removeLayer(marker));
-            markers = [];
-            
-            results.forEach(result => {{
-                if (result.latitude && result.longitude) {{
-                    const lat = parseFloat(result.latitude);
-                    const lng = parseFloat(result.longitude);
-                    
-                    if (!isNaN(lat) && !isNaN(lng)) {{
-                        let color = '#28a745';
-                        let fillColor = '#28a745';
-                        
-                        if (result.status_vpn === 'Detectado') {{
-                            color = '#dc3545';
-                            fillColor = '#dc3545';
-                        }}
-                        else if (result.tipo_conexão === 'Móvel') {{
-                            color = '#ffc107';
-                            fillColor = '#ffc107';
-                        }}
-                        else if (result.status_vpn === 'Indeterminado' || result.tipo_conexão === 'Indeterminado') {{
-                            color = '#17a2b8';
-                            fillColor = '#17a2b8';
-                        }}
-                        
-                        const marker = L.circleMarker([lat, lng], {{
-                            color: color,
-                            fillColor: fillColor,
-                            fillOpacity: 0.8,
-                            radius: 8,
-                            weight: 2
-                        }});
-                        
-                        const popupContent = createPopupContent(result);
-                        marker.bindPopup(popupContent, {{
-                            maxWidth: 400,
-                            className: 'custom-popup'
-                        }});
-                        
-                        marker.addTo(map);
-                        markers.push(marker);
-                    }}
-                }}
-            }});
-        }}
-
-        function createPopupContent(result) {{
-            const flagEmoji = getFlagEmoji(result.código_país);
-            const isSuspicious = result.status_vpn === 'Detectado' || 
-                               result.tor === 'Sim' || 
-                               result.hospedagem === 'Sim';
-            
-            return `
-                <div class="popup-header">
-                    ${{isSuspicious ? '⚠️ IP SUSPEITO' : '🔍 ANÁLISE DO IP'}}
-                </div>
-                
-                <div class="popup-section">
-                    <div class="popup-label">📍 Endereço IP:</div>
-                    <div class="popup-value popup-ip">${{result.ip}}${{result.porta ? ':' + result.porta : ''}}</div>
-                </div>
-                
-                ${{result.data || result.hora || result.utc ? `
-                <div class="popup-section">
-                    <div class="popup-label">🕐 Data/Hora:</div>
-                    <div class="popup-value">
-                        ${{result.data ? result.data + ' ' : ''}}${{result.hora ? 'às ' + result.hora + ' ' : ''}}${{result.utc ? '(' + result.utc + ')' : ''}}
-                    </div>
-                </div>
-                ` : ''}}
-                
-                <div class="popup-section">
-                    <div class="popup-label">🌍 Localização:</div>
-                    <div class="popup-value popup-country">${{flagEmoji}} ${{result.país || 'Desconhecido'}}</div>
-                    ${{result.cidade && result.cidade !== 'Desconhecido' ? `<div class="popup-value">📍 ${{result.cidade}}</div>` : ''}}
-                </div>
-                
-                <div class="popup-section">
-                    <div class="popup-label">🏢 Provedor de Internet:</div>
-                    <div class="popup-value"><strong>${{result.provedor || 'Desconhecido'}}</strong></div>
-                    ${{result.organização && result.organização !== result.provedor ? `<div class="popup-value" style="font-size: 0.8em; color: #888;">Org: ${{result.organização}}</div>` : ''}}
-                </div>
-                
-                <div class="popup-section">
-                    <div class="popup-label">🔒 Análise de Segurança:</div>
-                    <div class="popup-value">
-                        <strong>VPN/Proxy:</strong> <span class="${{result.status_vpn === 'Detectado' ? 'popup-alert' : 'popup-safe'}}">${{result.status_vpn || 'Indeterminado'}}</span><br>
-                        <strong>Tipo de Conexão:</strong> ${{result.tipo_conexão || 'Indeterminado'}}<br>
-                        ${{result.tor === 'Sim' ? '<span class="popup-alert">🚨 <strong>Rede Tor Detectada!</strong></span><br>' : ''}}
-                        ${{result.hospedagem === 'Sim' ? '<span class="popup-alert">🏢 <strong>Datacenter/Hospedagem</strong></span><br>' : ''}}
-                        ${{result.conexão_móvel === 'Sim' ? '📱 <strong>Conexão Móvel</strong><br>' : ''}}
-                    </div>
-                </div>
-                
-                <div class="popup-section" style="border-bottom: none;">
-                    <div class="popup-label">📊 Detalhes Técnicos:</div>
-                    <div class="popup-value">
-                        <strong>Versão IP:</strong> ${{result.ip_version}}<br>
-                        <strong>AS Number:</strong> ${{result.AS || 'N/A'}}<br>
-                        ${{result.região && result.região !== 'Desconhecido' ? '<strong>Região:</strong> ' + result.região : ''}}
-                    </div>
-                </div>
-                
-                ${{isSuspicious ? `
-                <div style="margin-top: 10px; padding: 8px; background: #f8d7da; border-radius: 5px; border-left: 4px solid #dc3545;">
-                    <strong style="color: #721c24;">⚠️ Recomendação:</strong><br>
-                    <span style="color: #721c24; font-size: 0.85em;">Este IP requer investigação adicional devido aos indicadores de risco detectados.</span>
-                </div>
-                ` : ''}}
-            `;
-        }}
-
-        function getFlagEmoji(countryCode) {{
-            const flags = {{
-                'BR': '🇧🇷', 'US': '🇺🇸', 'CN': '🇨🇳', 'RU': '🇷🇺', 'DE': '🇩🇪',
-                'FR': '🇫🇷', 'GB': '🇬🇧', 'JP': '🇯🇵', 'KR': '🇰🇷', 'IN': '🇮🇳',
-                'CA': '🇨🇦', 'AU': '🇦🇺', 'IT': '🇮🇹', 'ES': '🇪🇸', 'NL': '🇳🇱',
-                'SE': '🇸🇪', 'NO': '🇳🇴', 'CH': '🇨🇭', 'SG': '🇸🇬', 'HK': '🇭🇰'
-            }};
-            return flags[countryCode] || '🌍';
-        }}
-
-        function populateFilters() {{
-            populateCountryFilter();
-            populateProviderFilter();
-        }}
-
-        function populateCountryFilter() {{
-            const countryFilter = document.getElementById('country-filter');
-            const countries = [...new Set(allResults.map(r => r.país))].sort();
-            countries.forEach(country => {{
-                if (country && country !== 'Erro na consulta') {{
-                    const option = document.createElement('option');
-                    option.value = country;
-                    option.textContent = country;
-                    countryFilter.appendChild(option);
-                }}
-            }});
-        }}
-
-        function populateProviderFilter() {{
-            const providerFilter = document.getElementById('provider-filter');
-            const providers = [...new Set(allResults.map(r => r.provedor))].sort();
-            providers.forEach(provider => {{
-                if (provider && provider !== 'Erro na consulta') {{
-                    const option = document.createElement('option');
-                    option.value = provider;
-                    option.textContent = provider;
-                    providerFilter.appendChild(option);
-                }}
-            }});
-        }}
-
-        function displayResults(results) {{
-            const tbody = document.getElementById('results-tbody');
-            const noResults = document.getElementById('no-results');
-            
-            if (results.length === 0) {{
-                tbody.innerHTML = '';
-                noResults.style.display = 'block';
-                return;
-            }}
-            
-            noResults.style.display = 'none';
-            
-            tbody.innerHTML = results.map(result => {{
-                const vpnStatus = getVPNStatus(result);
-                const connectionStatus = getConnectionStatus(result);
-                
-                return `
-                    <tr>
-                        <td><span class="ip-version">${{result.ip}}</span></td>
-                        <td>${{result.porta || '-'}}</td>
-                        <td>${{result.data || '-'}}</td>
-                        <td>${{result.hora || '-'}}</td>
-                        <td>${{result.utc || '-'}}</td>
-                        <td><span class="status-badge status-info">${{result.ip_version}}</span></td>
-                        <td><span class="status-badge ${{vpnStatus.class}}">${{vpnStatus.text}}</span></td>
-                        <td><span class="status-badge ${{connectionStatus.class}}">${{connectionStatus.text}}</span></td>
-                        <td>${{result.país || 'N/A'}}</td>
-                        <td>${{result.cidade || 'N/A'}}</td>
-                        <td>${{result.provedor || 'N/A'}}</td>
-                        <td>${{result.organização || 'N/A'}}</td>
-                        <td>${{result.AS || 'N/A'}}</td>
-                    </tr>
-                `;
-            }}).join('');
-        }}
-
-        function getVPNStatus(result) {{
-            if (result.status_vpn === 'Detectado') {{
-                return {{ class: 'status-danger', text: 'Detectado' }};
-            }} else if (result.status_vpn === 'Não detectado') {{
-                return {{ class: 'status-safe', text: 'Não detectado' }};
-            }} else {{
-                return {{ class: 'status-warning', text: 'Indeterminado' }};
-            }}
-        }}
-
-        function getConnectionStatus(result) {{
-            if (result.tipo_conexão === 'Móvel') {{
-                return {{ class: 'status-warning', text: 'Móvel' }};
-            }} else if (result.tipo_conexão === 'Fixa') {{
-                return {{ class: 'status-safe', text: 'Fixa' }};
-            }} else {{
-                return {{ class: 'status-info', text: 'Indeterminado' }};
-            }}
-        }}
-
-        function applyFilters() {{
-            const vpnFilter = document.getElementById('vpn-filter').value;
-            const connectionFilter = document.getElementById('connection-filter').value;
-            const countryFilter = document.getElementById('country-filter').value;
-            const providerFilter = document.getElementById('provider-filter').value;
-            const searchIP = document.getElementById('search-ip').value.toLowerCase();
-
-            filteredResults = allResults.filter(result => {{
-                const matchVPN = !vpnFilter || result.status_vpn === vpnFilter;
-                const matchConnection = !connectionFilter || result.tipo_conexão === connectionFilter;
-                const matchCountry = !countryFilter || result.país === countryFilter;
-                const matchProvider = !providerFilter || result.provedor === providerFilter;
-                const matchIP = !searchIP || result.ip.toLowerCase().includes(searchIP);
-
-                return matchVPN && matchConnection && matchCountry && matchProvider && matchIP;
-            }});
-
-            displayResults(filteredResults);
-            updateMapMarkers(filteredResults);
-            generateOficioButtons();
-        }}
-
-        function clearFilters() {{
-            document.getElementById('vpn-filter').value = '';
-            document.getElementById('connection-filter').value = '';
-            document.getElementById('country-filter').value = '';
-            document.getElementById('provider-filter').value = '';
-            document.getElementById('search-ip').value = '';
-            
-            filteredResults = allResults;
-            displayResults(allResults);
-            updateMapMarkers(allResults);
-            generateOficioButtons();
-        }}
-
-        function generateOficioButtons() {{
-            const oficiosContainer = document.getElementById('oficios-buttons');
-            
-            const groupedByProvider = {{}};
-            filteredResults.forEach(result => {{
-                const provider = result.provedor || 'Provedor Desconhecido';
-                if (!groupedByProvider[provider]) {{
-                    groupedByProvider[provider] = [];
-                }}
-                groupedByProvider[provider].push(result);
-            }});
-
-            oficiosContainer.innerHTML = '';
-            Object.keys(groupedByProvider).forEach(provider => {{
-                if (provider !== 'Erro na consulta') {{
-                    const button = document.createElement('button');
-                    button.className = 'btn btn-oficio';
-                    button.textContent = `📄 Gerar Ofício - ${{provider}} (${{groupedByProvider[provider].length}} IPs)`;
-                    button.onclick = () => generateOficio(provider, groupedByProvider[provider]);
-                    oficiosContainer.appendChild(button);
-                }}
-            }});
-        }}
-
-        function generateOficio(provider, ips) {{
-            const tipoProcedimento = document.getElementById('tipo-procedimento').value || '[TIPO DE PROCEDIMENTO]';
-            const numeroProcedimento = document.getElementById('numero-procedimento').value || '[NÚMERO DO PROCEDIMENTO]';
-            const prazo = document.getElementById('prazo-resposta').value || '[PRAZO]';
-            const email = document.getElementById('email-resposta').value || '[EMAIL DE RESPOSTA]';
-
-            let ipsText = '';
-            ips.forEach((ip, index) => {{
-                let linha = `${{index + 1}}. IP: ${{ip.ip}}`;
-                
-                if (ip.porta && ip.porta.trim() !== '') {{
-                    linha += `, Porta: ${{ip.porta}}`;
-                }}
-                
-                if (ip.data && ip.data.trim() !== '') {{
-                    linha += `, Data: ${{ip.data}}`;
-                }}
-                
-                if (ip.hora && ip.hora.trim() !== '') {{
-                    linha += `, Horário: ${{ip.hora}}`;
-                }}
-                
-                if (ip.utc && ip.utc.trim() !== '') {{
-                    linha += ` (${{ip.utc}})`;
-                }}
-                
-                ipsText += linha + '\\n';
-            }});
-
-            const oficioText = `Senhor Diretor da ${{provider}},
-
-Visando instruir o ${{tipoProcedimento}} nº ${{numeroProcedimento}}, na qualidade de Delegado(a) de Polícia Civil, no exercício das atribuições que me conferem os art. 144, § 4º, da CF c/c art. 2º, §2º, da Lei 12.830/2013, e com fundamento nos arts. 10, §3º e 15, da Lei 12.965/2014 c/c art. 17-B da Lei 9.613/98 e art. 15 da Lei 12.850/2013, requisito, no prazo de ${{prazo}}, os dados cadastrais vinculados ao(s) IP(s):
-
-${{ipsText}}
-Adicionalmente, requisito, com base no art. 15, § 1º, da Lei nº 12.965/2014, a preservação do conteúdo das comunicações privadas e de todos os registros de conexão e de acesso a aplicações de internet relacionados ao(s) identificador(es) acima mencionado(s), pelo período de 1 (um) ano, a partir da data desta comunicação, a fim de viabilizar futura ordem judicial para acesso ao seu conteúdo.
-
-A investigação policial é sigilosa (art. 20 CPP) e, por isso, o usuário não deve ser notificado acerca das requisições policiais.
-
-Por fim, solicito que a resposta seja encaminhada para o e-mail ${{email}}.
-
-Atenciosamente,`;
-
-            document.getElementById('oficio-text').textContent = oficioText;
-            document.getElementById('oficio-generated').style.display = 'block';
-            currentOficio = oficioText;
-
-            document.getElementById('oficio-generated').scrollIntoView({{ behavior: 'smooth' }});
-        }}
-
-        function copyOficioToClipboard() {{
-            navigator.clipboard.writeText(currentOficio).then(function() {{
-                const successMsg = document.getElementById('copy-success');
-                successMsg.innerHTML = '✅ Ofício copiado com sucesso!';
-                successMsg.style.display = 'block';
-                setTimeout(() => {{
-                    successMsg.style.display = 'none';
-                }}, 3000);
-            }});
-        }}
-
-        function downloadOficio() {{
-            const provider = 'Oficio_' + new Date().toISOString().slice(0,10);
-            const filename = `${{provider}}.txt`;
-            downloadFile(currentOficio, filename, 'text/plain');
-        }}
-
-        function copyTableToClipboard() {{
-            let htmlTable = `
-            <table border="1" style="border-collapse: collapse; width: 100%; font-family: Arial, sans-serif;">
-                <thead>
-                    <tr style="background-color: #667eea; color: white;">
-                        <th style="padding: 8px; text-align: left;">IP</th>
-                        <th style="padding: 8px; text-align: left;">Porta</th>
-                        <th style="padding: 8px; text-align: left;">Data</th>
-                        <th style="padding: 8px; text-align: left;">Hora</th>
-                        <th style="padding: 8px; text-align: left;">UTC</th>
-                        <th style="padding: 8px; text-align: left;">Versão</th>
-                        <th style="padding: 8px; text-align: left;">VPN/Proxy</th>
-                        <th style="padding: 8px; text-align: left;">Tipo Conexão</th>
-                        <th style="padding: 8px; text-align: left;">País</th>
-                        <th style="padding: 8px; text-align: left;">Cidade</th>
-                        <th style="padding: 8px; text-align: left;">Provedor</th>
-                        <th style="padding: 8px; text-align: left;">Organização</th>
-                        <th style="padding: 8px; text-align: left;">AS</th>
-                    </tr>
-                </thead>
-                <tbody>`;
-            
-            filteredResults.forEach((result, index) => {{
-                const vpnText = result.status_vpn || 'N/A';
-                const connectionText = result.tipo_conexão || 'N/A';
-                const rowStyle = index % 2 === 0 ? 'background-color: #f8f9fa;' : 'background-color: white;';
-                
-                htmlTable += `
-                    <tr style="${{rowStyle}}">
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.ip}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.porta || '-'}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.data || '-'}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.hora || '-'}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.utc || '-'}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.ip_version}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{vpnText}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{connectionText}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.país || 'N/A'}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.cidade || 'N/A'}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.provedor || 'N/A'}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.organização || 'N/A'}}</td>
-                        <td style="padding: 6px; border: 1px solid #ddd;">${{result.AS || 'N/A'}}</td>
-                    </tr>`;
-            }});
-            
-            htmlTable += `
-                </tbody>
-            </table>`;
-
-            const blob = new Blob([htmlTable], {{ type: 'text/html' }});
-            const clipboardItem = new ClipboardItem({{ 'text/html': blob }});
-            
-            navigator.clipboard.write([clipboardItem]).then(function() {{
-                const successMsg = document.getElementById('copy-success');
-                successMsg.innerHTML = '✅ Tabela copiada como HTML! Cole no Word para obter formatação perfeita';
-                successMsg.style.display = 'block';
-                setTimeout(() => {{
-                    successMsg.style.display = 'none';
-                }}, 4000);
-            }}).catch(function(err) {{
-                let tableText = 'IP\\tPorta\\tData\\tHora\\tUTC\\tVersão\\tVPN/Proxy\\tTipo Conexão\\tPaís\\tCidade\\tProvedor\\tOrganização\\tAS\\n';
-                
-                filteredResults.forEach(result => {{
-                    const vpnText = result.status_vpn || 'N/A';
-                    const connectionText = result.tipo_conexão || 'N/A';
-                    
-                    tableText += `${{result.ip}}\\t${{result.porta || '-'}}\\t${{result.data || '-'}}\\t${{result.hora || '-'}}\\t${{result.utc || '-'}}\\t${{result.ip_version}}\\t${{vpnText}}\\t${{connectionText}}\\t${{result.país || 'N/A'}}\\t${{result.cidade || 'N/A'}}\\t${{result.provedor || 'N/A'}}\\t${{result.organização || 'N/A'}}\\t${{result.AS || 'N/A'}}\\n`;
-                }});
-
-                const textArea = document.createElement('textarea');
-                textArea.value = tableText;
-                document.body.appendChild(textArea);
-                textArea.select();
-                document.execCommand('copy');
-                document.body.removeChild(textArea);
-                
-                const successMsg = document.getElementById('copy-success');
-                successMsg.innerHTML = '✅ Tabela copiada! No Word: Cole > Inserir > Tabela > Converter texto em tabela';
-                successMsg.style.display = 'block';
-                setTimeout(() => {{
-                    successMsg.style.display = 'none';
-                }}, 5000);
-            }});
-        }}
-
-        function exportToCSV() {{
-            const headers = ['IP', 'Porta', 'Data', 'Hora', 'UTC', 'Versão', 'VPN_Proxy', 'Tipo_Conexão', 'País', 'Cidade', 'Provedor', 'Organização', 'AS'];
-            
-            let csvContent = headers.join(',') + '\\n';
-            
-            filteredResults.forEach(result => {{
-                const row = [
-                    result.ip,
-                    result.porta || '',
-                    result.data || '',
-                    result.hora || '',
-                    result.utc || '',
-                    result.ip_version,
-                    `"${{result.status_vpn}}"`,
-                    `"${{result.tipo_conexão}}"`,
-                    `"${{result.país}}"`,
-                    `"${{result.cidade}}"`,
-                    `"${{result.provedor}}"`,
-                    `"${{result.organização}}"`,
-                    `"${{result.AS}}"`
-                ];
-                csvContent += row.join(',') + '\\n';
-            }});
-
-            downloadFile(csvContent, 'analise_ips_filtrada.csv', 'text/csv');
-        }}
-
-        function exportToJSON() {{
-            const jsonData = JSON.stringify(filteredResults, null, 2);
-            downloadFile(jsonData, 'analise_ips_filtrada.json', 'application/json');
-        }}
-
-        function downloadFile(content, fileName, contentType) {{
-            const blob = new Blob([content], {{ type: contentType }});
-            const url = window.URL.createObjectURL(blob);
-            const link = document.createElement('a');
-            link.href = url;
-            link.download = fileName;
-            document.body.appendChild(link);
-            link.click();
-            document.body.removeChild(link);
-            window.URL.revokeObjectURL(url);
-        }}
-
-        document.getElementById('search-ip').addEventListener('input', function() {{
-            applyFilters();
-        }});
-
-        window.addEventListener('resize', function() {{
-            setTimeout(function() {{
-                map.invalidateSize();
-            }}, 100);
-        }});
-    </script>
-</body>
-</html>'''
+        if position < total - 1:
+            _pause_after_network(calls_before)
+
+    return results
+
+def _check_batch_aggregated(entries, prefixes, sample_size, on_result=None, priority=None, reuse=None):
+    """
+    Consulta um IP representativo por bloco e replica o resultado para o
+    restante do bloco, marcando essas linhas como inferidas.
+    Uma amostra de outros IPs de cada bloco é consultada para conferir a
+    consistência; se divergir, todos os IPs do bloco são consultados.
+    Com priority, os blocos são consultados pela entrada mais urgente de
+    cada um, e essa entrada é a representativa do bloco.
+    Entradas em reuse não entram nos blocos.
+    """
+    total = len(entries)
+    results = new_result_list(total)
+    rng = random.Random(0)
+    lookups = []
+    reuse = reuse or {}
+    _publish_reused(results, reuse, on_result)
+    order, keys = _lookup_order(entries, priority)
+
+    def lookup(index):
+        if lookups:
+            _pause_after_network(lookups[-1])
+        lookups.append(lookup_counters['rede'])
+        return _analyze_entry(entries[index])
+
+    def publish(index, result):
+        results[index] = result
+        if on_result:
+            on_result(index, result)
+        if _progress:
+            _progress.advance()
+
+    # Entradas sem IP válido não consultam as APIs
+    for index, ip_data in enumerate(entries):
+        if not ip_data.get('ip_version') and index not in reuse:
+            publish(index, analyze_ip(ip_data))
+
+    blocks = group_entries_by_prefix(entries, *prefixes)
+    if reuse:
+        blocks = {block: [index for index in indices if index not in reuse] for block, indices in blocks.items()}
+        blocks = {block: indices for block, indices in blocks.items() if indices}
+    if keys:
+        rank = {index: position for position, index in enumerate(order)}
+        blocks = {block: sorted(indices, key=rank.__getitem__) for block, indices in blocks.items()}
+        blocks = dict(sorted(blocks.items(), key=lambda item: rank[item[1][0]]))
+
+    for block, indices in blocks.items():
+        by_ip = {}
+        for index in indices:
+            by_ip.setdefault(entries[index]['ip_canonical'], []).append(index)
+        block_ips = list(by_ip)
+
+        representative = block_ips[0]
+        checked = {representative: lookup(by_ip[representative][0])}
+        representative_result = checked[representative]
+        consistent = 'erro_ipapi' not in representative_result
+
+        for ip in rng.sample(block_ips[1:], min(sample_size, len(block_ips) - 1)):
+            checked[ip] = lookup(by_ip[ip][0])
+            if not _results_agree(representative_result, checked[ip]):
+                consistent = False
+
+        if not consistent and len(checked) < len(block_ips):
+            print(f"\nBloco {block} inconsistente - consultando todos os {len(block_ips)} IPs")
+
+        for ip, ip_indices in by_ip.items():
+            if ip not in checked and not consistent:
+                checked[ip] = lookup(ip_indices[0])
+            for index in ip_indices:
+                if ip in checked:
+                    publish(index, _copy_result(checked[ip], entries[index]))
+                else:
+                    publish(index, _copy_result(representative_result, entries[index], representative, block))
+
+    print(f"\nAgregação por prefixo: {len(lookups)} consultas para {total} entradas.")
+    return results
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+TEMPLATE_MARKER = re.compile(r'@@([A-Z_]+)@@')
+_templates = {}
+_template_parts = {}
+
+def _user_cache_dir():
+    """
+    Pasta de cache do usuário (LOCALAPPDATA no Windows, XDG_CACHE_HOME ou ~/.cache nos demais)
+    """
+    base = os.environ.get('LOCALAPPDATA') if os.name == 'nt' else os.environ.get('XDG_CACHE_HOME')
+    return os.path.join(base or os.path.join(os.path.expanduser('~'), '.cache'), 'buscadeprovedores')
+
+# Assets do dashboard: minificados uma vez e guardados com o hash do conteúdo
+# no cache do usuário (a pasta de instalação pode ser somente leitura)
+DASHBOARD_ASSETS = ('dashboard.css', 'dashboard.js')
+ASSET_CACHE_DIR = os.path.join(_user_cache_dir(), 'assets')
+REPORT_ASSET_DIR = 'assets'
+# Mudar ao alterar os minificadores, para invalidar o cache
+MINIFIER_VERSION = '1'
+_compiled_assets = {}
+
+def load_template(name):
+    """
+    Lê um modelo da pasta templates na primeira vez que é usado
+    """
+    if name not in _templates:
+        with open(os.path.join(TEMPLATE_DIR, name), 'r', encoding='utf-8') as f:
+            _templates[name] = f.read()
+    return _templates[name]
+
+def template_parts(name):
+    """
+    Divide o modelo em trechos fixos e marcadores, alternados
+    (posições pares são texto, ímpares são nomes de marcadores)
+    """
+    if name not in _template_parts:
+        _template_parts[name] = TEMPLATE_MARKER.split(load_template(name))
+    return _template_parts[name]
+
+def minify_css(text):
+    """
+    Remove comentários e espaços desnecessários do CSS
+    """
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r'([{;])\s*([-\w]+)\s*:\s*', r'\1\2:', text)
+    return text.replace(';}', '}').strip()
+
+_JS_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+
+def minify_js(text):
+    """
+    Minificação conservadora de JavaScript: remove comentários, indentação,
+    linhas em branco e espaços entre símbolos
+    Strings, template literals e expressões regulares são copiados como
+    estão, e as quebras de linha são mantidas (inserção automática de
+    ponto e vírgula).
+    """
+    out = []
+    # Profundidade de chaves de cada ${ } aberto dentro de template literals
+    templates = []
+    i, n = 0, len(text)
+
+    def last_significant():
+        for chunk in reversed(out):
+            stripped = chunk.rstrip()
+            if stripped:
+                return stripped[-1]
+        return ''
+
+    def copy_template(i):
+        # Copia o conteúdo do template literal até ` ou ${
+        start = i
+        while i < n:
+            if text[i] == '\\':
+                i += 2
+            elif text[i] == '`':
+                out.append(text[start:i + 1])
+                return i + 1
+            elif text.startswith('${', i):
+                out.append(text[start:i + 2])
+                templates.append(0)
+                return i + 2
+            else:
+                i += 1
+        out.append(text[start:])
+        return n
+
+    while i < n:
+        c = text[i]
+        if c in '"\'':
+            start = i
+            i += 1
+            while i < n and text[i] != c:
+                i += 2 if text[i] == '\\' else 1
+            out.append(text[start:i + 1])
+            i += 1
+        elif c == '`':
+            out.append('`')
+            i = copy_template(i + 1)
+        elif c == '}' and templates and templates[-1] == 0:
+            templates.pop()
+            out.append('}')
+            i = copy_template(i + 1)
+        elif c in '{}':
+            if templates:
+                templates[-1] += 1 if c == '{' else -1
+            out.append(c)
+            i += 1
+        elif text.startswith('//', i):
+            while i < n and text[i] != '\n':
+                i += 1
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+        elif c == '/' and (last_significant() in _JS_REGEX_PRECEDERS or not last_significant()):
+            start = i
+            i += 1
+            in_class = False
+            while i < n and (text[i] != '/' or in_class):
+                if text[i] == '\\':
+                    i += 1
+                elif text[i] == '[':
+                    in_class = True
+                elif text[i] == ']':
+                    in_class = False
+                i += 1
+            i += 1
+            while i < n and text[i].isalpha():
+                i += 1
+            out.append(text[start:i])
+        elif c.isspace():
+            start = i
+            while i < n and text[i].isspace():
+                i += 1
+            previous = out[-1][-1] if out and out[-1] else ''
+            following = text[i] if i < n else ''
+            if not previous or not following:
+                continue
+            if '\n' in text[start:i]:
+                if previous != '\n':
+                    out.append('\n')
+            elif (previous.isalnum() or previous in '_$') and (following.isalnum() or following in '_$'):
+                out.append(' ')
+            elif previous in '+-' and following in '+-':
+                out.append(' ')
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+def _write_file_atomic(path, text):
+    # Grava em arquivo temporário e renomeia: outro processo nunca lê um arquivo pela metade
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+def _prune_asset_cache(base, extension, current):
+    for filename in os.listdir(ASSET_CACHE_DIR):
+        if filename != current and filename.startswith(f"{base}.") and filename.endswith(f".min{extension}"):
+            try:
+                os.remove(os.path.join(ASSET_CACHE_DIR, filename))
+            except OSError:
+                pass
+
+def compiled_asset(name):
+    """
+    Versão minificada de um asset da pasta templates
+    A minificação é feita uma única vez: o resultado fica em ASSET_CACHE_DIR
+    com o hash do conteúdo no nome e é reaproveitado enquanto o asset não mudar;
+    ao gravar uma versão nova, as anteriores do mesmo asset são removidas.
+    Retorna (hash, texto minificado)
+    """
+    if name not in _compiled_assets:
+        source = load_template(name)
+        digest = hashlib.sha256((MINIFIER_VERSION + source).encode('utf-8')).hexdigest()[:16]
+        base, extension = os.path.splitext(name)
+        cache_file = os.path.join(ASSET_CACHE_DIR, f"{base}.{digest}.min{extension}")
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            text = minify_css(source) if extension == '.css' else minify_js(source)
+            try:
+                os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+                _write_file_atomic(cache_file, text)
+                _prune_asset_cache(base, extension, os.path.basename(cache_file))
+            except OSError:
+                # Pasta sem permissão de escrita: minifica de novo na próxima execução
+                pass
+        _compiled_assets[name] = (digest, text)
+    return _compiled_assets[name]
+
+def publish_dashboard_assets(output_file):
+    """
+    Grava os assets minificados na pasta assets/ ao lado do relatório (só os
+    que ainda não existem; o hash no nome do arquivo identifica a versão)
+    Retorna {asset: caminho relativo ao relatório}
+    """
+    directory = os.path.join(os.path.dirname(os.path.abspath(output_file)), REPORT_ASSET_DIR)
+    urls = {}
+    for name in DASHBOARD_ASSETS:
+        digest, text = compiled_asset(name)
+        base, extension = os.path.splitext(name)
+        filename = f"{base}.{digest}.min{extension}"
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            _write_file_atomic(path, text)
+        urls[name] = f"{REPORT_ASSET_DIR}/{filename}"
+    return urls
+
+def start_dashboard_assets(output_file, inline=False):
+    """
+    Prepara os assets do dashboard em segundo plano, enquanto as consultas
+    rodam; retorna a thread (publish_dashboard espera por ela)
+    """
+    target = (lambda: [compiled_asset(name) for name in DASHBOARD_ASSETS]) if inline else \
+        (lambda: publish_dashboard_assets(output_file))
+
+    def prepare():
+        try:
+            target()
+        except OSError:
+            # O relatório tenta de novo no final e informa o erro
+            pass
+
+    thread = threading.Thread(target=prepare, daemon=True)
+    thread.start()
+    return thread
+
+def _asset_tags(asset_urls=None):
+    if asset_urls:
+        return {
+            'style': f'<link rel="stylesheet" href="{html.escape(asset_urls["dashboard.css"])}">',
+            'script': f'<script src="{html.escape(asset_urls["dashboard.js"])}"></script>',
+        }
+    return {
+        'style': f'<style>{compiled_asset("dashboard.css")[1]}</style>',
+        'script': '<script>' + compiled_asset("dashboard.js")[1].replace('</script', '<\\/script') + '</script>',
+    }
+
+SCRIPT_JSON_BATCH = 2000
+
+# Dados do relatório em blocos: colunas com dicionário, deflate e base64
+PAYLOAD_CHUNK_ROWS = 2000
+PAYLOAD_COMPRESSION_LEVEL = 6
+
+_MISSING = object()
+
+def _column_key(value):
+    # Strings (a maioria) são a própria chave; nos demais o tipo entra na
+    # chave porque 1 e True são iguais em um dict
+    if value.__class__ is str or value is _MISSING:
+        return value
+    if isinstance(value, (dict, list)):
+        return 'json', json.dumps(value, sort_keys=True)
+    return type(value).__name__, value
+
+def encode_columns(rows):
+    """
+    Codifica uma lista de resultados por colunas: {'n': linhas, 'c': {campo: coluna}}
+    Colunas com poucos valores distintos viram dicionário ({'d': valores,
+    'i': índice de cada linha, -1 se o campo não existe na linha}); as
+    demais guardam os valores em ordem ({'v': valores})
+    """
+    fields = {}
+    for row in rows:
+        fields.update(dict.fromkeys(row))
+
+    columns = {}
+    for field in fields:
+        column = [row.get(field, _MISSING) for row in rows]
+        keys = [_column_key(value) for value in column]
+        values_by_key = dict(zip(keys, column))
+        values_by_key.pop(_MISSING, None)
+        if len(values_by_key) > len(rows) // 2 and _MISSING not in keys:
+            columns[field] = {'v': column}
+            continue
+        positions = {key: position for position, key in enumerate(values_by_key)}
+        positions[_MISSING] = -1
+        columns[field] = {'d': list(values_by_key.values()), 'i': [positions[key] for key in keys]}
+    return {'n': len(rows), 'c': columns}
+
+def _batches(items, size):
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def encode_payload_chunks(results, chunk_rows=PAYLOAD_CHUNK_ROWS):
+    """
+    Gera os blocos de dados do relatório: cada bloco de chunk_rows
+    resultados é codificado por colunas, comprimido (deflate/zlib) e
+    convertido para base64; o navegador descomprime com DecompressionStream
+    """
+    for batch in _batches(results, chunk_rows):
+        encoded = json.dumps(encode_columns(batch), ensure_ascii=False,
+                             separators=(',', ':')).encode('utf-8')
+        yield base64.b64encode(zlib.compress(encoded, PAYLOAD_COMPRESSION_LEVEL)).decode('ascii')
+
+def _write_payload_chunks(out, results):
+    out.write('[')
+    for position, chunk in enumerate(encode_payload_chunks(results)):
+        out.write(',"' if position else '"')
+        out.write(chunk)
+        out.write('"')
+    out.write(']')
+
+def _script_json(value):
+    # JSON embutido em <script>: sem espaços e sem "</" (que fecharia a tag)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+def _write_script_json(out, value):
+    """
+    Escreve value como JSON; listas são serializadas em lotes de
+    SCRIPT_JSON_BATCH itens, sem montar o texto inteiro em memória
+    """
+    if not isinstance(value, (list, ResultSpill)):
+        out.write(_script_json(value))
+        return
+    out.write('[')
+    for position, batch in enumerate(_batches(value, SCRIPT_JSON_BATCH)):
+        if position:
+            out.write(',')
+        out.write(_script_json(batch)[1:-1])
+    out.write(']')
+
+# Cadastro de provedores e contatos para os ofícios
+PROVIDER_DIRECTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'provedores.json')
+PROVIDER_FUZZY_CUTOFF = 0.88
+PROVIDER_CONTACT_FIELDS = ('contato', 'email', 'endereco', 'observacao')
+# Forma societária e conectivos ignorados ao comparar nomes ("Telefônica Brasil S/A" = "TELEFONICA BRASIL SA")
+PROVIDER_NAME_STOPWORDS = frozenset({'s', 'a', 'sa', 'ltda', 'eireli', 'me', 'epp', 'inc', 'llc', 'ltd', 'limited',
+                                     'corp', 'corporation', 'co', 'de', 'da', 'do', 'das', 'dos', 'e'})
+# Valores de provedor que não viram destinatário de ofício
+PROVIDER_PLACEHOLDERS = ('Erro na consulta', 'Desconhecido', 'Provedor Desconhecido')
+
+def normalize_provider_name(name):
+    text = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(word for word in re.split(r'[^a-z0-9]+', text) if word and word not in PROVIDER_NAME_STOPWORDS)
+
+class ProviderDirectory:
+    """
+    Cadastro local de provedores e seus contatos para ofícios
+    Índices pelo nome normalizado (nome e variantes, sem acentos,
+    pontuação e forma societária) e pelo número do AS. resolve() devolve o
+    destinatário do ofício: o nome do cadastro, quando o AS ou o nome
+    (exato ou aproximado, com difflib) casam; senão, a primeira grafia
+    vista do mesmo nome normalizado, para juntar as variantes. Cada par
+    (provedor, AS) e cada busca aproximada são resolvidos uma única vez.
+    """
+
+    def __init__(self, entries=()):
+        self.entries = {}
+        self.by_name = {}
+        self.by_asn = {}
+        for entry in entries:
+            name = entry['nome']
+            self.entries[name] = entry
+            for variant in (name, *entry.get('variantes', ())):
+                self.by_name.setdefault(normalize_provider_name(variant), name)
+            for asn in entry.get('asns', ()):
+                self.by_asn.setdefault(re.sub(r'^AS', '', str(asn).strip().upper()), name)
+        self.names = list(self.by_name)
+        self.fuzzy = {}
+        self.spellings = {}
+        self.resolved = {}
+
+    @classmethod
+    def load(cls, path=PROVIDER_DIRECTORY_FILE):
+        """
+        Lê o cadastro em JSON ({"provedores": [{"nome", "asns", "variantes", "email"...}]})
+        Sem o arquivo padrão, o cadastro fica vazio e só as variantes de grafia são unificadas
+        """
+        if path == PROVIDER_DIRECTORY_FILE and not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entries = data.get('provedores', []) if isinstance(data, dict) else data
+        if not all(isinstance(entry, dict) and entry.get('nome') for entry in entries):
+            raise ValueError(f"Cadastro de provedores inválido em {path}: toda entrada precisa de 'nome'")
+        return cls(entries)
+
+    def __getstate__(self):
+        return {'entries': list(self.entries.values())}
+
+    def __setstate__(self, state):
+        self.__init__(state['entries'])
+
+    def match(self, provider, as_field=None):
+        """
+        Nome do cadastro para o provedor: pelo AS, pelo nome normalizado ou
+        pelo nome mais parecido (PROVIDER_FUZZY_CUTOFF); None se nenhum casar
+        """
+        asn = _as_number(as_field)
+        if asn and asn[2:] in self.by_asn:
+            return self.by_asn[asn[2:]]
+        key = normalize_provider_name(provider)
+        if key in self.by_name:
+            return self.by_name[key]
+        if key not in self.fuzzy:
+            import difflib
+            close = difflib.get_close_matches(key, self.names, n=1, cutoff=PROVIDER_FUZZY_CUTOFF) if key else []
+            self.fuzzy[key] = self.by_name[close[0]] if close else None
+        return self.fuzzy[key]
+
+    def resolve(self, provider, as_field=None):
+        if not provider or provider in PROVIDER_PLACEHOLDERS:
+            return provider
+        cache_key = (provider, as_field)
+        name = self.resolved.get(cache_key)
+        if name is None:
+            name = self.match(provider, as_field)
+            if name is None:
+                name = self.spellings.setdefault(normalize_provider_name(provider) or provider, provider)
+            self.resolved[cache_key] = name
+        return name
+
+    def contact(self, name):
+        entry = self.entries.get(name, {})
+        return {field: entry[field] for field in PROVIDER_CONTACT_FIELDS if entry.get(field)}
+
+# Cadastro ativo (carregado na primeira consulta, se não configurado)
+_provider_directory = None
+
+def configure_provider_directory(path=PROVIDER_DIRECTORY_FILE):
+    global _provider_directory
+    _provider_directory = ProviderDirectory.load(path)
+    return _provider_directory
+
+def provider_directory():
+    return _provider_directory or configure_provider_directory()
+
+# Resumos calculados em uma única passada sobre os resultados
+AGGREGATE_FIELDS = {'país': 'por_pais', 'provedor': 'por_provedor', 'AS': 'por_as',
+                    'tipo_conexão': 'por_tipo_conexao', 'status_vpn': 'por_status_vpn'}
+HISTOGRAM_BUCKET = 3600
+
+class ResultAggregates:
+    """
+    Contagens por país, provedor, AS, tipo de conexão e status de VPN,
+    histograma por hora (UTC) e IPs distintos por provedor, acumulados
+    resultado a resultado (add) em uma única passada; as contagens por
+    destinatário de ofício saem das contagens por provedor
+    Alimenta os totais do dashboard, os filtros e botões de ofício da
+    página, o índice dos relatórios divididos e as saídas em JSON.
+    """
+
+    def __init__(self, results=(), bucket=HISTOGRAM_BUCKET):
+        self.bucket = bucket
+        self.total = 0
+        self.mobile = 0
+        self.fixed = 0
+        self.counts = {field: Counter() for field in AGGREGATE_FIELDS}
+        self.histogram = Counter()
+        self.provider_ips = {}
+        self.provider_as = {}
+        self.first = None
+        self.last = None
+        self._groups = None
+        self._summary = None
+        self.update(results)
+
+    def update(self, results):
+        self._groups = self._summary = None
+        counts = [(field, self.counts[field]) for field in AGGREGATE_FIELDS]
+        histogram = self.histogram
+        provider_ips = self.provider_ips
+        provider_as = self.provider_as
+        bucket = self.bucket
+        for result in results:
+            self.total += 1
+            for field, counter in counts:
+                counter[result.get(field) or 'Desconhecido'] += 1
+            mobile = result.get('conexão_móvel')
+            if mobile == 'Sim':
+                self.mobile += 1
+            elif mobile == 'Não':
+                self.fixed += 1
+            timestamp = result.get('timestamp')
+            if timestamp is not None:
+                histogram[timestamp - timestamp % bucket] += 1
+                if self.first is None or timestamp < self.first:
+                    self.first = timestamp
+                if self.last is None or timestamp > self.last:
+                    self.last = timestamp
+            provider = result.get('provedor') or 'Desconhecido'
+            ips = provider_ips.get(provider)
+            if ips is None:
+                ips = provider_ips[provider] = {}
+                provider_as[provider] = result.get('AS')
+            ips[result.get('ip')] = None
+        return self
+
+    def add(self, result):
+        return self.update((result,))
+
+    def _known(self, field):
+        return [value for value in self.counts[field] if value != 'Erro na consulta']
+
+    def distinct_ips(self):
+        return len({ip for ips in self.provider_ips.values() for ip in ips})
+
+    def period(self):
+        """
+        Primeiro e último instante UTC (ISO) dos resultados com horário
+        """
+        if self.first is None:
+            return None
+        return [datetime.fromtimestamp(instant, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+                for instant in (self.first, self.last)]
+
+    def stats(self):
+        """
+        Totais exibidos no topo do dashboard e no índice dos relatórios divididos
+        """
+        return {
+            'total_ips': self.total,
+            'vpn_detected': self.counts['status_vpn']['Detectado'],
+            'mobile_connections': self.mobile,
+            'fixed_connections': self.fixed,
+            'unique_countries': len(self._known('país')),
+            'unique_providers': len(self._known('provedor')),
+        }
+
+    def provider_groups(self, directory=None):
+        """
+        Destinatário do ofício de cada provedor ({provedor: destinatário}), pelo cadastro de provedores
+        """
+        if directory is None and self._groups is not None:
+            return self._groups
+        groups = {provider: (directory or provider_directory()).resolve(provider, self.provider_as.get(provider))
+                  for provider in self.counts['provedor']}
+        if directory is None:
+            self._groups = groups
+        return groups
+
+    def to_dict(self):
+        """
+        Resumo serializável (embutido no relatório e usado nas saídas JSON)
+        Calculado uma vez e reaproveitado até o próximo update
+        """
+        if self._summary is not None:
+            return self._summary
+        summary = {'total': self.total, 'ips_distintos': self.distinct_ips(), 'periodo_utc': self.period()}
+        summary.update(self.stats())
+        for field, key in AGGREGATE_FIELDS.items():
+            summary[key] = dict(self.counts[field].most_common())
+        summary['por_hora_utc'] = {datetime.fromtimestamp(slot, timezone.utc).strftime('%Y-%m-%dT%H:00Z'): count
+                                   for slot, count in sorted(self.histogram.items())}
+        summary['ips_por_provedor'] = {provider: list(ips) for provider, ips in self.provider_ips.items()}
+        recipients = Counter()
+        for provider, recipient in self.provider_groups().items():
+            if recipient not in PROVIDER_PLACEHOLDERS:
+                recipients[recipient] += self.counts['provedor'][provider]
+        summary['por_destinatario'] = dict(recipients.most_common())
+        self._summary = summary
+        return summary
+
+# Grupos de pontos do mapa, pré-calculados por nível de zoom
+MAP_CLUSTER_MAX_ZOOM = 16   # nível mais fino; acima dele a página reaproveita os grupos deste nível
+MAP_CLUSTER_CELL_BITS = 2   # células de 64 px: 4 x 4 por bloco de 256 px do mapa
+MAP_MAX_LATITUDE = 85.0511287798
+MAP_COORDINATE_DIGITS = 5
+
+def map_category(result):
+    """
+    Categoria do marcador, na ordem das cores do mapa: 0 VPN/proxy, 1 móvel, 2 indeterminado, 3 fixa
+    """
+    if result.get('status_vpn') == 'Detectado':
+        return 0
+    if result.get('tipo_conexão') == 'Móvel':
+        return 1
+    if result.get('status_vpn') == 'Indeterminado' or result.get('tipo_conexão') == 'Indeterminado':
+        return 2
+    return 3
+
+def _map_coordinate(value):
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+class MapClusters:
+    """
+    Pirâmide de grupos de pontos do mapa (quadtree sobre a grade Web Mercator)
+    Cada resultado com coordenadas cai numa célula de 64 px do nível mais fino
+    (MAP_CLUSTER_MAX_ZOOM); cada nível acima junta as células quatro a quatro.
+    Um grupo guarda a célula, o centro médio, o total e as contagens por
+    categoria de marcador (map_category). A página desenha só os grupos do
+    zoom atual; com filtros, refaz as contagens a partir da célula de cada
+    resultado (points), sem reler as coordenadas.
+    """
+
+    def __init__(self, results=(), max_zoom=MAP_CLUSTER_MAX_ZOOM):
+        self.max_zoom = max_zoom
+        self.cells = {}
+        self.points = array('l')
+        self.update(results)
+
+    def update(self, results):
+        cells = self.cells
+        points = self.points
+        scale = 1 << (self.max_zoom + MAP_CLUSTER_CELL_BITS)
+        # Resultados do mesmo IP repetem as coordenadas: a célula é calculada uma vez por par
+        known = {}
+        for result in results:
+            coordinates = (result.get('latitude'), result.get('longitude'))
+            located = known.get(coordinates)
+            if located is None:
+                latitude, longitude = _map_coordinate(coordinates[0]), _map_coordinate(coordinates[1])
+                if latitude is None or longitude is None:
+                    points.append(-1)
+                    continue
+                latitude = max(-MAP_MAX_LATITUDE, min(MAP_MAX_LATITUDE, latitude))
+                sine = math.sin(math.radians(latitude))
+                x = min(scale - 1, max(0, int((longitude + 180) / 360 * scale)))
+                y = min(scale - 1, max(0, int((0.5 - math.log((1 + sine) / (1 - sine)) / (4 * math.pi)) * scale)))
+                cell = cells.get((x, y))
+                if cell is None:
+                    cell = cells[(x, y)] = [len(cells), 0.0, 0.0, 0, 0, 0, 0]
+                located = known[coordinates] = (cell, latitude, longitude)
+            cell, latitude, longitude = located
+            cell[1] += latitude
+            cell[2] += longitude
+            cell[3 + map_category(result)] += 1
+            points.append(cell[0])
+        return self
+
+    def levels(self):
+        """
+        Grupos de cada nível, do zoom 0 ao mais fino, em listas planas de
+        [x, y, latitude, longitude, total, vpn, móvel, indeterminado, fixa]
+        No nível mais fino os grupos seguem a ordem das células
+        """
+        level = [[x, y, cell[1], cell[2]] + cell[3:] for (x, y), cell in self.cells.items()]
+        levels = [level]
+        for _ in range(self.max_zoom):
+            parents = {}
+            for x, y, *sums in level:
+                key = (x >> 1, y >> 1)
+                parent = parents.get(key)
+                if parent is None:
+                    parents[key] = [key[0], key[1]] + sums
+                else:
+                    for position, value in enumerate(sums, 2):
+                        parent[position] += value
+            level = list(parents.values())
+            levels.append(level)
+        flat_levels = []
+        for level in reversed(levels):
+            flat = []
+            for x, y, latitude, longitude, *counts in level:
+                total = sum(counts)
+                flat += [x, y, round(latitude / total, MAP_COORDINATE_DIGITS),
+                         round(longitude / total, MAP_COORDINATE_DIGITS), total] + counts
+            flat_levels.append(flat)
+        return flat_levels
+
+    def to_dict(self):
+        """
+        Pirâmide serializável: os grupos de cada nível e, compactada em base64,
+        a célula de cada resultado (número da célula + 1; 0 sem coordenadas)
+        """
+        packed = array('H' if len(self.cells) < 0xFFFF else 'I', (cell + 1 for cell in self.points))
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        return {'zoom': self.max_zoom, 'bits': MAP_CLUSTER_CELL_BITS, 'largura': packed.itemsize,
+                'pontos': base64.b64encode(packed.tobytes()).decode('ascii'), 'niveis': self.levels()}
+
+def write_html_dashboard(out, results, live_source=None, case_number=None, asset_urls=None, compress=False,
+                         aggregates=None):
+    """
+    Escreve o dashboard em out (arquivo ou buffer de texto)
+    O modelo é fixo; a cada relatório só os dados são gerados, e a lista de
+    resultados é serializada direto em out, sem montar o documento inteiro
+    em memória. Com asset_urls, CSS e JS são referenciados por esses
+    caminhos; sem, vão embutidos na página. Com compress, os resultados vão
+    em blocos comprimidos (encode_payload_chunks) decodificados sob demanda
+    pela página. Os grupos de pontos do mapa (MapClusters) vão sempre
+    prontos: o mapa abre completo antes de os blocos serem decodificados.
+    Com live_source, a página consulta periodicamente essa URL e acrescenta
+    os novos resultados sem redesenhar o que já foi exibido
+    aggregates, quando informado, é o resumo já calculado desses resultados
+    """
+    if aggregates is None:
+        aggregates = ResultAggregates(results)
+    values = aggregates.stats()
+    groups = aggregates.provider_groups()
+    contacts = {recipient: provider_directory().contact(recipient) for recipient in set(groups.values())}
+    values.update({
+        'aggregates_json': aggregates.to_dict(),
+        # Variantes de um mesmo provedor viram um único ofício, com o contato do cadastro
+        'providers_json': {
+            'grupos': {provider: recipient for provider, recipient in groups.items() if recipient != provider},
+            'contatos': {recipient: contact for recipient, contact in contacts.items() if contact},
+        },
+        'results_json': [] if compress else results,
+        'data_chunks_json': results if compress else None,
+        'live_source_json': live_source,
+        # Com blocos comprimidos a página monta o índice temporal ao decodificar
+        'time_index_json': {'ts': [], 'pos': []} if compress else TimeIndex(results).to_dict(),
+        'map_clusters_json': MapClusters(results).to_dict(),
+        'case_number_value': html.escape(case_number or '', quote=True),
+        'generated_at': datetime.now().strftime("%d/%m/%Y às %H:%M:%S"),
+    })
+    values.update(_asset_tags(asset_urls))
+
+    for position, part in enumerate(template_parts('dashboard.html')):
+        if position % 2 == 0:
+            out.write(part)
+        elif part == 'DATA_CHUNKS_JSON' and compress:
+            _write_payload_chunks(out, results)
+        elif part.endswith('_JSON'):
+            _write_script_json(out, values[part.lower()])
+        else:
+            out.write(str(values[part.lower()]))
+
+def generate_html_dashboard(results, output_file="dashboard_ips.html", case_number=None, inline_assets=False,
+                            compress=True, aggregates=None):
+    """
+    Grava o dashboard em output_file
+    Por padrão CSS e JS ficam em arquivos separados na pasta assets/ ao
+    lado do relatório (compartilhados entre relatórios); com inline_assets
+    o relatório é um único arquivo autocontido. Com compress (padrão) os
+    dados vão em blocos comprimidos; sem, em JSON simples.
+    """
+    asset_urls = None if inline_assets else publish_dashboard_assets(output_file)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        write_html_dashboard(f, results, case_number=case_number, asset_urls=asset_urls, compress=compress,
+                             aggregates=aggregates)
     
+    return output_file
+
+# Relatórios divididos por provedor ou país (os resultados de uma análise são todos do mesmo caso)
+SPLIT_FIELDS = {'provedor': 'provedor', 'pais': 'país'}
+REPORT_PAGE_ROWS = 20000
+
+def _slugify(text):
+    normalized = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', normalized.lower()).strip('-')[:60] or 'sem-nome'
+
+def split_results(results, field, provider_groups=None):
+    """
+    Agrupa os resultados por provedor ou país em uma única passada
+    Por provedor, provider_groups ({provedor: destinatário}, de
+    ResultAggregates.provider_groups) evita resolver o cadastro de novo.
+    Retorna {nome: ([posições], ResultAggregates do grupo)}, do maior grupo
+    para o menor
+    """
+    key = SPLIT_FIELDS[field]
+    default = 'Desconhecido'
+    # Por provedor, as variantes de grafia e do cadastro vão para o mesmo grupo
+    resolve = None
+    if field == 'provedor':
+        resolve = ((lambda name, asn: provider_groups.get(name) or provider_directory().resolve(name, asn))
+                   if provider_groups else provider_directory().resolve)
+    groups = {}
+    for position, result in enumerate(results):
+        name = str(result.get(key) or default)
+        if resolve:
+            name = resolve(name, result.get('AS'))
+        group = groups.get(name)
+        if group is None:
+            group = groups[name] = ([], ResultAggregates())
+        group[0].append(position)
+        group[1].add(result)
+    return dict(sorted(groups.items(), key=lambda item: (-len(item[1][0]), item[0])))
+
+def fill_template(name, values):
+    """
+    Preenche os marcadores @@NOME@@ de um modelo pequeno (chaves em minúsculas)
+    """
+    return ''.join(part if position % 2 == 0 else str(values[part.lower()])
+                   for position, part in enumerate(template_parts(name)))
+
+# Resultados em disco compartilhados com os processos que renderizam as partes
+_report_source = None
+
+def _init_report_worker(results, directory=None):
+    global _report_source, _provider_directory
+    _report_source = results
+    _provider_directory = directory
+
+def _render_report_file(results, output_file, case_number, inline_assets, compress, aggregates=None):
+    # Roda nos processos do pool; os assets já foram publicados pelo processo principal
+    # Com ResultSpill, results traz só as posições, lidas do arquivo neste processo
+    # Grupos de uma única parte trazem o resumo calculado em split_results
+    if _report_source is not None:
+        results = [_report_source[position] for position in results]
+    generate_html_dashboard(results, output_file, case_number, inline_assets, compress, aggregates)
+    return output_file
+
+def _index_row(name, aggregates, files):
+    stats = aggregates.stats()
+    period = aggregates.period()
+    period = f"{period[0]} a {period[1]}" if period else '-'
+    if len(files) == 1:
+        links = f'<a href="{html.escape(files[0])}">{html.escape(name)}</a>'
+    else:
+        parts = ' '.join(f'<a href="{html.escape(filename)}">parte {number}</a>' for number, filename in enumerate(files, 1))
+        links = f'{html.escape(name)}<br><small>{parts}</small>'
+    return (f"<tr><td>{links}</td><td>{stats['total_ips']}</td><td>{aggregates.distinct_ips()}</td>"
+            f"<td>{stats['vpn_detected']}</td><td>{stats['mobile_connections']}</td>"
+            f"<td>{stats['fixed_connections']}</td><td>{html.escape(period)}</td></tr>")
+
+def generate_split_reports(results, output_file, field, case_number=None, inline_assets=False, compress=True,
+                           page_rows=REPORT_PAGE_ROWS, workers=None, aggregates=None):
+    """
+    Divide os resultados por provedor ou país e grava um dashboard
+    por grupo (grupos com mais de page_rows linhas viram várias partes),
+    renderizados em paralelo, mais um index.html com os totais de cada um
+    Os arquivos vão para a pasta <nome>_por_<campo>/ e compartilham os
+    assets. Os totais do índice vêm de aggregates, se já calculado.
+    Retorna o caminho do índice.
+    """
+    directory = f"{os.path.splitext(output_file)[0]}_por_{field}"
+    os.makedirs(directory, exist_ok=True)
+    index_file = os.path.join(directory, 'index.html')
+    if not inline_assets:
+        publish_dashboard_assets(index_file)
+
+    global _report_source
+    spilled = isinstance(results, ResultSpill) and results.spilled
+    jobs = []
+    index_rows = []
+    used_slugs = set()
+    if aggregates is None:
+        aggregates = ResultAggregates(results)
+    groups = split_results(results, field, aggregates.provider_groups() if field == 'provedor' else None)
+    for name, (positions, group_aggregates) in groups.items():
+        slug = _slugify(name)
+        suffix = 2
+        while slug in used_slugs:
+            slug = f"{_slugify(name)}-{suffix}"
+            suffix += 1
+        used_slugs.add(slug)
+
+        # Com os resultados em disco cada parte leva só as posições e é lida ao renderizar
+        pages = [positions[start:start + page_rows] for start in range(0, len(positions), page_rows)]
+        if not spilled:
+            pages = [[results[position] for position in page] for page in pages]
+        files = [f"{slug}.html"] if len(pages) == 1 else [f"{slug}-parte-{number}.html" for number in range(1, len(pages) + 1)]
+        page_aggregates = group_aggregates if len(pages) == 1 else None
+        for page, filename in zip(pages, files):
+            jobs.append((page, os.path.join(directory, filename), case_number, inline_assets, compress, page_aggregates))
+        index_rows.append(_index_row(name, group_aggregates, files))
+
+    workers = min(len(jobs), workers or os.cpu_count() or 1)
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_report_worker,
+                                 initargs=(results if spilled else None, provider_directory())) as pool:
+            for future in as_completed([pool.submit(_render_report_file, *job) for job in jobs]):
+                future.result()
+    else:
+        _report_source = results if spilled else None
+        try:
+            for job in jobs:
+                _render_report_file(*job)
+        finally:
+            _report_source = None
+
+    stats = aggregates.stats()
+    labels = {'provedor': 'Provedor', 'pais': 'País'}
+    with open(index_file, 'w', encoding='utf-8') as f:
+        f.write(fill_template('index.html', {
+            'title': html.escape(f"Relatórios por {labels[field].lower()}"),
+            'field': labels[field],
+            'generated_at': datetime.now().strftime("%d/%m/%Y às %H:%M:%S"),
+            'groups': len(index_rows),
+            'files': len(jobs),
+            'total_ips': stats['total_ips'],
+            'vpn_detected': stats['vpn_detected'],
+            'unique_countries': stats['unique_countries'],
+            'unique_providers': stats['unique_providers'],
+            'rows': '\n'.join(index_rows),
+        }))
+    return index_file
+
+def render_html_dashboard(results, live_source=None, case_number=None):
+    """
+    Monta o HTML do dashboard em memória, com CSS e JS embutidos
+    """
+    buffer = io.StringIO()
+    write_html_dashboard(buffer, results, live_source, case_number)
+    return buffer.getvalue()
+
+def append_result_line(jsonl_file, index, result):
+    """
+    Acrescenta um resultado (com seu índice original) a um arquivo JSONL
+    A linha é gravada em uma única escrita com O_APPEND, então vários
+    processos podem alimentar o mesmo arquivo sem misturar linhas
+    """
+    append_json_line(jsonl_file, dict(result, _indice=index))
+
+def append_json_line(path, record):
+    line = json.dumps(record, ensure_ascii=False) + '\n'
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+def read_result_lines(jsonl_files):
+    """
+    Lê resultados de um ou mais arquivos JSONL e os devolve na ordem original
+    """
+    indexed = []
+    for jsonl_file in jsonl_files:
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    indexed.append((result.pop('_indice', len(indexed)), result))
+    indexed.sort(key=lambda item: item[0])
+    return [result for _, result in indexed]
+
+# Teto de memória dos resultados; acima dele os resultados vão para disco
+SPILL_MEMORY_LIMIT_MB = 512
+# Um resultado em memória (dict) ocupa cerca de 3x o seu JSON
+SPILL_OBJECT_FACTOR = 3
+# Enquanto em memória, só 1 a cada N resultados é serializado para medir o JSON médio
+SPILL_SAMPLE_EVERY = 64
+
+class ResultSpill:
+    """
+    Lista de resultados com teto de memória
+    Enquanto o tamanho estimado dos resultados (JSON médio de uma amostra x
+    SPILL_OBJECT_FACTOR) couber em memory_limit bytes, eles ficam em memória e
+    não são serializados; acima disso todos vão para
+    o arquivo path, no formato JSONL com índice (o mesmo de --merge), e só o
+    deslocamento de cada linha fica em memória. Iteração e acesso por índice
+    leem o arquivo em fluxo, de forma que o pico de memória não cresce com o
+    tamanho do lote.
+    """
+
+    def __init__(self, total, path, memory_limit=SPILL_MEMORY_LIMIT_MB * 1024 * 1024):
+        self.total = total
+        self.path = path
+        self.memory_limit = memory_limit
+        self.rows = [None] * total
+        self.size = 0
+        self.added = 0
+        self.sampled = 0
+        self.sample_bytes = 0
+        self.offsets = None
+        self.in_order = True
+        self.last_index = -1
+        self.columns = {}
+        self._writer = None
+        self._reader = None
+
+    def __len__(self):
+        return self.total
+
+    @property
+    def spilled(self):
+        return self.offsets is not None
+
+    def __getstate__(self):
+        # Vai para outros processos só com o caminho e os deslocamentos
+        self.flush()
+        state = dict(self.__dict__)
+        state['_writer'] = state['_reader'] = None
+        return state
+
+    def __setitem__(self, index, result):
+        if index >= self.total:
+            if self.offsets is None:
+                self.rows.extend([None] * (index + 1 - self.total))
+            else:
+                self.offsets.extend([-1] * (index + 1 - self.total))
+            self.total = index + 1
+        if self.offsets is None:
+            self.rows[index] = result
+            # Só uma amostra é serializada; o tamanho dos demais usa a média dela
+            if self.added % SPILL_SAMPLE_EVERY == 0:
+                self.sample_bytes += len(self._line(index, result))
+                self.sampled += 1
+            self.added += 1
+            self.size += self.sample_bytes // self.sampled * SPILL_OBJECT_FACTOR
+            if self.size > self.memory_limit:
+                self._spill()
+            return
+        self._write(index, self._line(index, result))
+
+    @staticmethod
+    def _line(index, result):
+        return (json.dumps(dict(result, _indice=index), ensure_ascii=False) + '\n').encode('utf-8')
+
+    def _spill(self):
+        print(f"\n💾 Resultados acima de {self.memory_limit // (1024 * 1024)} MB - gravando em {self.path}")
+        self.offsets = array('q', [-1]) * self.total
+        self._writer = open(self.path, 'wb')
+        rows, self.rows = self.rows, None
+        for index, result in enumerate(rows):
+            if result is not None:
+                self._write(index, self._line(index, result))
+
+    def _write(self, index, line):
+        if self.offsets[index] >= 0 or index < self.last_index:
+            self.in_order = False
+        self.last_index = index
+        self.offsets[index] = self._writer.tell()
+        self._writer.write(line)
+
+    def flush(self):
+        if self._writer:
+            self._writer.flush()
+
+    def _decode(self, index, line):
+        result = json.loads(line)
+        result.pop('_indice', None)
+        for field, values in self.columns.items():
+            if values[index] != -1:
+                result[field] = values[index]
+        return result
+
+    def __getitem__(self, index):
+        if self.offsets is None:
+            return self.rows[index]
+        if self.offsets[index] < 0:
+            return None
+        self.flush()
+        if self._reader is None:
+            self._reader = open(self.path, 'rb')
+        self._reader.seek(self.offsets[index])
+        return self._decode(index, self._reader.readline())
+
+    def __iter__(self):
+        if self.offsets is None:
+            yield from self.rows
+            return
+        self.flush()
+        if self.in_order:
+            # Gravados em ordem: leitura sequencial do arquivo; posições nunca
+            # gravadas não têm linha e voltam None, como fora de ordem
+            with open(self.path, 'rb') as f:
+                for index, offset in enumerate(self.offsets):
+                    yield self._decode(index, f.readline()) if offset >= 0 else None
+        else:
+            with open(self.path, 'rb') as f:
+                for index, offset in enumerate(self.offsets):
+                    if offset < 0:
+                        yield None
+                        continue
+                    f.seek(offset)
+                    yield self._decode(index, f.readline())
+
+    def set_field(self, field, values, missing=-1):
+        """
+        Acrescenta um campo a todos os resultados (ex: número da sessão)
+        Em disco, os valores ficam em memória e são aplicados na leitura
+        """
+        if self.offsets is None:
+            for result, value in zip(self.rows, values):
+                if result is not None and value != missing:
+                    result[field] = value
+        else:
+            self.columns[field] = array('l', (-1 if value == missing else value for value in values))
+
+    def close(self):
+        for handle in (self._writer, self._reader):
+            if handle:
+                handle.close()
+        self._writer = self._reader = None
+
+    def discard(self):
+        self.close()
+        if self.offsets is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+# Configuração do acúmulo de resultados (None = listas em memória)
+_spill_settings = None
+
+def configure_result_spill(path=None, memory_limit_mb=SPILL_MEMORY_LIMIT_MB):
+    global _spill_settings
+    _spill_settings = (path, memory_limit_mb * 1024 * 1024) if path else None
+    return _spill_settings
+
+def new_result_list(total):
+    """
+    Lista de resultados do lote: ResultSpill se configurado, senão uma lista comum
+    """
+    if _spill_settings is None:
+        return [None] * total
+    return ResultSpill(total, *_spill_settings)
+
+def load_result_files(jsonl_files):
+    """
+    Lê resultados de arquivos JSONL para uma nova lista de resultados, na
+    ordem original, sem carregar tudo de uma vez quando há teto de memória
+    """
+    if _spill_settings is None:
+        return read_result_lines(jsonl_files)
+    results = new_result_list(0)
+    count = 0
+    for jsonl_file in jsonl_files:
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    results[result.pop('_indice', count)] = result
+                    count += 1
+    return results
+
+def shard_key(ip_data, aggregate_prefixes=None):
+    """
+    Chave estável (igual em qualquer processo ou máquina) usada para
+    distribuir uma entrada entre os shards
+    Na agregação por prefixo, todo o bloco de rede vai para o mesmo shard
+    """
+    if aggregate_prefixes and ip_data.get('ip_version'):
+        if ip_data['ip_version'] == 'IPv4':
+            key = f"4/{ip_data['ip_int'] >> (32 - aggregate_prefixes[0])}"
+        else:
+            key = f"6/{ip_data['ip_int'] >> (128 - aggregate_prefixes[1])}"
+    else:
+        key = ip_data.get('ip_canonical') or ip_data.get('ip') or ''
+    return zlib.crc32(key.encode('utf-8'))
+
+def shard_entries(entries, shard_count, aggregate_prefixes=None):
+    """
+    Divide as entradas em shard_count grupos pelo hash do IP
+    Cada grupo é uma lista de (índice original, entrada)
+    """
+    shards = [[] for _ in range(shard_count)]
+    for index, ip_data in enumerate(entries):
+        shards[shard_key(ip_data, aggregate_prefixes) % shard_count].append((index, ip_data))
+    return shards
+
+def _init_shard_worker(store_path, enrich_config=None, key_pool=None, cassette=None, spill_settings=None,
+                       progress_settings=None):
+    global _vpnapi_keys, _cassette, _spill_settings
+    configure_shared_store(store_path)
+    if progress_settings:
+        queue, log_path = progress_settings
+        configure_progress(0, log_path, queue)
+    if key_pool:
+        _vpnapi_keys = key_pool
+    _cassette = cassette
+    # Cada processo tem o seu arquivo de resultados
+    _spill_settings = (f"{spill_settings[0]}.processo-{os.getpid()}", spill_settings[1]) if spill_settings else None
+    if enrich_config:
+        configure_enrichment(*enrich_config)
+
+def _run_shard(shard, aggregate_prefixes, sample_size, jsonl_file=None, priority=None, reuse=None):
+    indices = [index for index, _ in shard]
+    if reuse:
+        reuse = {position: reuse[index] for position, index in enumerate(indices) if index in reuse}
+
+    def on_result(position, result):
+        if jsonl_file:
+            append_result_line(jsonl_file, indices[position], result)
+
+    results = check_batch_ips([ip_data for _, ip_data in shard], aggregate_prefixes=aggregate_prefixes,
+                              sample_size=sample_size, on_result=on_result, priority=priority, reuse=reuse)
+    if _progress:
+        _progress.flush()
+    if isinstance(results, ResultSpill) and jsonl_file:
+        # Os resultados já estão no JSONL; não voltam pela fila do pool
+        results.discard()
+        return []
+    return list(zip(indices, results))
+
+def check_batch_ips_sharded(ip_entries, workers, store_path=SHARED_STORE_FILE, aggregate_prefixes=None,
+                            sample_size=AGGREGATION_SAMPLE_SIZE, jsonl_file=None, priority=None, reuse=None):
+    """
+    Analisa o lote em vários processos, dividindo as entradas pelo hash do IP
+    Os processos compartilham o cache de consultas e o orçamento de
+    requisições pelo arquivo SQLite store_path. Os resultados voltam na
+    ordem original; com jsonl_file, cada resultado também é gravado nesse
+    arquivo assim que fica pronto. Com priority, cada processo consulta
+    o seu grupo pela fila de prioridade (o hash do IP mantém as repetições
+    de um IP no mesmo grupo). Com teto de memória (configure_result_spill),
+    os resultados passam pelo JSONL em vez de voltar pela fila do pool.
+    """
+    entries = prepare_entries(ip_entries)
+    configure_shared_store(store_path)
+    shards = [shard for shard in shard_entries(entries, workers, aggregate_prefixes) if shard]
+    results = [None] * len(entries)
+    spill_file = None
+    if _spill_settings and not jsonl_file:
+        jsonl_file = spill_file = f"{_spill_settings[0]}.processos.jsonl"
+        open(spill_file, 'w', encoding='utf-8').close()
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    enrich_config = _enricher.config if _enricher else None
+    progress_settings = None
+    if _progress:
+        # Os processos mandam os seus contadores; a linha é desenhada aqui
+        import multiprocessing
+        progress_queue = multiprocessing.Queue()
+        progress_settings = (progress_queue, _progress.log_path)
+        _progress.follow(progress_queue)
+    with ProcessPoolExecutor(max_workers=len(shards) or 1, initializer=_init_shard_worker,
+                             initargs=(store_path, enrich_config, _vpnapi_keys, _cassette, _spill_settings,
+                                       progress_settings)) as pool:
+        futures = [pool.submit(_run_shard, shard, aggregate_prefixes, sample_size, jsonl_file, priority,
+                               {index: reuse[index] for index, _ in shard if index in reuse} if reuse else None)
+                   for shard in shards]
+        for future in as_completed(futures):
+            for index, result in future.result():
+                results[index] = result
+
+    if _spill_settings:
+        results = load_result_files([jsonl_file])
+        if spill_file:
+            os.remove(spill_file)
+    return results
+
+RESULT_STORE_FILE = "historico_ips.sqlite"
+
+def ip_sort_key(ip):
+    """
+    Chave textual ordenável de um IP ('4:' ou '6:' + 32 dígitos hexadecimais)
+    Permite consultar faixas de rede com um índice comum do SQLite
+    """
+    normalized = _normalize_ip_text(ip.strip()) if ip else None
+    if not normalized:
+        return None
+    return f"{normalized[1][-1]}:{normalized[0]:032x}"
+
+def _network_key_range(cidr):
+    network = ipaddress.ip_network(cidr.strip(), strict=False)
+    return (f"{network.version}:{int(network.network_address):032x}",
+            f"{network.version}:{int(network.broadcast_address):032x}")
+
+def _as_number(as_field):
+    match = re.match(r'\s*(?:AS)?(\d+)', as_field or '', re.IGNORECASE)
+    return f"AS{match.group(1)}" if match else None
+
+def _iso_date(data):
+    """
+    Converte a data das entradas (DD/MM/AAAA) para AAAA-MM-DD
+    """
+    match = re.fullmatch(r'(\d{1,2})/(\d{1,2})/(\d{4})', (data or '').strip())
+    if match:
+        return f"{match.group(3)}-{int(match.group(2)):02d}-{int(match.group(1)):02d}"
+    match = re.fullmatch(r'\d{4}-\d{2}-\d{2}', (data or '').strip())
+    return match.group(0) if match else None
+
+def _query_bound(value):
+    """
+    Interpreta um limite de consulta: data (coluna data) ou instante UTC (coluna timestamp)
+    """
+    iso = _iso_date(value)
+    if iso:
+        return 'data', iso
+    try:
+        instant = datetime.fromisoformat(value.strip().replace('Z', '').replace(' ', 'T'))
+    except ValueError:
+        raise ValueError(f"Data inválida: {value}")
+    if instant.tzinfo is None:
+        instant = instant.replace(tzinfo=timezone.utc)
+    return 'timestamp', int(instant.timestamp())
+
+class ResultStore:
+    """
+    Histórico local de resultados de todas as análises, marcados pelo número
+    do procedimento (caso)
+    Índices em ip, AS, provedor, data e caso permitem responder em
+    milissegundos se um IP ou provedor já apareceu em outra investigação.
+    """
+
+    def __init__(self, path=RESULT_STORE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS resultados (
+                id INTEGER PRIMARY KEY,
+                caso TEXT,
+                ip TEXT NOT NULL,
+                ip_chave TEXT NOT NULL,
+                asn TEXT,
+                provedor TEXT COLLATE NOCASE,
+                data TEXT,
+                timestamp INTEGER,
+                status_vpn TEXT,
+                registrado_em REAL NOT NULL,
+                resultado TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_resultados_ip ON resultados (ip_chave);
+            CREATE INDEX IF NOT EXISTS idx_resultados_asn ON resultados (asn);
+            CREATE INDEX IF NOT EXISTS idx_resultados_provedor ON resultados (provedor);
+            CREATE INDEX IF NOT EXISTS idx_resultados_data ON resultados (data);
+            CREATE INDEX IF NOT EXISTS idx_resultados_caso ON resultados (caso);
+        """)
+        # Históricos criados antes da normalização de horários não têm a coluna timestamp
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(resultados)")]
+        if 'timestamp' not in columns:
+            self.conn.execute("ALTER TABLE resultados ADD COLUMN timestamp INTEGER")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_resultados_timestamp ON resultados (timestamp)")
+
+    def close(self):
+        self.conn.close()
+
+    def append(self, results, case_number=None):
+        """
+        Acrescenta os resultados de uma análise ao histórico
+        Retorna quantos resultados foram gravados
+        """
+        now = time.time()
+        stored = Counter()
+
+        def rows():
+            # Gerador: os resultados são lidos e gravados em fluxo
+            for result in results:
+                key = ip_sort_key(result.get('ip'))
+                if not key or not result.get('ip_version'):
+                    continue
+                stored['linhas'] += 1
+                yield (case_number or None, result['ip'], key, _as_number(result.get('AS')),
+                       result.get('provedor'), _iso_date(result.get('data')), result.get('timestamp'),
+                       result.get('status_vpn'), now, json.dumps(result, ensure_ascii=False))
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO resultados (caso, ip, ip_chave, asn, provedor, data, timestamp, status_vpn, registrado_em, resultado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows())
+        return stored['linhas']
+
+    def query(self, ip=None, asn=None, provider=None, case_number=None, date_from=None, date_to=None, limit=1000):
+        """
+        Consulta o histórico
+        - ip: endereço exato ou faixa em notação CIDR (ex: 177.32.0.0/16)
+        - asn: número do AS, com ou sem o prefixo 'AS'
+        - provider: início do nome do provedor, sem diferenciar maiúsculas
+        - date_from/date_to: datas AAAA-MM-DD ou DD/MM/AAAA (inclusive), ou
+          instantes AAAA-MM-DDTHH:MM[:SS] em UTC, comparados com o timestamp
+        """
+        conditions = []
+        params = []
+        if ip:
+            if '/' in ip:
+                start, end = _network_key_range(ip)
+                conditions.append("ip_chave BETWEEN ? AND ?")
+                params += [start, end]
+            else:
+                key = ip_sort_key(ip)
+                if not key:
+                    raise ValueError(f"IP inválido: {ip}")
+                conditions.append("ip_chave = ?")
+                params.append(key)
+        if asn:
+            conditions.append("asn = ?")
+            params.append(_as_number(asn))
+        if provider:
+            conditions.append("provedor LIKE ?")
+            params.append(provider.replace('%', '').replace('_', '') + '%')
+        if case_number:
+            conditions.append("caso = ?")
+            params.append(case_number)
+        for operator, value in (('>=', date_from), ('<=', date_to)):
+            if value:
+                column, bound = _query_bound(value)
+                conditions.append(f"{column} {operator} ?")
+                params.append(bound)
+
+        sql = "SELECT caso, registrado_em, resultado FROM resultados"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        records = []
+        for case, registered_at, result_json in self.conn.execute(sql, params):
+            record = json.loads(result_json)
+            record['caso'] = case
+            record['registrado_em'] = datetime.fromtimestamp(registered_at).isoformat(timespec='seconds')
+            records.append(record)
+        return records
+
+    def case_results(self, case_number):
+        """
+        Resultados gravados para um caso, como (horário do registro, resultado)
+        """
+        return [(registered_at, json.loads(result_json)) for registered_at, result_json in self.conn.execute(
+            "SELECT registrado_em, resultado FROM resultados WHERE caso = ? ORDER BY id", (case_number,))]
+
+    def flagged_keys(self, keys):
+        """
+        Subconjunto das chaves de IP (ip_sort_key) já marcadas como VPN/Proxy
+        """
+        flagged = set()
+        for start in range(0, len(keys), PRIORITY_HISTORY_BATCH):
+            batch = keys[start:start + PRIORITY_HISTORY_BATCH]
+            placeholders = ', '.join('?' * len(batch))
+            flagged.update(row[0] for row in self.conn.execute(
+                f"SELECT DISTINCT ip_chave FROM resultados WHERE status_vpn = 'Detectado' AND ip_chave IN ({placeholders})",
+                batch))
+        return flagged
+
+# Análise incremental: só entradas novas, vencidas ou com erro são consultadas
+INCREMENTAL_TTL_DAYS = 30
+DIFF_FIELDS = ('provedor', 'AS', 'status_vpn')
+
+def entry_fingerprint(ip_data):
+    """
+    Impressão digital de uma entrada normalizada (IP canônico, porta e
+    instante UTC), igual para a entrada e para o seu resultado
+    """
+    ip = ip_data.get('ip') or ''
+    when = ip_data.get('timestamp')
+    if when is None:
+        when = ' '.join(ip_data.get(field) or '' for field in ('data', 'hora', 'utc'))
+    raw = f"{ip_sort_key(ip) or ip}|{ip_data.get('porta') or ''}|{when}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def _analysis_time(result, fallback):
+    try:
+        return datetime.strptime(result['analisado_em'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return fallback
+
+def load_previous_results(previous_file=None, case_number=None, store_path=RESULT_STORE_FILE):
+    """
+    Resultados da execução anterior: arquivo .jsonl/.json ou, sem arquivo,
+    o histórico do caso
+    Retorna {impressão digital: (resultado, horário da análise)}; vale o mais recente
+    """
+    pairs = []
+    if previous_file:
+        fallback = os.path.getmtime(previous_file)
+        if previous_file.endswith('.jsonl'):
+            records = read_result_lines([previous_file])
+        else:
+            with open(previous_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        pairs = [(record, _analysis_time(record, fallback)) for record in records]
+    elif case_number and os.path.exists(store_path):
+        store = ResultStore(store_path)
+        try:
+            pairs = [(record, _analysis_time(record, registered_at))
+                     for registered_at, record in store.case_results(case_number)]
+        finally:
+            store.close()
+
+    previous = {}
+    for record, analyzed_at in pairs:
+        if not record.get('ip_version'):
+            continue
+        fingerprint = entry_fingerprint(record)
+        if fingerprint not in previous or previous[fingerprint][1] <= analyzed_at:
+            previous[fingerprint] = (record, analyzed_at)
+    return previous
+
+def plan_incremental(entries, previous, ttl_days=INCREMENTAL_TTL_DAYS):
+    """
+    Separa as entradas em reaproveitadas e a consultar
+    Retorna (reuse {índice: resultado}, stale {índice: resultado anterior})
+    Resultados vencidos (ttl_days) ou com erro de API são consultados de novo
+    """
+    limit = time.time() - ttl_days * 86400
+    reuse = {}
+    stale = {}
+    for index, ip_data in enumerate(entries):
+        found = previous.get(entry_fingerprint(ip_data))
+        if not found:
+            continue
+        record, analyzed_at = found
+        if analyzed_at < limit or 'erro_ipapi' in record or 'erro_vpnapi' in record:
+            stale[index] = record
+        else:
+            reuse[index] = _copy_result(record, ip_data)
+    return reuse, stale
+
+def _lookup_failed(result):
+    return 'erro_ipapi' in result or 'erro_vpnapi' in result
+
+def diff_results(results, stale, fields=DIFF_FIELDS):
+    """
+    Mudanças de provedor, AS ou status de VPN entre a análise anterior e a atual
+    Retorna (mudanças, recuperadas): entradas cuja consulta anterior tinha
+    falhado e agora trouxe valores vão em recuperadas, não como mudança; se a
+    nova consulta falhou, não há o que comparar. Cada mudança aparece uma vez por IP
+    """
+    changes = []
+    recovered = []
+    seen = set()
+    for index, before in stale.items():
+        after = results[index]
+        if _lookup_failed(after):
+            continue
+        target = recovered if _lookup_failed(before) else changes
+        for field in fields:
+            old, new = before.get(field), after.get(field)
+            key = (after.get('ip'), field, old, new)
+            if old != new and key not in seen:
+                seen.add(key)
+                target.append({'ip': after.get('ip'), 'campo': field, 'antes': old, 'depois': new})
+    return changes, recovered
+
+def write_diff_report(changes, counts, output_file, recovered=()):
+    """
+    Grava o relatório de diferenças da análise incremental (JSON)
+    """
+    report = dict(counts, gerado_em=datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'), alteracoes=changes,
+                  recuperadas=list(recovered))
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
+        json.dump(report, f, ensure_ascii=False, indent=2)
     return output_file
 
-def analyze_and_generate_dashboard():
+def run_query(options):
+    """
+    Subcomando query: consulta o histórico e imprime os resultados em JSON
+    """
+    if not os.path.exists(options.store):
+        print(f"Histórico '{options.store}' não encontrado.", file=sys.stderr)
+        sys.exit(1)
+    store = ResultStore(options.store)
+    try:
+        started = time.perf_counter()
+        records = store.query(ip=options.ip, asn=options.asn, provider=options.provedor, case_number=options.caso,
+                              date_from=options.desde, date_to=options.ate, limit=options.limite)
+        elapsed = (time.perf_counter() - started) * 1000
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    finally:
+        store.close()
+    if options.por_hora:
+        output = ResultAggregates(records).to_dict()['por_hora_utc']
+    elif options.resumo:
+        output = ResultAggregates(records).to_dict()
+    else:
+        output = records
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+    print(f"{len(records)} resultado(s) em {elapsed:.1f} ms", file=sys.stderr)
+
+def run_lookup(options):
+    """
+    Subcomando lookup: consulta poucos IPs sem gerar dashboard e imprime os
+    resultados em JSON (as mensagens de progresso vão para a saída de erro)
+    """
+    configure_shared_store(options.cache)
+    configure_vpnapi_keys(options.vpnapi_keys, options.key_usage)
+    if options.enrich:
+        configure_enrichment(options.rdap_url, options.dns_server, options.enrich_workers)
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            configure_options_cassette(options)
+        except OSError as e:
+            print(f"Erro ao abrir o cassete: {e}")
+            sys.exit(1)
+        results = check_batch_ips(options.ips)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+def _median_run_time(command, repetitions):
+    durations = []
+    for _ in range(repetitions):
+        started = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        durations.append(time.perf_counter() - started)
+    return round(statistics.median(durations) * 1000, 1)
+
+def run_startup_benchmark(options):
+    """
+    Subcomando bench-startup: mede, em processos novos, o tempo de
+    inicialização do script e das importações pesadas, e o tempo da primeira
+    renderização do dashboard (leitura do modelo)
+    Imprime as medianas em milissegundos, em JSON
+    """
+    script = os.path.abspath(__file__)
+    probes = {
+        'interpretador': [sys.executable, '-c', 'pass'],
+        'script': [sys.executable, script, '--help'],
+    }
+    for module in REQUIRED_MODULES + ['http.server', 'concurrent.futures']:
+        probes[f'import {module}'] = [sys.executable, '-c', f'import {module}']
+    timings = {name: _median_run_time(command, options.repeticoes) for name, command in probes.items()}
+
+    _templates.clear()
+    _template_parts.clear()
+    _compiled_assets.clear()
+    started = time.perf_counter()
+    render_html_dashboard([])
+    timings['primeira renderização do dashboard'] = round((time.perf_counter() - started) * 1000, 1)
+    print(json.dumps(timings, ensure_ascii=False, indent=2))
+
+# Modo --profile: perfil de CPU e memória de uma execução completa
+PROFILE_SAMPLE_INTERVAL = 0.005   # segundos entre amostras das pilhas de todas as threads
+PROFILE_TOP_FUNCTIONS = 30
+PROFILE_TOP_ALLOCATIONS = 10
+
+class RunProfiler:
+    """
+    Perfil de uma execução, dividido em fases (leitura, consultas, relatórios)
+    - cProfile na thread principal: tempo próprio e acumulado e número de
+      chamadas de cada função (<base>.pstats, para pstats/snakeviz)
+    - amostragem das pilhas de todas as threads a cada
+      PROFILE_SAMPLE_INTERVAL, inclusive as paradas em rede ou disco, em
+      pilhas colapsadas (<base>.folded, para flamegraph.pl ou speedscope),
+      com a fase e a thread na raiz
+    - tracemalloc: memória atual e pico de cada fase e as linhas que mais
+      alocaram nela (comparação dos instantâneos do início e do fim)
+    - tempo de relógio e de CPU do processo por fase: CPU bem abaixo do
+      relógio indica fase limitada por E/S
+    O resumo (fases, funções mais quentes e contadores de consulta) vai em <base>.json
+    """
+
+    def __init__(self, base_path, interval=PROFILE_SAMPLE_INTERVAL):
+        self.base_path = base_path
+        self.interval = interval
+        self.phases = []
+        self.current = None
+        self.phase_name = None
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._sampler = None
+        self._profile = None
+        self._snapshot = None
+
+    def start(self):
+        import cProfile
+        import tracemalloc
+        tracemalloc.start()
+        self._sampler = threading.Thread(target=self._sample, name='perfil', daemon=True)
+        self._sampler.start()
+        self.phase('inicio')
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def phase(self, name):
+        """
+        Encerra a fase atual e inicia a fase name
+        Os instantâneos de memória ficam fora do cProfile e das próprias comparações
+        """
+        import tracemalloc
+        if self._profile:
+            self._profile.disable()
+        self._close_phase()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self._snapshot = self._take_snapshot()
+        self.phase_name = name
+        self.current = {'fase': name, 'inicio': time.perf_counter(), 'cpu_inicio': time.process_time(),
+                        'memoria_inicio': tracemalloc.get_traced_memory()[0]}
+        if self._profile:
+            self._profile.enable()
+
+    @staticmethod
+    def _take_snapshot():
+        import tracemalloc
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    def _close_phase(self):
+        import tracemalloc
+        phase = self.current
+        if phase is None:
+            return
+        wall = time.perf_counter() - phase.pop('inicio')
+        cpu = time.process_time() - phase.pop('cpu_inicio')
+        current, peak = tracemalloc.get_traced_memory()
+        allocations = self._take_snapshot().compare_to(self._snapshot, 'lineno')[:PROFILE_TOP_ALLOCATIONS]
+        phase.update({
+            'tempo_s': round(wall, 3),
+            'cpu_s': round(cpu, 3),
+            'cpu_por_tempo': round(cpu / wall, 2) if wall else None,
+            'memoria_mb': round(current / 2**20, 2),
+            'variacao_memoria_mb': round((current - phase.pop('memoria_inicio')) / 2**20, 2),
+            'pico_memoria_mb': round(peak / 2**20, 2),
+            'alocacoes': [{'linha': str(stat.traceback[0]), 'variacao_kb': round(stat.size_diff / 1024, 1),
+                           'blocos': stat.count_diff} for stat in allocations],
+        })
+        self.phases.append(phase)
+        self.current = None
+        self.phase_name = 'fim'
+
+    def _sample(self):
+        own = threading.get_ident()
+        labels = self._labels
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            phase = self.phase_name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stack.append(phase)
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        import tracemalloc
+        self._profile.disable()
+        self._close_phase()
+        self._stop.set()
+        self._sampler.join()
+        tracemalloc.stop()
+
+    def hot_functions(self):
+        """
+        Funções com mais tempo próprio na thread principal, com o número de chamadas
+        """
+        import pstats
+        stats = pstats.Stats(self._profile).stats
+        top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:PROFILE_TOP_FUNCTIONS]
+        return [{'funcao': f"{name} ({os.path.basename(filename)}:{line})", 'chamadas': calls,
+                 'tempo_proprio_s': round(own, 4), 'tempo_acumulado_s': round(cumulative, 4)}
+                for (filename, line, name), (_, calls, own, cumulative, _) in top]
+
+    def write(self):
+        """
+        Grava <base>.pstats, <base>.folded e <base>.json; retorna os caminhos
+        """
+        pstats_file, folded_file, summary_file = (f"{self.base_path}{suffix}" for suffix in ('.pstats', '.folded', '.json'))
+        self._profile.dump_stats(pstats_file)
+        with open(folded_file, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = {'intervalo_amostragem_s': self.interval, 'amostras': self.samples, 'fases': self.phases,
+                   'funcoes': self.hot_functions(), 'contadores': dict(lookup_counters.most_common())}
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return pstats_file, folded_file, summary_file
+
+# Perfil ativo (--profile); as fases são marcadas por profile_phase
+_profiler = None
+
+def profile_phase(name):
+    if _profiler is not None:
+        _profiler.phase(name)
+
+def run_profiled(options):
+    """
+    Executa analyze_and_generate_dashboard sob RunProfiler e grava o perfil
+    ao lado do dashboard (<saída>_perfil.*), mesmo se a execução for interrompida
+    """
+    global _profiler
+    _profiler = RunProfiler(f"{os.path.splitext(options.output)[0]}_perfil")
+    _profiler.start()
+    try:
+        analyze_and_generate_dashboard(options)
+    finally:
+        profiler, _profiler = _profiler, None
+        profiler.stop()
+        files = profiler.write()
+        print(f"\n⏱️  Perfil da execução ({profiler.samples} amostras): {', '.join(files)}")
+        for phase in profiler.phases:
+            print(f"   {phase['fase']}: {phase['tempo_s']}s, CPU {phase['cpu_s']}s ({phase['cpu_por_tempo']}), "
+                  f"memória {phase['memoria_mb']} MB (pico {phase['pico_memoria_mb']} MB)")
+
+LIVE_PORT = 8765
+LIVE_BATCH_LIMIT = 5000
+
+class LiveResultFeed:
+    """
+    Modo ao vivo: grava cada resultado em um arquivo JSONL assim que fica
+    pronto e serve, em um servidor HTTP local, um dashboard que acompanha
+    esse arquivo e acrescenta as novas linhas incrementalmente
+    """
+
+    def __init__(self, jsonl_file, port=LIVE_PORT, case_number=None):
+        self.jsonl_file = jsonl_file
+        self.port = port
+        self.case_number = case_number
+        self.done = False
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def start(self):
+        open(self.jsonl_file, 'w', encoding='utf-8').close()
+        self.page = render_html_dashboard([], live_source='/resultados', case_number=self.case_number).encode('utf-8')
+        from http.server import ThreadingHTTPServer
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), _live_request_handler())
+        self.server.feed = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def publish(self, index, result):
+        append_result_line(self.jsonl_file, index, result)
+
+    def finish(self):
+        self.done = True
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def read_from(self, offset):
+        """
+        Lê as linhas completas a partir do byte offset
+        Retorna (resultados, novo offset); o campo interno _indice não vai para a página
+        """
+        with open(self.jsonl_file, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+        results = []
+        consumed = 0
+        for raw_line in chunk.splitlines(keepends=True):
+            if not raw_line.endswith(b'\n') or len(results) >= LIVE_BATCH_LIMIT:
+                break
+            consumed += len(raw_line)
+            result = json.loads(raw_line)
+            result.pop('_indice', None)
+            results.append(result)
+        return results, offset + consumed
+
+_live_handler_class = None
+
+def _live_request_handler():
+    """
+    Handler HTTP do modo ao vivo, criado só quando o modo é usado
+    """
+    global _live_handler_class
+    if _live_handler_class is None:
+        from http.server import BaseHTTPRequestHandler
+
+        class LiveRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                feed = self.server.feed
+                parsed = urlparse(self.path)
+                if parsed.path == '/':
+                    self._send(200, 'text/html; charset=utf-8', feed.page)
+                elif parsed.path == '/resultados':
+                    match = re.search(r'(?:^|&)offset=(\d+)', parsed.query)
+                    done = feed.done
+                    results, offset = feed.read_from(int(match.group(1)) if match else 0)
+                    payload = {'offset': offset, 'results': results, 'done': done and not results}
+                    self._send(200, 'application/json; charset=utf-8', json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+                else:
+                    self._send(404, 'text/plain; charset=utf-8', b'Nao encontrado')
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        _live_handler_class = LiveRequestHandler
+    return _live_handler_class
+
+def analyze_and_generate_dashboard(options=None):
+    if options is None:
+        options = parse_arguments([])
+
+    configure_result_spill(f"{os.path.splitext(options.output)[0]}_resultados.jsonl", options.memory_limit)
+    try:
+        configure_provider_directory(options.providers)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao ler o cadastro de provedores: {e}")
+        return
+
+    if options.merge:
+        # Etapa de unificação: junta os resultados de vários shards
+        profile_phase('leitura')
+        results = load_result_files(options.merge)
+        print(f"{len(results)} resultados unificados de {len(options.merge)} arquivo(s).")
+        profile_phase('relatorios')
+        # Resumo calculado em uma única passada, usado pelo resumo JSON e pelos relatórios
+        aggregates = ResultAggregates(results)
+        report_summary(aggregates, f"{os.path.splitext(options.output)[0]}_resumo.json")
+        report_sessions(results, options)
+        store_results(results, options)
+        publish_dashboard(results, options, aggregates)
+        report_spill(results)
+        return
+
     print("="*60)
     print("ANALISADOR DE IPs COM MAPA INTERATIVO OTIMIZADO")
     print("="*60)
@@ -1174,13 +4324,14 @@ def analyze_and_generate_dashboard():
     
     print("\nOpções de entrada:")
     print("1. Digitar IPs manualmente")
-    print("2. Carregar de arquivo (um IP por linha)")
+    print("2. Carregar de arquivo (um IP por linha, ou planilha CSV/XLSX)")
     print("\nFormatos aceitos:")
     print("- IP simples: 8.8.8.8")
     print("- IP com porta: 8.8.8.8:80")
     print("- IP com dados completos: 8.8.8.8 80 01/01/2025 10:30:00 UTC-3")
     
     choice = input("\nEscolha uma opção (1-2): ").strip()
+    profile_phase('leitura')
     
     ip_list = []
     
@@ -1194,29 +4345,44 @@ def analyze_and_generate_dashboard():
         print("8.8.4.4 53 02/08/2025 14:30:00 UTC-3")
         print("\nDigite os IPs:")
         
+        lines = []
         while True:
             line = input().strip()
             if line.lower() == 'fim':
                 break
             if line:
-                ip_data = parse_ip_entry(line)
-                if is_valid_ip(ip_data['ip']):
-                    ip_list.append(line)
-                else:
-                    print(f"IP inválido ignorado: {line}")
+                lines.append(line)
+        # Preparadas e validadas juntas: a ordem dia/mês é detectada uma vez para todas as linhas
+        ip_list = []
+        for line, ip_data in zip(lines, prepare_entries(lines)):
+            if ip_data['ip_version']:
+                ip_list.append(ip_data)
+            else:
+                print(f"IP inválido ignorado: {line}")
     
     elif choice == '2':
         filename = input("Digite o nome do arquivo: ").strip()
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if line:
-                        ip_data = parse_ip_entry(line)
-                        if is_valid_ip(ip_data['ip']):
-                            ip_list.append(line)
-                        else:
-                            print(f"Linha {line_num} - IP inválido ignorado: {line}")
+            table = None
+            if is_table_file(filename):
+                table = TableInput(filename, options.columns, options.sheet)
+                chunks = table.chunks()
+            else:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    chunks = [[(line_num, line.strip()) for line_num, line in enumerate(f, 1) if line.strip()]]
+            # Validação em lote: cada entrada é validada uma única vez
+            for chunk in chunks:
+                entries = prepare_entries([entry for _, entry in chunk])
+                for (line_num, _), ip_data in zip(chunk, entries):
+                    if ip_data['ip_version']:
+                        ip_list.append(ip_data)
+                    else:
+                        print(f"Linha {line_num} - IP inválido ignorado: {ip_data['entrada']}")
+            if table:
+                print(f"Colunas: {table.describe()}")
+                if table.time_reader and table.time_reader.mismatches:
+                    print(f"⚠️  {table.time_reader.mismatches} datas fora do formato detectado "
+                          f"({table.time_reader.format or 'nenhum'}) ficaram sem horário UTC")
         except FileNotFoundError:
             print(f"Arquivo '{filename}' não encontrado.")
             return
@@ -1233,21 +4399,221 @@ def analyze_and_generate_dashboard():
         return
     
     print(f"\n{len(ip_list)} entradas válidas encontradas.")
+    profile_phase('preparacao')
+
+    try:
+        configure_vpnapi_keys(options.vpnapi_keys, options.key_usage)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao ler as chaves da vpnapi.io: {e}")
+        return
+    try:
+        configure_options_cassette(options)
+    except OSError as e:
+        print(f"Erro ao abrir o cassete: {e}")
+        return
+    configure_shared_store(options.cache)
+
+    if options.caso is None and not options.no_store:
+        options.caso = input("Número do procedimento para o histórico (Enter para pular): ").strip() or None
     
+    reuse, stale = None, {}
+    if options.incremental or options.previous:
+        try:
+            previous = load_previous_results(options.previous, options.caso, options.store)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler a análise anterior: {e}")
+            return
+        if not previous:
+            print("Nenhuma análise anterior encontrada - todas as entradas serão consultadas.")
+        reuse, stale = plan_incremental(ip_list, previous, options.refresh_after)
+        print(f"Análise incremental: {len(reuse)} entradas reaproveitadas, {len(stale)} vencidas ou com erro, "
+              f"{len(ip_list) - len(reuse) - len(stale)} novas.")
+
+    # Estimativa depois do planejamento incremental: entradas reaproveitadas não consultam a vpnapi.io
+    if not _replaying():
+        warn_vpnapi_budget(ip_list, (options.prefix_v4, options.prefix_v6) if options.aggregate else None,
+                           options.sample_size, reuse)
+
     confirm = input("Deseja prosseguir com a análise? (s/n): ").strip().lower()
     if confirm not in ['s', 'sim', 'y', 'yes']:
         print("Análise cancelada.")
         return
-    
-    print(f"\nIniciando análise de {len(ip_list)} IPs...")
+
+    print(f"\nIniciando análise de {len(ip_list) - len(reuse or {})} IPs...")
+    profile_phase('consultas')
     print("Este processo pode levar alguns minutos...")
     
-    # Executar análise
-    results = check_batch_ips(ip_list)
-    
-    # Gerar dashboard
+    base_name = os.path.splitext(options.output)[0]
+    jsonl_file = base_name + '.jsonl'
+    if options.shard:
+        jsonl_file = f"{base_name}.shard-{options.shard[0]}-de-{options.shard[1]}.jsonl"
+
+    live_feed = None
+    if options.live:
+        live_feed = LiveResultFeed(jsonl_file, options.live_port, options.caso)
+        try:
+            live_url = live_feed.start()
+        except OSError as e:
+            print(f"Não foi possível iniciar o dashboard ao vivo: {e}")
+            live_feed = None
+        else:
+            print(f"\n📡 Dashboard ao vivo: {live_url}")
+            try:
+                import webbrowser
+                webbrowser.open(live_url)
+            except Exception:
+                print("Abra o endereço acima manualmente no navegador.")
+
+    # O servidor do dashboard ao vivo é encerrado ao fim da execução, mesmo com erro ou interrupção
+    try:
+        if options.enrich:
+            configure_enrichment(options.rdap_url, options.dns_server, options.enrich_workers)
+
+        # CSS e JS do relatório são preparados enquanto as consultas rodam
+        assets_thread = None if options.shard else start_dashboard_assets(options.output, options.inline_assets)
+
+        # Executar análise
+        aggregate_prefixes = (options.prefix_v4, options.prefix_v6) if options.aggregate else None
+        priority = None
+        if options.priority:
+            priority = (options.priority, options.priority_tags, options.store)
+            print(f"Consultas por prioridade: {', '.join(options.priority)}")
+        if options.log:
+            print(f"📝 Log detalhado das entradas em {options.log}")
+        if options.shard:
+            shard_index, shard_count = options.shard
+            configure_shared_store(options.cache)
+            shard = shard_entries(prepare_entries(ip_list), shard_count, aggregate_prefixes)[shard_index - 1]
+            print(f"Shard {shard_index} de {shard_count}: {len(shard)} de {len(ip_list)} entradas.")
+            if not live_feed:
+                open(jsonl_file, 'w', encoding='utf-8').close()
+            configure_progress(sum(1 for index, _ in shard if index not in (reuse or {})), options.log)
+            _run_shard(shard, aggregate_prefixes, options.sample_size, jsonl_file, priority, reuse)
+            _progress.finish()
+            if live_feed:
+                live_feed.finish()
+            print(f"\n✅ Resultados do shard gravados em: {jsonl_file}")
+            print("Depois que todos os shards terminarem, unifique com: --merge <arquivos .jsonl>")
+            return
+        configure_progress(len(ip_list) - len(reuse or {}), options.log)
+        if options.workers > 1:
+            results = check_batch_ips_sharded(ip_list, options.workers, options.cache or SHARED_STORE_FILE,
+                                              aggregate_prefixes=aggregate_prefixes, sample_size=options.sample_size,
+                                              jsonl_file=jsonl_file if live_feed else None, priority=priority,
+                                              reuse=reuse)
+        else:
+            configure_shared_store(options.cache)
+            results = check_batch_ips(ip_list, aggregate_prefixes=aggregate_prefixes, sample_size=options.sample_size,
+                                      on_result=live_feed.publish if live_feed else None, priority=priority,
+                                      reuse=reuse)
+        _progress.finish()
+        if live_feed:
+            live_feed.finish()
+
+        profile_phase('relatorios')
+        report_key_usage()
+        if reuse is not None:
+            report_changes(results, reuse, stale, f"{base_name}_alteracoes.json")
+        aggregates = ResultAggregates(results)
+        report_summary(aggregates, f"{base_name}_resumo.json")
+        report_sessions(results, options)
+        store_results(results, options, reuse)
+        publish_dashboard(results, options, aggregates, assets_thread)
+        report_spill(results)
+    finally:
+        if live_feed:
+            live_feed.stop()
+
+def report_spill(results):
+    if isinstance(results, ResultSpill) and results.spilled:
+        results.close()
+        print(f"💾 Resultados completos em {results.path} (formato de --merge e --previous)")
+
+def configure_options_cassette(options):
+    if options.record:
+        configure_cassette(options.record, 'gravar')
+        print(f"📼 Gravando as respostas das APIs em {options.record}")
+    elif options.replay:
+        configure_cassette(options.replay, 'reproduzir', options.replay_real_time)
+        print(f"📼 Reproduzindo as respostas gravadas em {options.replay} "
+              f"({'latências originais' if options.replay_real_time else 'velocidade máxima'}, sem acessar as APIs)")
+
+def report_key_usage():
+    if _replaying():
+        print(f"📼 {lookup_counters['cassete_reproduzidas']} respostas reproduzidas do cassete, "
+              f"{lookup_counters['cassete_ausentes']} requisições não gravadas")
+        return
+    if _cassette is not None:
+        print(f"📼 {lookup_counters['cassete_gravadas']} respostas gravadas em {_cassette.path}")
+    for key_id, used, quota in vpnapi_key_pool().usage():
+        print(f"🔑 Chave vpnapi.io {key_id}: {used} de {quota} consultas usadas hoje")
+
+def report_changes(results, reuse, stale, output_file):
+    changes, recovered = diff_results(results, stale)
+    counts = {'reaproveitadas': len(reuse), 'atualizadas': len(stale),
+              'novas': len(results) - len(reuse) - len(stale)}
+    write_diff_report(changes, counts, output_file, recovered)
+    print(f"\n🔁 {len(changes)} alteração(ões) de provedor, AS ou VPN em IPs já analisados "
+          f"(detalhes em {output_file})")
+    if recovered:
+        print(f"   {len({change['ip'] for change in recovered})} IP(s) com erro de API na análise anterior "
+              f"agora têm resultado (em 'recuperadas')")
+    for change in changes[:20]:
+        print(f"   {change['ip']}: {change['campo']} {change['antes']!r} → {change['depois']!r}")
+
+def report_summary(aggregates, output_file):
+    """
+    Imprime os principais totais e grava o resumo completo (ResultAggregates) em JSON
+    """
+    summary = aggregates.to_dict()
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"\n📊 {summary['total']} registros, {summary['ips_distintos']} IPs distintos, "
+          f"{summary['vpn_detected']} com VPN/Proxy (resumo em {output_file})")
+    for label, key in (('Provedores', 'por_provedor'), ('Países', 'por_pais')):
+        top = ', '.join(f"{name} ({count})" for name, count in list(summary[key].items())[:5])
+        print(f"   {label}: {top}")
+
+def report_sessions(results, options):
+    sessions, correlated = number_sessions(results, options.session_gap)
+    print(f"\n🔗 {correlated} entradas agrupadas em {sessions} sessões (intervalo máximo de {options.session_gap}s).")
+
+def store_results(results, options, reuse=None):
+    """
+    Acrescenta os resultados ao histórico local, marcados pelo caso
+    Na análise incremental, as entradas reaproveitadas (reuse) já estão no
+    histórico: só as consultadas de novo são gravadas
+    """
+    if options.no_store:
+        return
+    if reuse:
+        results = (result for index, result in enumerate(results) if index not in reuse)
+    try:
+        store = ResultStore(options.store)
+        try:
+            stored = store.append(results, options.caso)
+        finally:
+            store.close()
+    except sqlite3.Error as e:
+        print(f"Não foi possível gravar o histórico em '{options.store}': {e}")
+        return
+    print(f"\n🗄️  {stored} resultados gravados no histórico ({options.store}).")
+
+def publish_dashboard(results, options, aggregates, assets_thread=None):
+    """
+    Gera o dashboard final (com o resumo aggregates já calculado) e oferece abri-lo no navegador
+    """
     print("\nGerando dashboard HTML otimizado...")
-    dashboard_file = generate_html_dashboard(results)
+    if assets_thread:
+        assets_thread.join()
+    if options.split_by:
+        dashboard_file = generate_split_reports(results, options.output, options.split_by, options.caso,
+                                                options.inline_assets, not options.no_compress, options.page_rows,
+                                                options.report_workers, aggregates)
+        print(f"📂 Relatórios por {options.split_by} em: {os.path.dirname(dashboard_file)}")
+    else:
+        dashboard_file = generate_html_dashboard(results, options.output, options.caso, options.inline_assets,
+                                                 not options.no_compress, aggregates)
     
     print(f"\n✅ Dashboard otimizado gerado com sucesso!")
     print(f"📄 Arquivo: {dashboard_file}")
@@ -1260,6 +4626,7 @@ def analyze_and_generate_dashboard():
     print(f"📤  Exportação para Word/CSV/JSON")
     
     # Perguntar se deseja abrir automaticamente
+    profile_phase('encerramento')
     open_choice = input("\nDeseja abrir o dashboard automaticamente? (s/n): ").strip().lower()
     if open_choice in ['s', 'sim', 'y', 'yes']:
         try:
@@ -1270,20 +4637,189 @@ def analyze_and_generate_dashboard():
             print(f"Erro ao abrir automaticamente: {e}")
             print("Abra manualmente o arquivo no navegador.")
 
+def _shard_argument(value):
+    match = re.fullmatch(r'(\d+)/(\d+)', value.strip())
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise argparse.ArgumentTypeError("use o formato K/N, com 1 <= K <= N (ex: 2/4)")
+    return int(match.group(1)), int(match.group(2))
+
+def _dns_server_argument(value):
+    match = re.fullmatch(r'\[?([^\[\]]+?)\]?(?::(\d+))?', value.strip())
+    if not match or (value.count(':') > 1 and not value.startswith('[')):
+        raise argparse.ArgumentTypeError("use HOST ou HOST:PORTA (IPv6 entre colchetes: [::1]:53)")
+    return match.group(1), int(match.group(2) or 53)
+
+def _priority_argument(value):
+    modes = [mode.strip().lower() for mode in value.split(',') if mode.strip()]
+    invalid = [mode for mode in modes if mode not in PRIORITY_MODES]
+    if not modes or invalid:
+        raise argparse.ArgumentTypeError(f"use um ou mais de {', '.join(PRIORITY_MODES)}, separados por vírgula")
+    return modes
+
+def _tags_argument(value):
+    return [tag.strip().lstrip('#').lower() for tag in value.split(',') if tag.strip()]
+
+def _columns_argument(value):
+    columns = {}
+    for item in value.split(','):
+        field, _, column = item.partition('=')
+        field = field.strip().lower()
+        if field not in TABLE_COLUMN_ALIASES or not column.strip():
+            raise argparse.ArgumentTypeError(f"use CAMPO=COLUNA separados por vírgula, com CAMPO entre "
+                                             f"{', '.join(TABLE_COLUMN_ALIASES)} (ex: ip=IP Origem,porta=3)")
+        columns[field] = column.strip()
+    return columns
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Analisador de IPs - Detector de VPN e Tipo de Conexão")
+    parser.add_argument('--caso', metavar='NUMERO',
+                        help="número do procedimento usado para marcar os resultados no histórico")
+    parser.add_argument('--store', default=RESULT_STORE_FILE, metavar='ARQUIVO',
+                        help="histórico local de resultados (padrão: %(default)s)")
+    parser.add_argument('--no-store', action='store_true',
+                        help="não grava os resultados no histórico")
+    parser.add_argument('--output', default='dashboard_ips.html',
+                        help="arquivo HTML do dashboard (padrão: %(default)s)")
+    parser.add_argument('--inline-assets', action='store_true',
+                        help="embute CSS e JS no HTML (relatório em um único arquivo, maior)")
+    parser.add_argument('--no-compress', action='store_true',
+                        help="grava os dados do relatório em JSON simples, sem compressão (navegadores antigos)")
+    parser.add_argument('--split-by', choices=sorted(SPLIT_FIELDS),
+                        help="grava um dashboard por provedor ou país, com uma página de índice")
+    parser.add_argument('--page-rows', type=int, default=REPORT_PAGE_ROWS, metavar='LINHAS',
+                        help="máximo de linhas por arquivo na divisão; grupos maiores viram várias partes (padrão: %(default)s)")
+    parser.add_argument('--report-workers', type=int, metavar='N',
+                        help="processos usados para gerar os relatórios divididos (padrão: número de CPUs)")
+    parser.add_argument('--memory-limit', type=int, default=SPILL_MEMORY_LIMIT_MB, metavar='MB',
+                        help="memória máxima dos resultados; acima disso eles vão para "
+                             "<saída>_resultados.jsonl e os relatórios são gerados lendo esse arquivo "
+                             "(padrão: %(default)s)")
+    parser.add_argument('--columns', type=_columns_argument, metavar='CAMPO=COLUNA,...',
+                        help="colunas da planilha CSV/XLSX, por nome ou número (ex: ip=IP Origem,porta=Porta,"
+                             "data_hora=Data,utc=Fuso); campos não informados são reconhecidos pelos nomes usuais")
+    parser.add_argument('--sheet', metavar='ABA',
+                        help="aba da planilha XLSX (padrão: a primeira)")
+    parser.add_argument('--log', metavar='ARQUIVO',
+                        help="grava os dados e o resultado de cada entrada consultada em um log JSONL "
+                             "(o terminal mostra só a linha de progresso)")
+    parser.add_argument('--profile', action='store_true',
+                        help="grava o perfil de CPU e memória da execução ao lado do dashboard "
+                             "(<saída>_perfil.pstats, .folded e .json)")
+    parser.add_argument('--live', action='store_true',
+                        help="acompanha os resultados ao vivo em um dashboard local enquanto o lote é analisado")
+    parser.add_argument('--live-port', type=int, default=LIVE_PORT,
+                        help="porta do dashboard ao vivo (padrão: %(default)s)")
+    parser.add_argument('--cache', metavar='ARQUIVO',
+                        help="cache de consultas e orçamento de requisições em SQLite, compartilhável entre processos")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="número de processos; as entradas são divididas pelo hash do IP (padrão: %(default)s)")
+    parser.add_argument('--shard', type=_shard_argument, metavar='K/N',
+                        help="analisa apenas o shard K de N (para dividir a investigação entre máquinas)")
+    parser.add_argument('--merge', nargs='+', metavar='ARQUIVO',
+                        help="unifica arquivos .jsonl de shards em um único dashboard")
+    parser.add_argument('--session-gap', type=int, default=SESSION_GAP, metavar='SEGUNDOS',
+                        help="intervalo máximo entre registros de uma mesma sessão (IP e porta) (padrão: %(default)s)")
+    parser.add_argument('--aggregate', action='store_true',
+                        help="consulta um IP representativo por bloco de rede e replica o resultado (marcado como inferido)")
+    parser.add_argument('--prefix-v4', type=int, default=AGGREGATION_PREFIXES[0],
+                        help="prefixo do bloco IPv4 na agregação (padrão: %(default)s)")
+    parser.add_argument('--prefix-v6', type=int, default=AGGREGATION_PREFIXES[1],
+                        help="prefixo do bloco IPv6 na agregação (padrão: %(default)s)")
+    parser.add_argument('--sample-size', type=int, default=AGGREGATION_SAMPLE_SIZE,
+                        help="IPs extras consultados por bloco para conferir a consistência (padrão: %(default)s)")
+    parser.add_argument('--enrich', action='store_true',
+                        help="acrescenta o PTR (DNS reverso) e o titular e contato de abuse do bloco (RDAP)")
+    parser.add_argument('--rdap-url', default=RDAP_BASE_URL, metavar='URL',
+                        help="servidor RDAP usado no enriquecimento (padrão: %(default)s)")
+    parser.add_argument('--dns-server', type=_dns_server_argument, metavar='HOST[:PORTA]',
+                        help="servidor DNS para o PTR (padrão: resolvedor do sistema)")
+    parser.add_argument('--enrich-workers', type=int, default=ENRICH_WORKERS,
+                        help="threads do enriquecimento (padrão: %(default)s)")
+    parser.add_argument('--providers', default=PROVIDER_DIRECTORY_FILE, metavar='ARQUIVO',
+                        help="cadastro de provedores (nome, AS, variantes e contatos para os ofícios) "
+                             "(padrão: provedores.json ao lado do script)")
+    parser.add_argument('--vpnapi-keys', metavar='ARQUIVO',
+                        help=f"arquivo com as chaves da vpnapi.io, uma chave[:cota diária] por linha "
+                             f"(padrão: variável {VPNAPI_KEYS_ENV} ou a chave embutida)")
+    parser.add_argument('--key-usage', default=KEY_USAGE_FILE, metavar='ARQUIVO',
+                        help="contadores de uso diário das chaves (padrão: %(default)s)")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument('--record', metavar='ARQUIVO',
+                                help="grava todas as respostas das APIs, com a latência, em um cassete SQLite")
+    cassette_group.add_argument('--replay', metavar='ARQUIVO',
+                                help="reproduz as respostas de um cassete gravado, sem acessar as APIs")
+    parser.add_argument('--replay-real-time', action='store_true',
+                        help="na reprodução, espera a latência original de cada resposta")
+    parser.add_argument('--incremental', action='store_true',
+                        help="consulta só entradas novas, vencidas ou com erro, reaproveitando a análise "
+                             "anterior do caso (--caso) no histórico")
+    parser.add_argument('--previous', metavar='ARQUIVO',
+                        help="análise anterior (.jsonl ou .json exportado) usada pelo modo incremental")
+    parser.add_argument('--refresh-after', type=int, default=INCREMENTAL_TTL_DAYS, metavar='DIAS',
+                        help="idade a partir da qual um resultado é consultado de novo (padrão: %(default)s)")
+    parser.add_argument('--priority', type=_priority_argument, metavar='MODOS',
+                        help="consulta primeiro as entradas mais urgentes: recencia, tag e/ou classificacao "
+                             "(ex: tag,recencia); os resultados mantêm a ordem do arquivo")
+    parser.add_argument('--priority-tags', type=_tags_argument, default=[], metavar='TAGS',
+                        help="ordem das tags marcadas com # nas linhas (ex: urgente,alvo)")
+
+    subparsers = parser.add_subparsers(dest='command', metavar='comando')
+    query_parser = subparsers.add_parser('query', help="consulta o histórico de resultados de análises anteriores")
+    query_parser.add_argument('--ip', help="IP exato ou faixa CIDR (ex: 177.32.0.0/16)")
+    query_parser.add_argument('--as', dest='asn', help="número do AS (ex: AS26599 ou 26599)")
+    query_parser.add_argument('--provedor', help="início do nome do provedor")
+    query_parser.add_argument('--caso', help="número do procedimento")
+    query_parser.add_argument('--desde', help="data inicial (AAAA-MM-DD ou DD/MM/AAAA) ou instante UTC (AAAA-MM-DDTHH:MM)")
+    query_parser.add_argument('--ate', help="data final (AAAA-MM-DD ou DD/MM/AAAA) ou instante UTC (AAAA-MM-DDTHH:MM)")
+    query_parser.add_argument('--por-hora', action='store_true', help="mostra apenas a contagem de registros por hora (UTC)")
+    query_parser.add_argument('--resumo', action='store_true',
+                              help="mostra o resumo dos registros (contagens por país, provedor, AS, conexão e VPN, "
+                                   "por hora e IPs por provedor)")
+    query_parser.add_argument('--limite', type=int, default=1000, help="máximo de resultados (padrão: %(default)s)")
+    query_parser.add_argument('--store', default=RESULT_STORE_FILE, metavar='ARQUIVO',
+                              help="histórico local de resultados (padrão: %(default)s)")
+
+    lookup_parser = subparsers.add_parser('lookup', help="consulta um ou mais IPs e imprime o resultado em JSON, sem dashboard")
+    lookup_parser.add_argument('ips', nargs='+', metavar='IP', help="IP ou linha de log (ex: 8.8.8.8 ou '8.8.8.8 443 01/01/2025 10:30:00 UTC-3')")
+
+    bench_parser = subparsers.add_parser('bench-startup', help="mede o tempo de inicialização do script")
+    bench_parser.add_argument('--repeticoes', type=int, default=5, help="execuções por medida (padrão: %(default)s)")
+
+    options = parser.parse_args(argv)
+
+    if not 0 < options.prefix_v4 <= 32:
+        parser.error("--prefix-v4 deve estar entre 1 e 32")
+    if not 0 < options.prefix_v6 <= 128:
+        parser.error("--prefix-v6 deve estar entre 1 e 128")
+    if options.sample_size < 0:
+        parser.error("--sample-size não pode ser negativo")
+    if options.workers < 1:
+        parser.error("--workers deve ser pelo menos 1")
+    if options.session_gap < 0:
+        parser.error("--session-gap não pode ser negativo")
+    if options.page_rows < 1:
+        parser.error("--page-rows deve ser pelo menos 1")
+    if options.report_workers is not None and options.report_workers < 1:
+        parser.error("--report-workers deve ser pelo menos 1")
+    if options.enrich_workers < 1:
+        parser.error("--enrich-workers deve ser pelo menos 1")
+    return options
+
 def main():
     """
     Função principal
     """
+    options = parse_arguments()
+    if options.command == 'query':
+        run_query(options)
+        return
+    if options.command == 'bench-startup':
+        run_startup_benchmark(options)
+        return
+
     try:
-        # Verificar se as bibliotecas necessárias estão instaladas
-        required_modules = ['requests']
-        missing_modules = []
-        
-        for module in required_modules:
-            try:
-                __import__(module)
-            except ImportError:
-                missing_modules.append(module)
+        # Verificar se as bibliotecas necessárias estão instaladas (sem importá-las)
+        missing_modules = [module for module in REQUIRED_MODULES if importlib.util.find_spec(module) is None]
         
         if missing_modules:
             print("Módulos necessários não encontrados:")
@@ -1292,7 +4828,12 @@ def main():
             print("\nInstale os módulos com: pip install " + " ".join(missing_modules))
             sys.exit(1)
         
-        analyze_and_generate_dashboard()
+        if options.command == 'lookup':
+            run_lookup(options)
+        elif options.profile:
+            run_profiled(options)
+        else:
+            analyze_and_generate_dashboard(options)
         
     except KeyboardInterrupt:
         print("\n\nPrograma interrompido pelo usuário. Até logo!")
@@ -0,0 +1,1108 @@
+let filteredResults = allResults;
+let currentOficio = '';
+let map, mapLayer;
+let oficioGroups = {};
+
+document.addEventListener('DOMContentLoaded', function() {
+    initializeMap();
+    populateFilters();
+    displayResults(allResults);
+    displaySessions(allResults);
+    generateOficioButtons();
+    if (LIVE_SOURCE) {
+        startLiveUpdates();
+    }
+    if (DATA_CHUNKS) {
+        startChunkLoading();
+    }
+});
+
+// DADOS COMPACTADOS - blocos de resultados (colunas com dicionário, deflate e base64)
+// decodificados sob demanda: o primeiro na abertura, os demais ao rolar a tabela
+// e, aos poucos, quando o navegador está ocioso
+const pendingChunks = DATA_CHUNKS ? DATA_CHUNKS.slice() : [];
+let chunkLoading = null;
+
+function startChunkLoading() {
+    if (typeof DecompressionStream === 'undefined') {
+        const status = document.getElementById('load-status');
+        status.style.display = 'block';
+        status.innerHTML = '⚠️ <strong>Este navegador não consegue abrir os dados compactados.</strong> Use um navegador atualizado ou gere o relatório com --no-compress.';
+        return;
+    }
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) loadNextChunk();
+    }, { rootMargin: '600px' });
+    observer.observe(document.getElementById('load-more'));
+    loadNextChunk().then(scheduleIdleChunk);
+}
+
+function scheduleIdleChunk() {
+    if (!pendingChunks.length) return;
+    const next = () => loadNextChunk().then(scheduleIdleChunk);
+    setTimeout(() => window.requestIdleCallback ? requestIdleCallback(next) : next(), 500);
+}
+
+function decodeChunk(encoded) {
+    const bytes = Uint8Array.from(atob(encoded), character => character.charCodeAt(0));
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return new Response(stream).json().then(expandColumns);
+}
+
+function expandColumns(chunk) {
+    const rows = Array.from({ length: chunk.n }, () => ({}));
+    Object.entries(chunk.c).forEach(([field, column]) => {
+        if (column.v) {
+            column.v.forEach((value, row) => { rows[row][field] = value; });
+        } else {
+            column.i.forEach((index, row) => {
+                if (index >= 0) rows[row][field] = column.d[index];
+            });
+        }
+    });
+    return rows;
+}
+
+function loadNextChunk() {
+    if (!chunkLoading && pendingChunks.length) {
+        chunkLoading = decodeChunk(pendingChunks.shift()).then(rows => {
+            appendResults(rows);
+            chunkLoading = null;
+            const status = document.getElementById('load-status');
+            if (pendingChunks.length) {
+                status.style.display = 'block';
+                status.innerHTML = `⏳ Carregando dados: ${allResults.length} de ${document.getElementById('stat-total').textContent} resultados`;
+                const sentinel = document.getElementById('load-more').getBoundingClientRect();
+                if (sentinel.top < window.innerHeight + 600) loadNextChunk();
+            } else {
+                status.style.display = 'none';
+                displaySessions(filteredResults);
+            }
+        }).catch(error => {
+            pendingChunks.length = 0;
+            chunkLoading = null;
+            const status = document.getElementById('load-status');
+            status.style.display = 'block';
+            status.innerHTML = `⚠️ <strong>Erro ao carregar os dados do relatório:</strong> ${error}`;
+        });
+    }
+    return chunkLoading || Promise.resolve();
+}
+
+function loadAllChunks() {
+    return (pendingChunks.length || chunkLoading) ? loadNextChunk().then(loadAllChunks) : Promise.resolve();
+}
+
+// Exportações e ofícios precisam de todos os resultados: termina de carregar antes
+function whenAllLoaded(action) {
+    if (!pendingChunks.length && !chunkLoading) return false;
+    loadAllChunks().then(action);
+    return true;
+}
+
+// MODO AO VIVO - acrescenta resultados conforme a análise avança
+const liveStats = { total: 0, vpn: 0, mobile: 0, fixed: 0, countries: new Set(), providers: new Set() };
+
+function startLiveUpdates() {
+    let offset = 0;
+    const status = document.getElementById('live-status');
+    status.style.display = 'block';
+    status.innerHTML = '⏳ <strong>Análise em andamento</strong> - aguardando resultados...';
+
+    const poll = () => {
+        fetch(`${LIVE_SOURCE}?offset=${offset}`)
+            .then(response => response.json())
+            .then(data => {
+                offset = data.offset;
+                if (data.results.length) {
+                    appendResults(data.results);
+                    updateLiveStats(data.results);
+                }
+                if (data.done) {
+                    displaySessions(filteredResults);
+                    status.innerHTML = `✅ <strong>Análise concluída</strong> - ${allResults.length} resultados`;
+                } else {
+                    status.innerHTML = `⏳ <strong>Análise em andamento</strong> - ${allResults.length} resultados recebidos`;
+                    setTimeout(poll, 2000);
+                }
+            })
+            .catch(() => setTimeout(poll, 5000));
+    };
+    poll();
+}
+
+function appendResults(newResults) {
+    const offset = allResults.length;
+    mergeIntoTimeIndex(newResults, offset);
+    allResults.push(...newResults);
+    const filters = getActiveFilters();
+    const matching = newResults.filter(result => matchesFilters(result, filters));
+    if (filteredResults !== allResults) {
+        filteredResults.push(...matching);
+    }
+
+    addMapResults(newResults, matching, offset);
+    if (matching.length) {
+        document.getElementById('no-results').style.display = 'none';
+        document.getElementById('results-tbody').insertAdjacentHTML('beforeend', matching.map(renderResultRow).join(''));
+        matching.forEach(addToOficioGroups);
+    }
+
+    new Set(newResults.map(result => result.país)).forEach(country => addFilterOption('country-filter', country));
+    new Set(newResults.map(result => result.provedor)).forEach(provider => addFilterOption('provider-filter', provider));
+}
+
+function updateLiveStats(newResults) {
+    newResults.forEach(result => {
+        liveStats.total++;
+        if (result.status_vpn === 'Detectado') liveStats.vpn++;
+        if (result.conexão_móvel === 'Sim') liveStats.mobile++;
+        if (result.conexão_móvel === 'Não') liveStats.fixed++;
+        const country = result.país || 'Desconhecido';
+        const provider = result.provedor || 'Desconhecido';
+        if (country !== 'Erro na consulta') liveStats.countries.add(country);
+        if (provider !== 'Erro na consulta') liveStats.providers.add(provider);
+    });
+    document.getElementById('stat-total').textContent = liveStats.total;
+    document.getElementById('stat-vpn').textContent = liveStats.vpn;
+    document.getElementById('stat-mobile').textContent = liveStats.mobile;
+    document.getElementById('stat-fixed').textContent = liveStats.fixed;
+    document.getElementById('stat-countries').textContent = liveStats.countries.size;
+    document.getElementById('stat-providers').textContent = liveStats.providers.size;
+}
+
+function addFilterOption(selectId, value) {
+    if (!value || value === 'Erro na consulta') return;
+    const select = document.getElementById(selectId);
+    const options = Array.from(select.options).slice(1);
+    if (options.some(option => option.value === value)) return;
+    const option = document.createElement('option');
+    option.value = value;
+    option.textContent = value;
+    const next = options.find(existing => existing.value > value);
+    select.insertBefore(option, next || null);
+}
+
+// FUNÇÃO NOVA E ISOLADA - APENAS 6 COLUNAS
+function copiarApenas6Colunas() {
+    if (whenAllLoaded(copiarApenas6Colunas)) return;
+    console.log('Iniciando cópia das 6 colunas específicas...');
+    
+    // String que será copiada - começar do zero
+    let textoFinal = 'IP\tPorta\tData\tHora\tUTC\tAS\n';
+    
+    // Debug: verificar quantos resultados temos
+    console.log('Número de resultados filtrados:', filteredResults.length);
+    
+    // Processar cada resultado individualmente
+    for (let i = 0; i < filteredResults.length; i++) {
+        const item = filteredResults[i];
+        
+        // Extrair EXATAMENTE os 6 campos
+        const coluna1 = item.ip || '';
+        const coluna2 = item.porta || '-';
+        const coluna3 = item.data || '-';
+        const coluna4 = item.hora || '-';
+        const coluna5 = utcLabel(item) || '-';
+        const coluna6 = item.AS || 'N/A';
+        
+        // Montar linha com TAB entre cada coluna
+        const linha = coluna1 + '\t' + coluna2 + '\t' + coluna3 + '\t' + coluna4 + '\t' + coluna5 + '\t' + coluna6 + '\n';
+        
+        textoFinal += linha;
+        
+        // Debug: mostrar primeira linha
+        if (i === 0) {
+            console.log('Primeira linha:', linha);
+        }
+    }
+    
+    console.log('Texto final a ser copiado:', textoFinal.substring(0, 100) + '...');
+    
+    // Copiar para clipboard de forma mais robusta
+    if (navigator.clipboard) {
+        navigator.clipboard.writeText(textoFinal).then(() => {
+            console.log('Copiado com sucesso via navigator.clipboard');
+            mostrarMensagemSucesso('✅ APENAS 6 colunas copiadas! Cole no Word agora');
+        }).catch((erro) => {
+            console.log('Erro navigator.clipboard:', erro);
+            usarMetodoAlternativo(textoFinal);
+        });
+    } else {
+        usarMetodoAlternativo(textoFinal);
+    }
+}
+
+function usarMetodoAlternativo(texto) {
+    console.log('Usando método alternativo de cópia...');
+    
+    // Criar elemento textarea temporário
+    const elementoTemp = document.createElement('textarea');
+    elementoTemp.value = texto;
+    elementoTemp.style.position = 'fixed';
+    elementoTemp.style.left = '-9999px';
+    elementoTemp.style.top = '-9999px';
+    
+    document.body.appendChild(elementoTemp);
+    elementoTemp.focus();
+    elementoTemp.select();
+    
+    try {
+        const sucesso = document.execCommand('copy');
+        if (sucesso) {
+            console.log('Copiado com sucesso via execCommand');
+            mostrarMensagemSucesso('✅ APENAS 6 colunas copiadas! Cole no Word agora');
+        } else {
+            console.log('Falha no execCommand');
+            mostrarMensagemSucesso('❌ Erro ao copiar. Tente novamente.');
+        }
+    } catch (erro) {
+        console.log('Erro no execCommand:', erro);
+        mostrarMensagemSucesso('❌ Erro ao copiar. Tente novamente.');
+    }
+    
+    document.body.removeChild(elementoTemp);
+}
+
+function mostrarMensagemSucesso(mensagem) {
+    const elementoMensagem = document.getElementById('copy-success');
+    elementoMensagem.innerHTML = mensagem;
+    elementoMensagem.style.display = 'block';
+    
+    setTimeout(() => {
+        elementoMensagem.style.display = 'none';
+    }, 5000);
+}
+
+// MAPA - grupos de pontos pré-calculados na geração do relatório (MAP_CLUSTERS):
+// só os grupos do zoom atual dentro da área visível são desenhados. Com filtros ou
+// resultados recebidos ao vivo, as contagens são refeitas a partir da célula de
+// cada resultado, sem reler as coordenadas
+const MARKER_COLORS = ['#dc3545', '#ffc107', '#17a2b8', '#28a745'];
+const MARKER_LABELS = ['VPN/Proxy', 'Móvel', 'Indeterminado', 'Fixa'];
+const CLUSTER_STRIDE = 9;
+const CLUSTER_POPUP_LIMIT = 20;
+const pointCells = decodePointCells(MAP_CLUSTERS);
+const mapCells = { x: [], y: [], lat: [], lng: [], keys: null };
+let cellCounts = null;      // contagens por célula do conjunto exibido; null usa os níveis prontos
+let groupedLevels = {};
+let resultCells = null;
+let mapDrawPending = null;
+
+function decodePointCells(clusters) {
+    const bytes = Uint8Array.from(atob(clusters.pontos), character => character.charCodeAt(0));
+    return clusters.largura === 2 ? new Uint16Array(bytes.buffer) : new Uint32Array(bytes.buffer);
+}
+
+function initializeMap() {
+    map = L.map('map').setView([-15.7801, -47.9292], 2);
+    
+    L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+        attribution: '© OpenStreetMap contributors',
+        maxZoom: 18
+    }).addTo(map);
+
+    const finest = MAP_CLUSTERS.niveis[MAP_CLUSTERS.zoom];
+    for (let i = 0; i < finest.length; i += CLUSTER_STRIDE) {
+        mapCells.x.push(finest[i]);
+        mapCells.y.push(finest[i + 1]);
+        mapCells.lat.push(finest[i + 2]);
+        mapCells.lng.push(finest[i + 3]);
+    }
+    mapLayer = L.layerGroup().addTo(map);
+    map.on('moveend', scheduleMapDraw);
+    drawMap();
+}
+
+function markerCategory(result) {
+    if (result.status_vpn === 'Detectado') return 0;
+    if (result.tipo_conexão === 'Móvel') return 1;
+    if (result.status_vpn === 'Indeterminado' || result.tipo_conexão === 'Indeterminado') return 2;
+    return 3;
+}
+
+// Célula de um resultado: a calculada no relatório ou, para os recebidos ao vivo,
+// a mesma grade Web Mercator aplicada às coordenadas
+function cellOf(result, position) {
+    if (position < pointCells.length) return pointCells[position] - 1;
+    if (!result.latitude || !result.longitude) return -1;
+    const lat = Math.max(-85.0511287798, Math.min(85.0511287798, parseFloat(result.latitude)));
+    const lng = parseFloat(result.longitude);
+    if (isNaN(lat) || isNaN(lng)) return -1;
+    const scale = 2 ** (MAP_CLUSTERS.zoom + MAP_CLUSTERS.bits);
+    const sine = Math.sin(lat * Math.PI / 180);
+    const x = Math.min(scale - 1, Math.max(0, Math.floor((lng + 180) / 360 * scale)));
+    const y = Math.min(scale - 1, Math.max(0, Math.floor((0.5 - Math.log((1 + sine) / (1 - sine)) / (4 * Math.PI)) * scale)));
+    if (!mapCells.keys) {
+        mapCells.keys = new Map(mapCells.x.map((cellX, cell) => [`${cellX},${mapCells.y[cell]}`, cell]));
+    }
+    let cell = mapCells.keys.get(`${x},${y}`);
+    if (cell === undefined) {
+        cell = mapCells.x.length;
+        mapCells.keys.set(`${x},${y}`, cell);
+        mapCells.x.push(x);
+        mapCells.y.push(y);
+        mapCells.lat.push(lat);
+        mapCells.lng.push(lng);
+    }
+    return cell;
+}
+
+function registerCells(results, offset) {
+    if (!resultCells) return;
+    results.forEach((result, index) => resultCells.set(result, cellOf(result, offset + index)));
+}
+
+function cellFor(result) {
+    if (!resultCells) {
+        resultCells = new WeakMap();
+        registerCells(allResults, 0);
+    }
+    const cell = resultCells.get(result);
+    return cell === undefined ? -1 : cell;
+}
+
+function countCells(results) {
+    cellCounts = new Map();
+    addToCellCounts(results);
+}
+
+function addToCellCounts(results) {
+    results.forEach(result => {
+        const cell = cellFor(result);
+        if (cell < 0) return;
+        let counts = cellCounts.get(cell);
+        if (!counts) cellCounts.set(cell, counts = [0, 0, 0, 0]);
+        counts[markerCategory(result)]++;
+    });
+    groupedLevels = {};
+}
+
+function updateMapMarkers(results) {
+    // Todos os resultados cobertos pelo relatório: os níveis prontos bastam
+    if (results === allResults && allResults.length <= pointCells.length) {
+        cellCounts = null;
+    } else {
+        countCells(results);
+    }
+    drawMap();
+}
+
+function addMapResults(newResults, matching, offset) {
+    registerCells(newResults, offset);
+    if (cellCounts) {
+        addToCellCounts(matching);
+    } else if (allResults.length > pointCells.length) {
+        countCells(filteredResults);
+    } else {
+        return;
+    }
+    scheduleMapDraw();
+}
+
+function scheduleMapDraw() {
+    if (!mapDrawPending) mapDrawPending = setTimeout(drawMap, 100);
+}
+
+// Grupos de um nível a partir das contagens por célula (mesmo formato de MAP_CLUSTERS.niveis)
+function groupCells(zoom) {
+    if (groupedLevels[zoom]) return groupedLevels[zoom];
+    const shift = MAP_CLUSTERS.zoom - zoom;
+    const groups = new Map();
+    cellCounts.forEach((counts, cell) => {
+        const x = mapCells.x[cell] >> shift;
+        const y = mapCells.y[cell] >> shift;
+        const total = counts[0] + counts[1] + counts[2] + counts[3];
+        let group = groups.get(`${x},${y}`);
+        if (!group) groups.set(`${x},${y}`, group = [x, y, 0, 0, 0, 0, 0, 0, 0]);
+        group[2] += mapCells.lat[cell] * total;
+        group[3] += mapCells.lng[cell] * total;
+        group[4] += total;
+        counts.forEach((count, category) => { group[5 + category] += count; });
+    });
+    const rows = [];
+    groups.forEach(group => {
+        group[2] /= group[4];
+        group[3] /= group[4];
+        rows.push(...group);
+    });
+    return groupedLevels[zoom] = rows;
+}
+
+function drawMap() {
+    mapDrawPending = null;
+    mapLayer.clearLayers();
+    const zoom = Math.min(map.getZoom(), MAP_CLUSTERS.zoom);
+    const rows = cellCounts ? groupCells(zoom) : MAP_CLUSTERS.niveis[zoom];
+    const bounds = map.getBounds().pad(0.25);
+    for (let i = 0; i < rows.length; i += CLUSTER_STRIDE) {
+        if (bounds.contains([rows[i + 2], rows[i + 3]])) {
+            mapLayer.addLayer(clusterMarker(rows.slice(i, i + CLUSTER_STRIDE), zoom));
+        }
+    }
+}
+
+function clusterMarker(row, zoom) {
+    const [x, y, lat, lng, total] = row;
+    const counts = row.slice(5);
+    // A cor é a da categoria mais grave presente no grupo
+    const color = MARKER_COLORS[counts.findIndex(count => count > 0)];
+    const marker = L.circleMarker([lat, lng], {
+        color: color,
+        fillColor: color,
+        fillOpacity: total > 1 ? 0.6 : 0.8,
+        radius: total > 1 ? Math.min(30, 10 + 4 * Math.log10(total)) : 8,
+        weight: 2
+    });
+    if (total > 1) {
+        marker.bindTooltip(`<strong>${total} resultados</strong><br>` +
+            counts.map((count, category) => count ? `${MARKER_LABELS[category]}: ${count}` : '').filter(Boolean).join('<br>'),
+        );
+    }
+    marker.on('click', () => {
+        // Grupos com mais de um local se abrem aproximando o mapa; os demais mostram os resultados
+        const cells = clusterCells(x, y, zoom);
+        if (cells.size > 1) {
+            map.fitBounds(L.latLngBounds([...cells].map(cell => [mapCells.lat[cell], mapCells.lng[cell]])), { maxZoom: 18 });
+        } else if (!whenAllLoaded(() => openClusterPopup(marker, cells))) {
+            openClusterPopup(marker, cells);
+        }
+    });
+    return marker;
+}
+
+function clusterCells(x, y, zoom) {
+    const shift = MAP_CLUSTERS.zoom - zoom;
+    const cells = new Set();
+    mapCells.x.forEach((cellX, cell) => {
+        if (cellX >> shift === x && mapCells.y[cell] >> shift === y && (!cellCounts || cellCounts.has(cell))) cells.add(cell);
+    });
+    return cells;
+}
+
+function clusterMembers(cells) {
+    if (cellCounts) return filteredResults.filter(result => cells.has(cellFor(result)));
+    const members = [];
+    pointCells.forEach((cell, position) => {
+        if (cells.has(cell - 1)) members.push(allResults[position]);
+    });
+    return members;
+}
+
+function openClusterPopup(marker, cells) {
+    const members = clusterMembers(cells);
+    const content = members.length === 1 ? createPopupContent(members[0]) : `
+        <div class="popup-header">📍 ${members.length} RESULTADOS NESTE LOCAL</div>
+        <div class="popup-section">
+            ${members.slice(0, CLUSTER_POPUP_LIMIT).map(result => `
+                <div class="popup-value">
+                    <span style="color: ${MARKER_COLORS[markerCategory(result)]};">●</span>
+                    ${escapeHtml(result.ip)}${result.porta ? ':' + escapeHtml(result.porta) : ''} - ${escapeHtml(result.provedor || 'Desconhecido')}
+                </div>`).join('')}
+            ${members.length > CLUSTER_POPUP_LIMIT ? `<div class="popup-value">... e mais ${members.length - CLUSTER_POPUP_LIMIT}</div>` : ''}
+        </div>`;
+    marker.unbindPopup();
+    marker.bindPopup(content, { maxWidth: 400, className: 'custom-popup' }).openPopup();
+}
+
+function createPopupContent(result) {
+    const flagEmoji = getFlagEmoji(result.código_país);
+    const isSuspicious = result.status_vpn === 'Detectado' || 
+                       result.tor === 'Sim' || 
+                       result.hospedagem === 'Sim';
+    
+    return `
+        <div class="popup-header">
+            ${isSuspicious ? '⚠️ IP SUSPEITO' : '🔍 ANÁLISE DO IP'}
+        </div>
+        
+        <div class="popup-section">
+            <div class="popup-label">📍 Endereço IP:</div>
+            <div class="popup-value popup-ip">${escapeHtml(result.ip)}${result.porta ? ':' + escapeHtml(result.porta) : ''}</div>
+        </div>
+        
+        ${result.data || result.hora || utcLabel(result) ? `
+        <div class="popup-section">
+            <div class="popup-label">🕐 Data/Hora:</div>
+            <div class="popup-value">
+                ${result.data ? escapeHtml(result.data) + ' ' : ''}${result.hora ? 'às ' + escapeHtml(result.hora) + ' ' : ''}${utcLabel(result) ? '(' + escapeHtml(utcLabel(result)) + ')' : ''}
+            </div>
+        </div>
+        ` : ''}
+        
+        <div class="popup-section">
+            <div class="popup-label">🌍 Localização:</div>
+            <div class="popup-value popup-country">${flagEmoji} ${escapeHtml(result.país || 'Desconhecido')}</div>
+            ${result.cidade && result.cidade !== 'Desconhecido' ? `<div class="popup-value">📍 ${escapeHtml(result.cidade)}</div>` : ''}
+        </div>
+        
+        <div class="popup-section">
+            <div class="popup-label">🏢 Provedor de Internet:</div>
+            <div class="popup-value"><strong>${escapeHtml(result.provedor || 'Desconhecido')}</strong></div>
+            ${result.organização && result.organização !== result.provedor ? `<div class="popup-value" style="font-size: 0.8em; color: #888;">Org: ${escapeHtml(result.organização)}</div>` : ''}
+            ${result.inferido === 'Sim' ? `<div class="popup-value" style="font-size: 0.8em; color: #888;">Inferido de ${escapeHtml(result.inferido_de)} (bloco ${escapeHtml(result.bloco)})</div>` : ''}
+        </div>
+        
+        <div class="popup-section">
+            <div class="popup-label">🔒 Análise de Segurança:</div>
+            <div class="popup-value">
+                <strong>VPN/Proxy:</strong> <span class="${result.status_vpn === 'Detectado' ? 'popup-alert' : 'popup-safe'}">${escapeHtml(result.status_vpn || 'Indeterminado')}</span><br>
+                <strong>Tipo de Conexão:</strong> ${escapeHtml(result.tipo_conexão || 'Indeterminado')}<br>
+                ${result.tor === 'Sim' ? '<span class="popup-alert">🚨 <strong>Rede Tor Detectada!</strong></span><br>' : ''}
+                ${result.hospedagem === 'Sim' ? '<span class="popup-alert">🏢 <strong>Datacenter/Hospedagem</strong></span><br>' : ''}
+                ${result.conexão_móvel === 'Sim' ? '📱 <strong>Conexão Móvel</strong><br>' : ''}
+            </div>
+        </div>
+        
+        <div class="popup-section" style="border-bottom: none;">
+            <div class="popup-label">📊 Detalhes Técnicos:</div>
+            <div class="popup-value">
+                <strong>Versão IP:</strong> ${escapeHtml(result.ip_version)}<br>
+                <strong>AS Number:</strong> ${escapeHtml(result.AS || 'N/A')}<br>
+                ${result.ptr ? '<strong>PTR:</strong> ' + escapeHtml(result.ptr) + '<br>' : ''}
+                ${result.rdap_entidade ? '<strong>Titular (RDAP):</strong> ' + escapeHtml(result.rdap_entidade) + '<br>' : ''}
+                ${result.rdap_abuse ? '<strong>Abuse:</strong> ' + escapeHtml(result.rdap_abuse) + '<br>' : ''}
+                ${result.região && result.região !== 'Desconhecido' ? '<strong>Região:</strong> ' + escapeHtml(result.região) : ''}
+            </div>
+        </div>
+        
+        ${isSuspicious ? `
+        <div style="margin-top: 10px; padding: 8px; background: #f8d7da; border-radius: 5px; border-left: 4px solid #dc3545;">
+            <strong style="color: #721c24;">⚠️ Recomendação:</strong><br>
+            <span style="color: #721c24; font-size: 0.85em;">Este IP requer investigação adicional devido aos indicadores de risco detectados.</span>
+        </div>
+        ` : ''}
+    `;
+}
+
+// Valores vindos das APIs externas entram no HTML do popup sempre escapados
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, char => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[char]);
+}
+
+function getFlagEmoji(countryCode) {
+    const flags = {
+        'BR': '🇧🇷', 'US': '🇺🇸', 'CN': '🇨🇳', 'RU': '🇷🇺', 'DE': '🇩🇪',
+        'FR': '🇫🇷', 'GB': '🇬🇧', 'JP': '🇯🇵', 'KR': '🇰🇷', 'IN': '🇮🇳',
+        'CA': '🇨🇦', 'AU': '🇦🇺', 'IT': '🇮🇹', 'ES': '🇪🇸', 'NL': '🇳🇱',
+        'SE': '🇸🇪', 'NO': '🇳🇴', 'CH': '🇨🇭', 'SG': '🇸🇬', 'HK': '🇭🇰'
+    };
+    return flags[countryCode] || '🌍';
+}
+
+function populateFilters() {
+    populateCountryFilter();
+    populateProviderFilter();
+}
+
+// Filtros e botões de ofício vêm do resumo embutido, sem percorrer os resultados
+function populateCountryFilter() {
+    const countryFilter = document.getElementById('country-filter');
+    const countries = Object.keys(AGGREGATES.por_pais).sort();
+    countries.forEach(country => {
+        if (country && country !== 'Erro na consulta') {
+            const option = document.createElement('option');
+            option.value = country;
+            option.textContent = country;
+            countryFilter.appendChild(option);
+        }
+    });
+}
+
+function populateProviderFilter() {
+    const providerFilter = document.getElementById('provider-filter');
+    const providers = Object.keys(AGGREGATES.por_provedor).sort();
+    providers.forEach(provider => {
+        if (provider && provider !== 'Erro na consulta') {
+            const option = document.createElement('option');
+            option.value = provider;
+            option.textContent = provider;
+            providerFilter.appendChild(option);
+        }
+    });
+}
+
+function displayResults(results) {
+    const tbody = document.getElementById('results-tbody');
+    const noResults = document.getElementById('no-results');
+    
+    if (results.length === 0) {
+        tbody.innerHTML = '';
+        noResults.style.display = 'block';
+        return;
+    }
+    
+    noResults.style.display = 'none';
+    
+    tbody.innerHTML = results.map(renderResultRow).join('');
+}
+
+function renderResultRow(result) {
+    const vpnStatus = getVPNStatus(result);
+    const connectionStatus = getConnectionStatus(result);
+    
+    return `
+        <tr>
+            <td><span class="ip-version">${result.ip}</span></td>
+            <td>${result.porta || '-'}</td>
+            <td title="${result.data_hora_utc || ''}">${result.data || '-'}</td>
+            <td title="${result.data_hora_utc || ''}">${result.hora || '-'}</td>
+            <td>${utcLabel(result) || '-'}</td>
+            <td><span class="status-badge status-info">${result.ip_version}</span></td>
+            <td><span class="status-badge ${vpnStatus.class}">${vpnStatus.text}</span></td>
+            <td><span class="status-badge ${connectionStatus.class}">${connectionStatus.text}</span></td>
+            <td>${result.país || 'N/A'}</td>
+            <td>${result.cidade || 'N/A'}</td>
+            <td>${result.provedor || 'N/A'}${result.inferido === 'Sim' ? ` <span class="status-badge status-info" title="Resultado replicado de ${result.inferido_de} (bloco ${result.bloco})">inferido</span>` : ''}</td>
+            <td>${result.organização || 'N/A'}</td>
+            <td>${result.AS || 'N/A'}</td>
+        </tr>
+    `;
+}
+
+function getVPNStatus(result) {
+    if (result.status_vpn === 'Detectado') {
+        return { class: 'status-danger', text: 'Detectado' };
+    } else if (result.status_vpn === 'Não detectado') {
+        return { class: 'status-safe', text: 'Não detectado' };
+    } else {
+        return { class: 'status-warning', text: 'Indeterminado' };
+    }
+}
+
+function getConnectionStatus(result) {
+    if (result.tipo_conexão === 'Móvel') {
+        return { class: 'status-warning', text: 'Móvel' };
+    } else if (result.tipo_conexão === 'Fixa') {
+        return { class: 'status-safe', text: 'Fixa' };
+    } else {
+        return { class: 'status-info', text: 'Indeterminado' };
+    }
+}
+
+function parseUTCInput(id) {
+    const value = document.getElementById(id).value;
+    if (!value) return null;
+    const epoch = Date.parse(value + 'Z');
+    return isNaN(epoch) ? null : Math.floor(epoch / 1000);
+}
+
+function getActiveFilters() {
+    return {
+        vpn: document.getElementById('vpn-filter').value,
+        connection: document.getElementById('connection-filter').value,
+        country: document.getElementById('country-filter').value,
+        provider: document.getElementById('provider-filter').value,
+        searchIP: document.getElementById('search-ip').value.toLowerCase(),
+        timeFrom: parseUTCInput('time-from'),
+        timeTo: parseUTCInput('time-to')
+    };
+}
+
+function lowerBound(values, target) {
+    let low = 0, high = values.length;
+    while (low < high) {
+        const middle = (low + high) >> 1;
+        if (values[middle] < target) low = middle + 1; else high = middle;
+    }
+    return low;
+}
+
+function upperBound(values, target) {
+    let low = 0, high = values.length;
+    while (low < high) {
+        const middle = (low + high) >> 1;
+        if (values[middle] <= target) low = middle + 1; else high = middle;
+    }
+    return low;
+}
+
+// Posições (em ordem cronológica) dos resultados dentro da janela de tempo
+function timeWindow(start, end) {
+    const low = start === null ? 0 : lowerBound(TIME_INDEX.ts, start);
+    const high = end === null ? TIME_INDEX.ts.length : upperBound(TIME_INDEX.ts, end);
+    return TIME_INDEX.pos.slice(low, high);
+}
+
+// Acrescenta ao índice os resultados que começam na posição firstPosition (ordena o lote e intercala)
+function mergeIntoTimeIndex(results, firstPosition) {
+    const batch = [];
+    results.forEach((result, offset) => {
+        if (result.timestamp !== null && result.timestamp !== undefined) batch.push([result.timestamp, firstPosition + offset]);
+    });
+    if (!batch.length) return;
+    batch.sort((a, b) => a[0] - b[0] || a[1] - b[1]);
+    const ts = [], pos = [];
+    let i = 0, j = 0;
+    while (i < TIME_INDEX.ts.length || j < batch.length) {
+        if (j >= batch.length || (i < TIME_INDEX.ts.length && TIME_INDEX.ts[i] <= batch[j][0])) {
+            ts.push(TIME_INDEX.ts[i]);
+            pos.push(TIME_INDEX.pos[i++]);
+        } else {
+            ts.push(batch[j][0]);
+            pos.push(batch[j++][1]);
+        }
+    }
+    TIME_INDEX.ts = ts;
+    TIME_INDEX.pos = pos;
+}
+
+// SESSÕES - agrupadas no Python (campo sessao); aqui só se resume o que está filtrado
+function summarizeSessions(results) {
+    const sessions = new Map();
+    const key = result => (result.timestamp === null || result.timestamp === undefined) ? Infinity : result.timestamp;
+    results.forEach((result, position) => {
+        const id = (result.sessao !== undefined && result.sessao !== null) ? 's' + result.sessao : 'r' + position;
+        let session = sessions.get(id);
+        if (!session) {
+            session = { ip: result.ip, porta: result.porta, provedor: result.provedor, first: result, last: result, count: 0 };
+            sessions.set(id, session);
+        }
+        session.count++;
+        if (key(result) < key(session.first)) session.first = result;
+        if (key(result) > key(session.last)) session.last = result;
+    });
+    return [...sessions.values()].sort((a, b) => key(a.first) - key(b.first));
+}
+
+// Fuso informado na entrada ou, sem ele, o fuso presumido na análise, sinalizado
+function utcLabel(result) {
+    if (result.utc && String(result.utc).trim() !== '') return result.utc;
+    return result.utc_presumido ? `${result.utc_presumido} presumido, fuso não informado` : '';
+}
+
+function describeMoment(result) {
+    const moment = [result.data, result.hora].filter(value => value && String(value).trim() !== '').join(' ');
+    return moment + (utcLabel(result) ? ` (${utcLabel(result)})` : '');
+}
+
+function describeSession(session) {
+    let linha = `IP: ${session.ip}`;
+    if (session.porta && String(session.porta).trim() !== '') {
+        linha += `, Porta: ${session.porta}`;
+    }
+    if (session.count === 1) {
+        const ip = session.first;
+        if (ip.data && ip.data.trim() !== '') {
+            linha += `, Data: ${ip.data}`;
+        }
+        if (ip.hora && ip.hora.trim() !== '') {
+            linha += `, Horário: ${ip.hora}`;
+        }
+        if (utcLabel(ip)) {
+            linha += ` (${utcLabel(ip)})`;
+        }
+    } else if (describeMoment(session.first)) {
+        linha += `, no período de ${describeMoment(session.first)} a ${describeMoment(session.last)} (${session.count} registros)`;
+    } else {
+        linha += ` (${session.count} registros)`;
+    }
+    return linha;
+}
+
+function displaySessions(results) {
+    document.getElementById('sessions-tbody').innerHTML = summarizeSessions(results).map(session => `
+        <tr>
+            <td><span class="ip-version">${escapeHtml(session.ip)}</span></td>
+            <td>${escapeHtml(session.porta || '-')}</td>
+            <td>${escapeHtml(describeMoment(session.first) || '-')}</td>
+            <td>${escapeHtml(describeMoment(session.last) || '-')}</td>
+            <td>${escapeHtml(session.count)}</td>
+            <td>${escapeHtml(session.provedor || 'N/A')}</td>
+        </tr>
+    `).join('');
+}
+
+function matchesFilters(result, filters) {
+    const matchVPN = !filters.vpn || result.status_vpn === filters.vpn;
+    const matchConnection = !filters.connection || result.tipo_conexão === filters.connection;
+    const matchCountry = !filters.country || result.país === filters.country;
+    const matchProvider = !filters.provider || result.provedor === filters.provider;
+    const matchIP = !filters.searchIP || (result.ip || '').toLowerCase().includes(filters.searchIP);
+    const hasTime = result.timestamp !== null && result.timestamp !== undefined;
+    const matchTime = (filters.timeFrom === null || (hasTime && result.timestamp >= filters.timeFrom)) &&
+                      (filters.timeTo === null || (hasTime && result.timestamp <= filters.timeTo));
+
+    return matchVPN && matchConnection && matchCountry && matchProvider && matchIP && matchTime;
+}
+
+function applyFilters() {
+    const filters = getActiveFilters();
+    // Com janela de tempo, só os resultados do índice temporal são examinados
+    const candidates = (filters.timeFrom !== null || filters.timeTo !== null)
+        ? timeWindow(filters.timeFrom, filters.timeTo).map(position => allResults[position])
+        : allResults;
+    filteredResults = candidates.filter(result => matchesFilters(result, filters));
+
+    displayResults(filteredResults);
+    displaySessions(filteredResults);
+    updateMapMarkers(filteredResults);
+    generateOficioButtons();
+}
+
+function clearFilters() {
+    document.getElementById('vpn-filter').value = '';
+    document.getElementById('connection-filter').value = '';
+    document.getElementById('country-filter').value = '';
+    document.getElementById('provider-filter').value = '';
+    document.getElementById('search-ip').value = '';
+    document.getElementById('time-from').value = '';
+    document.getElementById('time-to').value = '';
+    
+    filteredResults = allResults;
+    displayResults(allResults);
+    displaySessions(allResults);
+    updateMapMarkers(allResults);
+    generateOficioButtons();
+}
+
+function generateOficioButtons() {
+    document.getElementById('oficios-buttons').innerHTML = '';
+    oficioGroups = {};
+    // Sem filtros, todos os destinatários aparecem já na abertura, com o total do resumo
+    if (filteredResults === allResults) {
+        Object.entries(AGGREGATES.por_destinatario).forEach(([recipient, total]) => {
+            oficioGroup(recipient).total = total;
+        });
+    }
+    Object.values(oficioGroups).forEach(updateOficioButton);
+    filteredResults.forEach(addToOficioGroups);
+}
+
+// Variantes de grafia e provedores do mesmo cadastro (nome ou AS) geram um único ofício
+function oficioRecipient(provider) {
+    return PROVIDERS.grupos[provider] || provider;
+}
+
+function oficioGroup(provider) {
+    let group = oficioGroups[provider];
+    if (!group) {
+        const button = document.createElement('button');
+        button.className = 'btn btn-oficio';
+        group = oficioGroups[provider] = { ips: [], total: 0, button: button, provider: provider };
+        button.onclick = () => generateOficio(provider, group.ips);
+        document.getElementById('oficios-buttons').appendChild(button);
+    }
+    return group;
+}
+
+function updateOficioButton(group) {
+    group.button.textContent = `📄 Gerar Ofício - ${group.provider} (${Math.max(group.total, group.ips.length)} IPs)`;
+}
+
+function addToOficioGroups(result) {
+    const provider = result.provedor || 'Provedor Desconhecido';
+    if (provider === 'Erro na consulta') return;
+
+    const group = oficioGroup(oficioRecipient(provider));
+    group.ips.push(result);
+    updateOficioButton(group);
+}
+
+function generateOficio(provider, ips) {
+    if (whenAllLoaded(() => generateOficio(provider, ips))) return;
+    const tipoProcedimento = document.getElementById('tipo-procedimento').value || '[TIPO DE PROCEDIMENTO]';
+    const numeroProcedimento = document.getElementById('numero-procedimento').value || '[NÚMERO DO PROCEDIMENTO]';
+    const prazo = document.getElementById('prazo-resposta').value || '[PRAZO]';
+    const email = document.getElementById('email-resposta').value || '[EMAIL DE RESPOSTA]';
+
+    // Uma linha por sessão em vez de uma por registro
+    let ipsText = '';
+    summarizeSessions(ips).forEach((session, index) => {
+        ipsText += `${index + 1}. ${describeSession(session)}\n`;
+    });
+
+    // Contato do cadastro de provedores; sem ele, titular e contato de abuse do bloco (RDAP)
+    const contato = PROVIDERS.contatos[provider];
+    const registro = ips.find(result => result.rdap_entidade || result.rdap_abuse);
+    let destinatario = '';
+    if (contato) {
+        destinatario = `Destinatário: ${[provider, contato.contato, contato.endereco, contato.email].filter(Boolean).join(' - ')}
+
+`;
+    } else if (registro) {
+        destinatario = `Destinatário (RDAP): ${registro.rdap_entidade || provider}${registro.rdap_abuse ? ' - ' + registro.rdap_abuse : ''}
+
+`;
+    }
+
+    const oficioText = `${destinatario}Senhor Diretor da ${provider},
+
+Visando instruir o ${tipoProcedimento} nº ${numeroProcedimento}, na qualidade de Delegado(a) de Polícia Civil, no exercício das atribuições que me conferem os art. 144, § 4º, da CF c/c art. 2º, §2º, da Lei 12.830/2013, e com fundamento nos arts. 10, §3º e 15, da Lei 12.965/2014 c/c art. 17-B da Lei 9.613/98 e art. 15 da Lei 12.850/2013, requisito, no prazo de ${prazo}, os dados cadastrais vinculados ao(s) IP(s):
+
+${ipsText}
+Adicionalmente, requisito, com base no art. 15, § 1º, da Lei nº 12.965/2014, a preservação do conteúdo das comunicações privadas e de todos os registros de conexão e de acesso a aplicações de internet relacionados ao(s) identificador(es) acima mencionado(s), pelo período de 1 (um) ano, a partir da data desta comunicação, a fim de viabilizar futura ordem judicial para acesso ao seu conteúdo.
+
+A investigação policial é sigilosa (art. 20 CPP) e, por isso, o usuário não deve ser notificado acerca das requisições policiais.
+
+Por fim, solicito que a resposta seja encaminhada para o e-mail ${email}.
+
+Atenciosamente,`;
+
+    document.getElementById('oficio-text').textContent = oficioText;
+    document.getElementById('oficio-generated').style.display = 'block';
+    currentOficio = oficioText;
+
+    document.getElementById('oficio-generated').scrollIntoView({ behavior: 'smooth' });
+}
+
+function copyOficioToClipboard() {
+    navigator.clipboard.writeText(currentOficio).then(function() {
+        const successMsg = document.getElementById('copy-success');
+        successMsg.innerHTML = '✅ Ofício copiado com sucesso!';
+        successMsg.style.display = 'block';
+        setTimeout(() => {
+            successMsg.style.display = 'none';
+        }, 3000);
+    });
+}
+
+function downloadOficio() {
+    const provider = 'Oficio_' + new Date().toISOString().slice(0,10);
+    const filename = `${provider}.txt`;
+    downloadFile(currentOficio, filename, 'text/plain');
+}
+
+function copyTableToClipboard() {
+    if (whenAllLoaded(copyTableToClipboard)) return;
+    let htmlTable = `
+    <table border="1" style="border-collapse: collapse; width: 100%; font-family: Arial, sans-serif;">
+        <thead>
+            <tr style="background-color: #667eea; color: white;">
+                <th style="padding: 8px; text-align: left;">IP</th>
+                <th style="padding: 8px; text-align: left;">Porta</th>
+                <th style="padding: 8px; text-align: left;">Data</th>
+                <th style="padding: 8px; text-align: left;">Hora</th>
+                <th style="padding: 8px; text-align: left;">UTC</th>
+                <th style="padding: 8px; text-align: left;">Versão</th>
+                <th style="padding: 8px; text-align: left;">VPN/Proxy</th>
+                <th style="padding: 8px; text-align: left;">Tipo Conexão</th>
+                <th style="padding: 8px; text-align: left;">País</th>
+                <th style="padding: 8px; text-align: left;">Cidade</th>
+                <th style="padding: 8px; text-align: left;">Provedor</th>
+                <th style="padding: 8px; text-align: left;">Organização</th>
+                <th style="padding: 8px; text-align: left;">AS</th>
+            </tr>
+        </thead>
+        <tbody>`;
+    
+    filteredResults.forEach((result, index) => {
+        const vpnText = result.status_vpn || 'N/A';
+        const connectionText = result.tipo_conexão || 'N/A';
+        const rowStyle = index % 2 === 0 ? 'background-color: #f8f9fa;' : 'background-color: white;';
+        
+        htmlTable += `
+            <tr style="${rowStyle}">
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.ip}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.porta || '-'}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.data || '-'}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.hora || '-'}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${utcLabel(result) || '-'}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.ip_version}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${vpnText}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${connectionText}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.país || 'N/A'}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.cidade || 'N/A'}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.provedor || 'N/A'}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.organização || 'N/A'}</td>
+                <td style="padding: 6px; border: 1px solid #ddd;">${result.AS || 'N/A'}</td>
+            </tr>`;
+    });
+    
+    htmlTable += `
+        </tbody>
+    </table>`;
+
+    const blob = new Blob([htmlTable], { type: 'text/html' });
+    const clipboardItem = new ClipboardItem({ 'text/html': blob });
+    
+    navigator.clipboard.write([clipboardItem]).then(function() {
+        const successMsg = document.getElementById('copy-success');
+        successMsg.innerHTML = '✅ Tabela copiada como HTML! Cole no Word para obter formatação perfeita';
+        successMsg.style.display = 'block';
+        setTimeout(() => {
+            successMsg.style.display = 'none';
+        }, 4000);
+    }).catch(function(err) {
+        let tableText = 'IP\tPorta\tData\tHora\tUTC\tVersão\tVPN/Proxy\tTipo Conexão\tPaís\tCidade\tProvedor\tOrganização\tAS\n';
+        
+        filteredResults.forEach(result => {
+            const vpnText = result.status_vpn || 'N/A';
+            const connectionText = result.tipo_conexão || 'N/A';
+            
+            tableText += `${result.ip}\t${result.porta || '-'}\t${result.data || '-'}\t${result.hora || '-'}\t${utcLabel(result) || '-'}\t${result.ip_version}\t${vpnText}\t${connectionText}\t${result.país || 'N/A'}\t${result.cidade || 'N/A'}\t${result.provedor || 'N/A'}\t${result.organização || 'N/A'}\t${result.AS || 'N/A'}\n`;
+        });
+
+        const textArea = document.createElement('textarea');
+        textArea.value = tableText;
+        document.body.appendChild(textArea);
+        textArea.select();
+        document.execCommand('copy');
+        document.body.removeChild(textArea);
+        
+        const successMsg = document.getElementById('copy-success');
+        successMsg.innerHTML = '✅ Tabela copiada! No Word: Cole > Inserir > Tabela > Converter texto em tabela';
+        successMsg.style.display = 'block';
+        setTimeout(() => {
+            successMsg.style.display = 'none';
+        }, 5000);
+    });
+}
+
+function exportToCSV() {
+    if (whenAllLoaded(exportToCSV)) return;
+    const headers = ['IP', 'Porta', 'Data', 'Hora', 'UTC', 'Versão', 'VPN_Proxy', 'Tipo_Conexão', 'País', 'Cidade', 'Provedor', 'Organização', 'AS'];
+    
+    let csvContent = headers.join(',') + '\n';
+    
+    filteredResults.forEach(result => {
+        const row = [
+            result.ip,
+            result.porta || '',
+            result.data || '',
+            result.hora || '',
+            utcLabel(result),
+            result.ip_version,
+            `"${result.status_vpn}"`,
+            `"${result.tipo_conexão}"`,
+            `"${result.país}"`,
+            `"${result.cidade}"`,
+            `"${result.provedor}"`,
+            `"${result.organização}"`,
+            `"${result.AS}"`
+        ];
+        csvContent += row.join(',') + '\n';
+    });
+
+    downloadFile(csvContent, 'analise_ips_filtrada.csv', 'text/csv');
+}
+
+function exportToJSON() {
+    if (whenAllLoaded(exportToJSON)) return;
+    const jsonData = JSON.stringify(filteredResults, null, 2);
+    downloadFile(jsonData, 'analise_ips_filtrada.json', 'application/json');
+}
+
+function downloadFile(content, fileName, contentType) {
+    const blob = new Blob([content], { type: contentType });
+    const url = window.URL.createObjectURL(blob);
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = fileName;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    window.URL.revokeObjectURL(url);
+}
+
+document.getElementById('search-ip').addEventListener('input', function() {
+    applyFilters();
+});
+
+window.addEventListener('resize', function() {
+    setTimeout(function() {
+        map.invalidateSize();
+    }, 100);
+});
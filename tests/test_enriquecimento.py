@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Testes do enriquecimento (PTR e RDAP) contra servidores DNS e RDAP locais
+
+Os servidores de teste rodam em threads neste processo e respondem só o que
+está em seus dicionários: nomes desconhecidos dão NXDOMAIN (DNS) ou 404
+(RDAP), e os nomes/IPs em SILENCIOSOS nunca respondem (timeout).
+"""
+
+import importlib.util
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'buscadeprovedoresv1.1.py')
+spec = importlib.util.spec_from_file_location('buscadeprovedores', SCRIPT)
+bp = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bp)
+
+PTR = {'10.2.0.192.in-addr.arpa': 'cliente-10.exemplo.test'}
+PTR_SILENCIOSOS = {'99.2.0.192.in-addr.arpa'}
+
+RDAP = {
+    '192.0.2.10': {
+        'startAddress': '192.0.2.0', 'endAddress': '192.0.2.255', 'name': 'EXEMPLO-NET',
+        'cidr0_cidrs': [{'v4prefix': '192.0.2.0', 'length': 24}],
+        'entities': [
+            {'roles': ['registrant'], 'vcardArray': ['vcard', [['fn', {}, 'text', 'Exemplo Telecom']]],
+             'entities': [{'roles': ['abuse'], 'vcardArray': ['vcard', [['email', {}, 'text', 'abuse@exemplo.test']]]}]},
+        ],
+    },
+}
+RDAP_SILENCIOSOS = {'198.51.100.7'}
+RDAP_ESPERA = 1.0
+
+def _dns_name(name):
+    return b''.join(bytes([len(label)]) + label.encode('ascii') for label in name.split('.')) + b'\0'
+
+class DNSHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        query, sock = self.request
+        query_id = struct.unpack('>H', query[:2])[0]
+        labels, offset = [], 12
+        while query[offset]:
+            labels.append(query[offset + 1:offset + 1 + query[offset]].decode('ascii'))
+            offset += 1 + query[offset]
+        name = '.'.join(labels)
+        if name in PTR_SILENCIOSOS:
+            return
+        question = query[12:offset + 5]
+        if name in PTR:
+            target = _dns_name(PTR[name])
+            answer = b'\xc0\x0c' + struct.pack('>HHIH', 12, 1, 60, len(target)) + target
+            header = struct.pack('>HHHHHH', query_id, 0x8180, 1, 1, 0, 0)
+        else:
+            answer = b''
+            header = struct.pack('>HHHHHH', query_id, 0x8183, 1, 0, 0, 0)
+        sock.sendto(header + question + answer, self.client_address)
+
+class RDAPHandler(BaseHTTPRequestHandler):
+    consultas = []
+
+    def do_GET(self):
+        ip_address = self.path.rsplit('/', 1)[-1]
+        self.consultas.append(ip_address)
+        if ip_address in RDAP_SILENCIOSOS:
+            time.sleep(RDAP_ESPERA)
+        body = json.dumps(RDAP[ip_address]).encode() if ip_address in RDAP else b'{}'
+        self.send_response(200 if ip_address in RDAP else 404)
+        self.send_header('Content-Type', 'application/rdap+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+class EnrichmentTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dns = socketserver.ThreadingUDPServer(('127.0.0.1', 0), DNSHandler)
+        cls.rdap = ThreadingHTTPServer(('127.0.0.1', 0), RDAPHandler)
+        cls.rdap.daemon_threads = True
+        for server in (cls.dns, cls.rdap):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        cls.dns_server = cls.dns.server_address
+        cls.rdap_url = 'http://127.0.0.1:%d' % cls.rdap.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in (cls.dns, cls.rdap):
+            server.shutdown()
+            server.server_close()
+
+    def setUp(self):
+        RDAPHandler.consultas = []
+
+    def enricher(self):
+        return bp.Enricher(self.rdap_url, self.dns_server, workers=2, rdap_interval=0,
+                           ptr_timeout=0.3, rdap_timeout=0.3)
+
+    def enrich(self, enricher, ip_address):
+        return enricher.submit(ip_address, 'IPv4').result(timeout=5)
+
+    def test_ptr_encontrado(self):
+        self.assertEqual(bp.query_ptr('192.0.2.10', self.dns_server, 1), 'cliente-10.exemplo.test')
+
+    def test_ptr_nxdomain(self):
+        self.assertIsNone(bp.query_ptr('192.0.2.11', self.dns_server, 1))
+
+    def test_ptr_timeout(self):
+        with self.assertRaises(OSError):
+            bp.query_ptr('192.0.2.99', self.dns_server, 0.3)
+
+    def test_enriquecimento_completo_e_cache_por_bloco(self):
+        enricher = self.enricher()
+        fields = self.enrich(enricher, '192.0.2.10')
+        self.assertEqual(fields, {
+            'ptr': 'cliente-10.exemplo.test',
+            'rdap_bloco': '192.0.2.0/24',
+            'rdap_rede': 'EXEMPLO-NET',
+            'rdap_entidade': 'Exemplo Telecom',
+            'rdap_abuse': 'abuse@exemplo.test',
+        })
+        # Outro IP do mesmo bloco: sem PTR (NXDOMAIN) e RDAP vindo do cache
+        fields = self.enrich(enricher, '192.0.2.11')
+        self.assertNotIn('ptr', fields)
+        self.assertNotIn('erro_ptr', fields)
+        self.assertEqual(fields['rdap_entidade'], 'Exemplo Telecom')
+        self.assertEqual(RDAPHandler.consultas, ['192.0.2.10'])
+
+    def test_rdap_sem_registro(self):
+        fields = self.enrich(self.enricher(), '203.0.113.5')
+        self.assertEqual(fields, {})
+        self.assertEqual(RDAPHandler.consultas, ['203.0.113.5'])
+
+    def test_timeouts_viram_erros_no_resultado(self):
+        fields = self.enrich(self.enricher(), '192.0.2.99')
+        self.assertIn('erro_ptr', fields)
+        fields = self.enrich(self.enricher(), '198.51.100.7')
+        self.assertIn('erro_rdap', fields)
+        self.assertNotIn('rdap_entidade', fields)
+
+if __name__ == '__main__':
+    unittest.main()